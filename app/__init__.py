@@ -2,12 +2,33 @@ import os
 
 from flask import Flask
 
+from .assets import init_assets
+from .commands import register_commands
 from .db import init_db
+from .maintenance import init_scheduler
+from .metrics import init_metrics
 from .routes import bp as main_bp
+from .snapshots import SNAPSHOT_READS, init_refresher, init_snapshots
 
-def create_app():
+def create_app(background=True):
+    """Build the app; background=False leaves out the scheduler and snapshot refresher."""
     app = Flask(__name__)
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-secret-key")
     init_db()
     app.register_blueprint(main_bp)
+    init_assets(app)
+    init_metrics(app)
+    register_commands(app)
+    if SNAPSHOT_READS:
+        init_snapshots(app)
+
+    # Optional background maintenance; `flask maintenance` runs it on demand
+    interval_hours = os.environ.get("MAINTENANCE_INTERVAL_HOURS")
+    if background and interval_hours:
+        init_scheduler(app, float(interval_hours) * 3600)
+
+    # Optional snapshot refresh for read-only replica mode; `flask snapshot` takes one on demand
+    snapshot_interval = os.environ.get("SNAPSHOT_INTERVAL")
+    if background and snapshot_interval:
+        init_refresher(app, float(snapshot_interval))
     return app
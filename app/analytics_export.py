@@ -0,0 +1,243 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+from . import db
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # optional: `flask export-parquet` needs pyarrow
+    pa = None
+
+# `flask export-parquet` writes a columnar snapshot for offline analysis:
+# citations/month=YYYY-MM/part-0.parquet holds the citation fact table joined
+# with its book, person, type and nationality, partitioned by the month the
+# citation was last updated; the dimension tables sit next to it. Only
+# partitions whose rows changed since the previous export are rewritten.
+STATE_FILE = "_export_state.json"
+BATCH_SIZE = 10_000
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_MONTH = "COALESCE(strftime('%Y-%m', c.updated_at), 'unknown')"
+
+# A partition is rewritten when any of these change: inserts and deletes move
+# the count and id sum, edits move the newest timestamp of a joined row. Person
+# types and nationalities have no timestamps, so their latest change_log entry
+# stands in for one
+_PARTITION_SIGNATURES = f"""
+    WITH type_changes AS (
+        SELECT row_id, MAX(seq) AS seq FROM change_log WHERE table_name = 'person_types' GROUP BY row_id
+    ), nationality_changes AS (
+        SELECT row_id, MAX(seq) AS seq FROM change_log WHERE table_name = 'nationalities' GROUP BY row_id
+    )
+    SELECT {_MONTH}, COUNT(*), TOTAL(c.id), MAX(c.updated_at), MAX(p.updated_at), MAX(b.updated_at),
+           MAX(tc.seq), MAX(nc.seq)
+    FROM citations c
+    JOIN people p ON p.id = c.person_id
+    JOIN books b ON b.id = c.book_id
+    LEFT JOIN type_changes tc ON tc.row_id = p.type_id
+    LEFT JOIN nationality_changes nc ON nc.row_id = p.nationality_id
+    GROUP BY 1
+"""
+
+_CITATION_FACTS = f"""
+    SELECT
+        {_MONTH},
+        c.id, c.page_number, c.indirect_citation, c.notes, c.created_at, c.updated_at,
+        b.id, b.title, b.publication_year, b.isbn, b.is_complete,
+        p.id, p.name, pt.name, n.name,
+        p.birth_year, p.birth_year_era,
+        CASE WHEN UPPER(p.birth_year_era) = 'BC' THEN 1 - p.birth_year ELSE p.birth_year END,
+        p.death_year, p.death_year_era,
+        CASE WHEN UPPER(p.death_year_era) = 'BC' THEN 1 - p.death_year ELSE p.death_year END
+    FROM citations c
+    JOIN people p ON p.id = c.person_id
+    JOIN books b ON b.id = c.book_id
+    LEFT JOIN person_types pt ON pt.id = p.type_id
+    LEFT JOIN nationalities n ON n.id = p.nationality_id
+    WHERE {_MONTH} IN (SELECT value FROM json_each(?))
+    ORDER BY 1, c.id
+"""
+
+DIMENSIONS = {
+    "books": "SELECT id, title, publication_year, isbn, is_complete, created_at, updated_at FROM books ORDER BY id",
+    "people": """
+        SELECT id, name, type_id, nationality_id, birth_year, birth_year_era, death_year, death_year_era,
+               wiki_url, created_at, updated_at
+        FROM people ORDER BY id
+    """,
+    "person_types": "SELECT id, name FROM person_types ORDER BY id",
+    "nationalities": "SELECT id, name FROM nationalities ORDER BY id",
+}
+
+
+def _schemas():
+    timestamp = pa.timestamp("s")
+    return {
+        "citations": pa.schema([
+            ("citation_id", pa.int64()), ("page_number", pa.string()), ("indirect_citation", pa.bool_()),
+            ("notes", pa.string()), ("created_at", timestamp), ("updated_at", timestamp),
+            ("book_id", pa.int64()), ("book_title", pa.string()), ("publication_year", pa.string()),
+            ("isbn", pa.string()), ("book_is_complete", pa.bool_()),
+            ("person_id", pa.int64()), ("person_name", pa.string()), ("person_type", pa.string()),
+            ("nationality", pa.string()),
+            ("birth_year", pa.int64()), ("birth_year_era", pa.string()), ("birth_year_ce", pa.int64()),
+            ("death_year", pa.int64()), ("death_year_era", pa.string()), ("death_year_ce", pa.int64()),
+        ]),
+        "books": pa.schema([
+            ("id", pa.int64()), ("title", pa.string()), ("publication_year", pa.string()),
+            ("isbn", pa.string()), ("is_complete", pa.bool_()),
+            ("created_at", timestamp), ("updated_at", timestamp),
+        ]),
+        "people": pa.schema([
+            ("id", pa.int64()), ("name", pa.string()), ("type_id", pa.int64()), ("nationality_id", pa.int64()),
+            ("birth_year", pa.int64()), ("birth_year_era", pa.string()),
+            ("death_year", pa.int64()), ("death_year_era", pa.string()),
+            ("wiki_url", pa.string()), ("created_at", timestamp), ("updated_at", timestamp),
+        ]),
+        "person_types": pa.schema([("id", pa.int64()), ("name", pa.string())]),
+        "nationalities": pa.schema([("id", pa.int64()), ("name", pa.string())]),
+    }
+
+
+def _column(values, field):
+    if pa.types.is_timestamp(field.type):
+        raw = pa.array(values, pa.string())
+        return pc.strptime(raw, format=TIMESTAMP_FORMAT, unit="s", error_is_null=True)
+    if pa.types.is_boolean(field.type):
+        return pa.array([None if value is None else bool(value) for value in values], pa.bool_())
+    if pa.types.is_integer(field.type):
+        # SQLite columns are loosely typed; anything that is not a whole number is dropped
+        return pa.array([value if isinstance(value, int) else None for value in values], field.type)
+    return pa.array([None if value is None else str(value) for value in values], field.type)
+
+
+def _record_batch(rows, schema):
+    columns = list(zip(*rows))
+    return pa.record_batch([_column(columns[i], field) for i, field in enumerate(schema)], schema=schema)
+
+
+class _PartitionWriter:
+    """Writes one Parquet file through a temporary name, replacing it on close."""
+
+    def __init__(self, path, schema):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.temporary = self.path.with_name(f".{self.path.name}.tmp")
+        self.writer = pq.ParquetWriter(self.temporary, schema, compression="zstd")
+        self.rows = 0
+
+    def write(self, batch):
+        self.writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.temporary, self.path)
+
+
+def _load_state(output_dir):
+    try:
+        return json.loads((output_dir / STATE_FILE).read_text())
+    except FileNotFoundError:
+        return {"partitions": {}}
+
+
+def _partition_dir(output_dir, month):
+    return output_dir / "citations" / f"month={month}"
+
+
+def _write_facts(cursor, output_dir, months, schema, progress):
+    written = {}
+    writer = None
+    current = None
+    cursor.execute(_CITATION_FACTS, (json.dumps(sorted(months)),))
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        # Rows arrive ordered by month; each month becomes one file
+        start = 0
+        while start < len(rows):
+            month = rows[start][0]
+            end = start
+            while end < len(rows) and rows[end][0] == month:
+                end += 1
+            if month != current:
+                if writer:
+                    writer.close()
+                    written[current] = writer.rows
+                writer = _PartitionWriter(_partition_dir(output_dir, month) / "part-0.parquet", schema)
+                current = month
+            writer.write(_record_batch([row[1:] for row in rows[start:end]], schema))
+            start = end
+        if progress:
+            progress("citations", sum(written.values()) + writer.rows)
+    if writer:
+        writer.close()
+        written[current] = writer.rows
+    return written
+
+
+def _write_dimension(cursor, output_dir, name, schema):
+    writer = _PartitionWriter(output_dir / f"{name}.parquet", schema)
+    cursor.execute(DIMENSIONS[name])
+    try:
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            writer.write(_record_batch(rows, schema))
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def export_parquet(output_dir, full=False, progress=None):
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed; run `pip install pyarrow` to export Parquet.")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    state = {"partitions": {}} if full else _load_state(output_dir)
+    schemas = _schemas()
+
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        # One read transaction: every file comes from the same snapshot, and
+        # in WAL mode writers carry on while the export runs
+        cursor.execute("BEGIN")
+        cursor.execute(_PARTITION_SIGNATURES)
+        signatures = {row[0]: list(row[1:]) for row in cursor.fetchall()}
+
+        dirty = {month for month, signature in signatures.items() if state["partitions"].get(month) != signature}
+        removed = set(state["partitions"]) - set(signatures)
+        if full and (output_dir / "citations").exists():
+            shutil.rmtree(output_dir / "citations")
+
+        written = _write_facts(cursor, output_dir, dirty, schemas["citations"], progress) if dirty else {}
+        dimensions = {
+            name: _write_dimension(cursor, output_dir, name, schemas[name])
+            for name in DIMENSIONS
+        }
+    finally:
+        conn.rollback()
+        conn.close()
+
+    for month in removed:
+        shutil.rmtree(_partition_dir(output_dir, month), ignore_errors=True)
+
+    state["partitions"] = signatures
+    temporary = output_dir / f".{STATE_FILE}.tmp"
+    temporary.write_text(json.dumps(state, indent=1, sort_keys=True))
+    os.replace(temporary, output_dir / STATE_FILE)
+    return {
+        "partitions": len(signatures),
+        "rewritten": written,
+        "removed": sorted(removed),
+        "dimensions": dimensions,
+    }
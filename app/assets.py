@@ -0,0 +1,146 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import shutil
+from io import BytesIO
+from pathlib import Path
+
+from flask import current_app, request, send_from_directory
+
+try:
+    from PIL import Image
+except ImportError:  # optional: images are copied unoptimized without Pillow
+    Image = None
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are written without brotli
+    brotli = None
+
+# `flask build-assets` copies app/static into app/static/dist under
+# content-hashed names, with images downsized and text assets precompressed.
+# Existing url_for('static', ...) calls are rewritten to the hashed copies,
+# which are served with far-future immutable caching.
+BUILD_DIR = "dist"
+MANIFEST = "manifest.json"
+# Twice the largest size an image is rendered at (the 400px home-page logo), for 2x displays
+IMAGE_MAX_SIZE = 800
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+COMPRESS_SUFFIXES = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map"}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_manifest_cache = {"mtime": None, "entries": {}}
+
+
+def _fingerprint(relative, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    path = Path(relative)
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+
+def _optimize_image(source):
+    if Image is None:
+        return source.read_bytes()
+
+    with Image.open(source) as image:
+        image.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE))
+        output = BytesIO()
+        if source.suffix.lower() == ".png":
+            image.save(output, "PNG", optimize=True)
+        else:
+            image.save(output, image.format, optimize=True, quality=85)
+    data = output.getvalue()
+    original = source.read_bytes()
+    return data if len(data) < len(original) else original
+
+
+def _write_compressed(target, data):
+    written = []
+    variants = [(".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", lambda: brotli.compress(data, quality=11)))
+    for suffix, compress in variants:
+        compressed = compress()
+        # Skip variants that do not pay for the extra header
+        if len(compressed) < len(data) * 0.9:
+            target.with_name(target.name + suffix).write_bytes(compressed)
+            written.append(suffix)
+    return written
+
+
+def build_assets(static_dir, clean=False, progress=None):
+    static_dir = Path(static_dir)
+    build_dir = static_dir / BUILD_DIR
+    # Earlier builds are kept by default so pages cached with the old names still load
+    if clean and build_dir.exists():
+        shutil.rmtree(build_dir)
+    build_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = {}
+    for source in sorted(static_dir.rglob("*")):
+        if not source.is_file() or build_dir in source.parents:
+            continue
+        relative = source.relative_to(static_dir).as_posix()
+        suffix = source.suffix.lower()
+        data = _optimize_image(source) if suffix in IMAGE_SUFFIXES else source.read_bytes()
+
+        hashed = _fingerprint(relative, data)
+        target = build_dir / hashed
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        variants = _write_compressed(target, data) if suffix in COMPRESS_SUFFIXES else []
+
+        manifest[relative] = hashed
+        if progress:
+            progress(relative, hashed, source.stat().st_size, len(data), variants)
+
+    (build_dir / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+def _manifest():
+    path = Path(current_app.static_folder) / BUILD_DIR / MANIFEST
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return {}
+    if _manifest_cache["mtime"] != mtime:
+        _manifest_cache["entries"] = json.loads(path.read_text())
+        _manifest_cache["mtime"] = mtime
+    return _manifest_cache["entries"]
+
+
+def _hashed_static_url(endpoint, values):
+    if endpoint != "static":
+        return
+    hashed = _manifest().get(values.get("filename"))
+    if hashed:
+        values["filename"] = f"{BUILD_DIR}/{hashed}"
+
+
+def _serve_built_asset(filename):
+    directory = Path(current_app.static_folder) / BUILD_DIR
+    accepted = request.accept_encodings
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if accepted[encoding] and (directory / (filename + suffix)).is_file():
+            response = send_from_directory(directory, filename + suffix, max_age=IMMUTABLE_MAX_AGE)
+            response.headers["Content-Encoding"] = encoding
+            response.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            break
+    else:
+        response = send_from_directory(directory, filename, max_age=IMMUTABLE_MAX_AGE)
+    response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_assets(app):
+    # url_for('static', filename=...) keeps working unchanged; when a build
+    # exists the filename is swapped for its fingerprinted copy
+    app.url_defaults(_hashed_static_url)
+    app.add_url_rule(
+        f"{app.static_url_path}/{BUILD_DIR}/<path:filename>",
+        endpoint="built_asset",
+        view_func=_serve_built_asset,
+    )
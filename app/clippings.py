@@ -0,0 +1,241 @@
+import re
+import unicodedata
+from collections import Counter
+from typing import NamedTuple, Optional
+
+from . import db
+
+# Importer for Kindle "My Clippings.txt" exports. The file is read one clipping
+# at a time, so memory depends on the catalogue, not on the size of the export.
+# Each highlight's book is matched to `books` by normalized title (and author
+# when titles collide); the people it mentions are found with one pass of an
+# Aho-Corasick automaton over the highlight's words. Matches are staged in
+# clipping_proposals for review instead of becoming citations directly.
+SEPARATOR = "=========="
+BATCH_SIZE = 1000
+EXCERPT_LENGTH = 500
+MIN_NAME_LENGTH = 3
+
+PAGE_PATTERN = re.compile(r"\bpage\s+([0-9ivxlcdm]+(?:-[0-9ivxlcdm]+)?)", re.IGNORECASE)
+LOCATION_PATTERN = re.compile(r"\b(?:location|loc\.)\s+(\d+(?:-\d+)?)", re.IGNORECASE)
+TITLE_PATTERN = re.compile(r"^(.*?)\s*\(([^()]*)\)\s*$")
+# Letters that NFKD does not split into a base letter and an accent
+FOLDED_LETTERS = str.maketrans({"ø": "o", "đ": "d", "ł": "l", "æ": "ae", "œ": "oe", "þ": "th", "ð": "d"})
+
+
+class Clipping(NamedTuple):
+    title: str
+    authors: tuple
+    kind: str
+    page: Optional[str]
+    location: Optional[str]
+    text: str
+
+
+def normalize(text):
+    # "Søren Kierkegaard" and "soren  KIERKEGAARD." -> "soren kierkegaard"
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold().translate(FOLDED_LETTERS)
+    return " ".join(re.split(r"[\W_]+", text)).strip()
+
+
+def _author_names(raw):
+    # "Plato; Jowett, Benjamin" -> ("plato", "benjamin jowett")
+    names = []
+    for part in re.split(r";|&|\band\b", raw):
+        if "," in part:
+            last, _, first = part.partition(",")
+            part = f"{first} {last}"
+        name = normalize(part)
+        if name:
+            names.append(name)
+    return tuple(names)
+
+
+def _parse(lines):
+    if len(lines) < 2:
+        return None
+    title, authors = lines[0].strip().lstrip("\ufeff"), ()
+    match = TITLE_PATTERN.match(title)
+    if match:
+        title, authors = match.group(1), _author_names(match.group(2))
+
+    meta = lines[1]
+    kind = next((k for k in ("highlight", "note", "bookmark") if k in meta.casefold()), "unknown")
+    page = PAGE_PATTERN.search(meta)
+    location = LOCATION_PATTERN.search(meta)
+    return Clipping(
+        title,
+        authors,
+        kind,
+        page.group(1) if page else None,
+        location.group(1) if location else None,
+        "\n".join(lines[2:]).strip(),
+    )
+
+
+def iter_clippings(stream):
+    """Yield each Clipping in a "My Clippings.txt" text stream."""
+    lines = []
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if line.strip() == SEPARATOR:
+            clipping = _parse(lines)
+            if clipping:
+                yield clipping
+            lines = []
+        elif line.strip() or lines:
+            lines.append(line)
+    clipping = _parse(lines)
+    if clipping:
+        yield clipping
+
+
+class NameAutomaton:
+    """Aho-Corasick automaton over the words of people's names.
+
+    Working on words rather than characters keeps the automaton small and
+    means names only ever match whole words ("Plato" never in "Platonic")."""
+
+    def __init__(self, names):
+        self._goto = [{}]
+        self._outputs = [None]
+        for person_id, name in names:
+            words = normalize(name).split()
+            if len("".join(words)) < MIN_NAME_LENGTH:
+                continue
+            state = 0
+            for word in words:
+                following = self._goto[state].get(word)
+                if following is None:
+                    following = self._goto[state][word] = len(self._goto)
+                    self._goto.append({})
+                    self._outputs.append(None)
+                state = following
+            length, ids = self._outputs[state] or (len(words), [])
+            ids.append(person_id)
+            self._outputs[state] = (length, ids)
+
+        # Breadth-first failure links, plus a link to the nearest state on the
+        # failure chain that ends a name, so matching skips states that do not
+        self._fail = [0] * len(self._goto)
+        self._next_output = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for word, following in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(word, 0)
+                self._fail[following] = target
+                self._next_output[following] = target if self._outputs[target] else self._next_output[target]
+                queue.append(following)
+
+    def find(self, text):
+        """Return the ids of people named in text, preferring the longest names.
+
+        "Karl Marx" yields only Karl Marx even when "Marx" is a person too."""
+        matches = []
+        state = 0
+        for end, word in enumerate(normalize(text).split()):
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            found = state if self._outputs[state] else self._next_output[state]
+            while found:
+                length, ids = self._outputs[found]
+                matches.append((end - length + 1, end, ids))
+                found = self._next_output[found]
+
+        person_ids = set()
+        covered_until = -1
+        for start, end, ids in sorted(matches, key=lambda match: (match[0], match[0] - match[1])):
+            if end > covered_until:
+                person_ids.update(ids)
+                covered_until = end
+        return person_ids
+
+
+def _short_title(title):
+    # "The Republic: Books I-V (Penguin Classics)" -> "The Republic"
+    return re.split(r"[:(]", title)[0]
+
+
+class BookMatcher:
+    """Match clipping titles to catalogue books, remembering each title's result."""
+
+    def __init__(self, books):
+        self._titles, self._short_titles = {}, {}
+        for book in books:
+            if book.is_complete:
+                continue
+            entry = (book.id, {normalize(author.name) for author in book.authors})
+            self._titles.setdefault(normalize(book.title), []).append(entry)
+            self._short_titles.setdefault(normalize(_short_title(book.title)), []).append(entry)
+        self._seen = {}
+        # A book's own authors and translators are not proposed as cited in it
+        self.contributors = {
+            book.id: {person.person_id for person in book.authors + book.translators} for book in books
+        }
+
+    def match(self, clipping):
+        key = (clipping.title, clipping.authors)
+        if key not in self._seen:
+            self._seen[key] = self._match(clipping)
+        return self._seen[key]
+
+    def _match(self, clipping):
+        # Full titles first; Kindle titles often carry a subtitle or series the catalogue lacks
+        surnames = {author.split()[-1] for author in clipping.authors}
+        for index in (self._titles, self._short_titles):
+            for title in (clipping.title, _short_title(clipping.title)):
+                candidates = index.get(normalize(title) or None, [])
+                if len(candidates) > 1 and clipping.authors:
+                    candidates = [
+                        (book_id, authors) for book_id, authors in candidates
+                        if authors & set(clipping.authors) or {author.split()[-1] for author in authors} & surnames
+                    ]
+                if len(candidates) == 1:
+                    return candidates[0][0]
+        return None
+
+
+def _page_label(clipping):
+    if clipping.page:
+        return clipping.page
+    return f"loc. {clipping.location}" if clipping.location else None
+
+
+def import_clippings(stream, progress=None):
+    """Stage citation proposals for the highlights in a clippings export."""
+    automaton = NameAutomaton(db.get_person_names())
+    books = BookMatcher(db.get_books())
+    summary = {"clippings": 0, "highlights": 0, "matched": 0, "proposed": 0, "added": 0}
+    unmatched = Counter()
+
+    batch = []
+    for clipping in iter_clippings(stream):
+        summary["clippings"] += 1
+        label = _page_label(clipping)
+        if clipping.kind != "highlight" or not clipping.text or not label:
+            continue
+        summary["highlights"] += 1
+        book_id = books.match(clipping)
+        if book_id is None:
+            unmatched[clipping.title] += 1
+            continue
+        summary["matched"] += 1
+        excerpt = clipping.text[:EXCERPT_LENGTH]
+        for person_id in sorted(automaton.find(clipping.text) - books.contributors[book_id]):
+            batch.append((book_id, person_id, label, excerpt))
+        if len(batch) >= BATCH_SIZE:
+            summary["proposed"] += len(batch)
+            summary["added"] += db.add_clipping_proposals(batch)
+            batch = []
+            if progress:
+                progress(summary["clippings"])
+    if batch:
+        summary["proposed"] += len(batch)
+        summary["added"] += db.add_clipping_proposals(batch)
+    summary["unmatched_titles"] = unmatched.most_common()
+    return summary
@@ -0,0 +1,274 @@
+import csv
+import json
+import time
+
+import click
+from flask import current_app
+
+from . import analytics_export, assets, clippings, db, loadtest, maintenance, openlibrary_mirror, query_plans, similarity, snapshots, static_site, wikipedia_index
+
+
+def register_commands(app):
+    @app.cli.command("import-wikipedia")
+    @click.argument("dump_path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--index", "index_path", type=click.Path(dir_okay=False), default=None,
+                  help="Index file to build (defaults to instance/wikipedia_abstracts.sqlite3).")
+    def import_wikipedia(dump_path, index_path):
+        """Build the offline Wikipedia abstracts index from a local dump."""
+        def report(count):
+            if count % 100_000 == 0:
+                click.echo(f"{count:,} abstracts indexed...")
+
+        count = wikipedia_index.build_index(dump_path, index_path, progress=report)
+        click.echo(f"Indexed {count:,} abstracts.")
+
+    @app.cli.command("import-openlibrary")
+    @click.argument("dump_paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+    @click.option("--mirror", "mirror_path", type=click.Path(dir_okay=False), default=None,
+                  help="Mirror file to build (defaults to instance/openlibrary.sqlite3).")
+    @click.option("--restart", is_flag=True, help="Ignore saved progress and read each dump from the start.")
+    def import_openlibrary(dump_paths, mirror_path, restart):
+        """Import Open Library editions/works/authors dumps into the local mirror."""
+        for dump_path in dump_paths:
+            if restart:
+                openlibrary_mirror.reset_progress(dump_path, mirror_path)
+
+            def report(count):
+                if count % 100_000 == 0:
+                    click.echo(f"{count:,} records imported...")
+
+            count = openlibrary_mirror.import_dump(dump_path, mirror_path, progress=report)
+            click.echo(f"Imported {count:,} records from {dump_path}.")
+
+    @app.cli.command("loadtest")
+    @click.option("--target", default=None,
+                  help="Base URL of a running app. By default the app is served in-process on a scratch database.")
+    @click.option("--duration", default=30.0, show_default=True, help="Seconds to generate load.")
+    @click.option("--concurrency", default=16, show_default=True, help="Maximum actions in flight.")
+    @click.option("--rate", default=0.0, show_default=True,
+                  help="Actions started per second (open loop). 0 runs closed loop at full concurrency.")
+    @click.option("--mix", default=None,
+                  help="Scenario weights, e.g. browse=50,typeahead=25,preview=10,cite=10,lookup=5.")
+    @click.option("--seed", type=int, default=None, help="Random seed for a repeatable run.")
+    @click.option("--wikipedia-latency", default=0.1, show_default=True, help="Stub Wikipedia latency in seconds.")
+    @click.option("--wikipedia-error-rate", default=0.0, show_default=True, help="Fraction of stub Wikipedia calls that fail.")
+    @click.option("--openlibrary-latency", default=0.1, show_default=True, help="Stub Open Library latency in seconds.")
+    @click.option("--openlibrary-error-rate", default=0.0, show_default=True, help="Fraction of stub Open Library calls that fail.")
+    @click.option("--recordings", type=click.Path(exists=True, dir_okay=False), default=None,
+                  help="JSON file of recorded upstream responses for the stubs to replay.")
+    @click.option("--stub-port", default=0, show_default=True,
+                  help="Port for the Wikipedia stub (Open Library uses the next one). 0 picks free ports.")
+    @click.option("--books", default=200, show_default=True, help="Books to seed into the scratch database.")
+    @click.option("--people", default=500, show_default=True, help="People to seed into the scratch database.")
+    @click.option("--json", "as_json", is_flag=True, help="Print the report as JSON.")
+    def run_loadtest(target, duration, concurrency, rate, mix, seed, wikipedia_latency, wikipedia_error_rate,
+                     openlibrary_latency, openlibrary_error_rate, recordings, stub_port, books, people, as_json):
+        """Drive a traffic mix against the app with Wikipedia and Open Library stubbed out."""
+        try:
+            mix = loadtest.parse_mix(mix)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint="--mix")
+
+        stubs = loadtest.start_stubs(
+            wikipedia_latency, wikipedia_error_rate, openlibrary_latency, openlibrary_error_rate,
+            loadtest.load_recordings(recordings), stub_port
+        )
+        server = None
+        try:
+            if target:
+                wikipedia, openlibrary = stubs
+                click.echo("Start the target app with these settings so its lookups reach the stubs:", err=True)
+                click.echo(f"  WIKIPEDIA_REST_URL={wikipedia.url}/api/rest_v1", err=True)
+                click.echo(f"  OPENLIBRARY_URL={openlibrary.url}", err=True)
+                click.echo("Citation posts are written to the target's database.", err=True)
+                base_url = target
+            else:
+                loadtest.point_app_at_stubs(*stubs)
+                db_path = loadtest.use_scratch_database(books, people)
+                click.echo(f"Serving the app on a scratch database at {db_path}", err=True)
+                server, base_url = loadtest.serve_in_background(current_app._get_current_object())
+
+            results = loadtest.run(base_url, duration, concurrency, rate, mix, seed)
+        finally:
+            if server:
+                server.shutdown()
+            for stub in stubs:
+                stub.stop()
+
+        summary = results.summary()
+        if as_json:
+            click.echo(json.dumps(summary, indent=2))
+        else:
+            click.echo(loadtest.format_report(summary, stubs))
+
+    @app.cli.command("maintenance")
+    @click.option("--step", "steps", multiple=True, type=click.Choice(maintenance.STEPS),
+                  help="Run only these steps (repeatable). Defaults to all, in order.")
+    @click.option("--batch-size", default=maintenance.BATCH_SIZE, show_default=True,
+                  help="Orphan rows purged per write transaction.")
+    @click.option("--dry-run", is_flag=True, help="Only report orphaned rows.")
+    @click.option("--convert", is_flag=True,
+                  help="Let the vacuum step run the one full VACUUM that switches an older database to incremental auto_vacuum.")
+    def run_maintenance(steps, batch_size, dry_run, convert):
+        """Purge orphans, refresh planner statistics, reclaim space and check integrity."""
+        if dry_run:
+            for label, count in maintenance.find_orphans():
+                click.echo(f"{label}: {count}")
+            return
+
+        report = maintenance.run_maintenance(steps or maintenance.STEPS, batch_size, convert)
+        for entry in report:
+            detail = entry["detail"]
+            if isinstance(detail, dict):
+                detail = ", ".join(f"{label}: {count}" for label, count in detail.items()) or "none found"
+            click.echo(
+                f"{entry['step']:<9} {entry['seconds'] * 1000:>9.1f} ms {entry['bytes_reclaimed']:>12,} bytes reclaimed  {detail}"
+            )
+
+    @app.cli.command("build-assets")
+    @click.option("--clean", is_flag=True, help="Delete earlier builds first.")
+    def build_assets(clean):
+        """Fingerprint, optimize and precompress static files into static/dist."""
+        if assets.Image is None:
+            click.echo("Pillow is not installed; images are copied without optimization.", err=True)
+        if assets.brotli is None:
+            click.echo("brotli is not installed; only gzip variants are written.", err=True)
+
+        def report(name, hashed, original, built, variants):
+            extra = f" (+{', '.join(variants)})" if variants else ""
+            click.echo(f"{name} -> {hashed}: {original:,} -> {built:,} bytes{extra}")
+
+        manifest = assets.build_assets(app.static_folder, clean, progress=report)
+        click.echo(f"Built {len(manifest)} assets.")
+
+    @app.cli.command("export-site")
+    @click.argument("output_dir", type=click.Path(file_okay=False))
+    @click.option("--full", is_flag=True, help="Render every page, not just those whose rows changed.")
+    @click.option("--workers", type=int, default=None, help="Rendering processes. Defaults to the CPU count.")
+    def export_site(output_dir, full, workers):
+        """Render the catalogue into a static HTML site, re-rendering only changed pages."""
+        def report(done, total):
+            click.echo(f"\rRendered {done}/{total} pages", nl=False, err=True)
+
+        summary = static_site.export_site(app, output_dir, full, workers, progress=report)
+        click.echo(err=True)
+        click.echo(
+            f"Rendered {summary['rendered']} pages ({summary['written']} changed, "
+            f"{summary['removed']} removed); {summary['pages']} pages in the site, "
+            f"up to change {summary['seq']}."
+        )
+
+    @app.cli.command("export-parquet")
+    @click.argument("output_dir", type=click.Path(file_okay=False))
+    @click.option("--full", is_flag=True, help="Rewrite every partition, not just those that changed.")
+    def export_parquet(output_dir, full):
+        """Write the citation fact table and dimension tables to Parquet for offline analysis."""
+        if analytics_export.pa is None:
+            raise click.ClickException("pyarrow is not installed; run `pip install pyarrow` first.")
+
+        def report(table, rows):
+            click.echo(f"\r{table}: {rows:,} rows", nl=False, err=True)
+
+        summary = analytics_export.export_parquet(output_dir, full, progress=report)
+        if summary["rewritten"]:
+            click.echo(err=True)
+        for month, rows in sorted(summary["rewritten"].items()):
+            click.echo(f"citations/month={month}: {rows:,} rows")
+        for month in summary["removed"]:
+            click.echo(f"citations/month={month}: removed")
+        for name, rows in summary["dimensions"].items():
+            click.echo(f"{name}: {rows:,} rows")
+        click.echo(f"{len(summary['rewritten'])} of {summary['partitions']} citation partitions rewritten.")
+
+    @app.cli.command("merge-people")
+    @click.argument("report", type=click.File("r"))
+    def merge_people(report):
+        """Merge duplicate people listed as target_id,source_id rows in a CSV report."""
+        merges = {}
+        for row in csv.reader(report):
+            if not row or not row[0].strip().isdigit():
+                continue  # header or blank line
+            target_id, source_id = int(row[0]), int(row[1])
+            merges.setdefault(target_id, []).append(source_id)
+        try:
+            moved = db.merge_people(merges.items())
+        except db.MergeError as exc:
+            raise click.ClickException(str(exc))
+        click.echo(
+            f"Merged {moved['people']} people into {len(merges)}: moved {moved['citations']} citations, "
+            f"{moved['epigraphs']} epigraphs, {moved['book_contributors']} contributor rows and "
+            f"{moved['clipping_proposals']} highlight proposals."
+        )
+
+    @app.cli.command("refresh-similarities")
+    @click.option("--top-k", default=similarity.TOP_K, show_default=True, help="Neighbours stored per book.")
+    @click.option("--metric", type=click.Choice(similarity.METRICS), default="cosine", show_default=True)
+    @click.option("--full", is_flag=True, help="Recompute every book, not just those whose citations changed.")
+    def refresh_similarities(top_k, metric, full):
+        """Store the books that cite the most of the same people as each book."""
+        if similarity.np is None:
+            raise click.ClickException("numpy and scipy are not installed; run `pip install numpy scipy` first.")
+
+        def report(done, total):
+            click.echo(f"\rScored {done}/{total} books", nl=False, err=True)
+
+        summary = similarity.refresh(top_k, metric, full, progress=report)
+        if summary["books"]:
+            click.echo(err=True)
+        click.echo(
+            f"Recomputed {summary['books']} books ({summary['changed']} with changed citations), "
+            f"storing {summary['pairs']} neighbour pairs."
+        )
+
+    @app.cli.command("import-clippings")
+    @click.argument("clippings_path", type=click.Path(exists=True, dir_okay=False))
+    def import_clippings(clippings_path):
+        """Propose citations from a Kindle "My Clippings.txt" export, for review at /imports/clippings."""
+        def report(count):
+            click.echo(f"\r{count:,} clippings read", nl=False, err=True)
+
+        with open(clippings_path, encoding="utf-8-sig", errors="replace") as stream:
+            summary = clippings.import_clippings(stream, progress=report)
+        click.echo(err=True)
+        click.echo(
+            f"Read {summary['clippings']:,} clippings: {summary['matched']:,} of {summary['highlights']:,} highlights "
+            f"matched a book; {summary['added']:,} of {summary['proposed']:,} proposed citations are new."
+        )
+        for title, count in summary["unmatched_titles"]:
+            click.echo(f"No open book matched: {title} ({count} highlights)")
+
+    @app.cli.command("snapshot")
+    @click.option("--force", is_flag=True, help="Take a snapshot even if the database has not changed.")
+    @click.option("--every", type=float, default=None, help="Keep running, checking for changes every this many seconds.")
+    def take_snapshot(force, every):
+        """Publish a read-only snapshot of the database for SNAPSHOT_READS workers."""
+        while True:
+            taken = snapshots.take_snapshot(force)
+            if taken:
+                click.echo(f"Published {taken['file']}: {taken['bytes']:,} bytes in {taken['seconds']:.2f}s")
+            elif not every:
+                click.echo("The database has not changed since the current snapshot.")
+            if not every:
+                return
+            force = False
+            time.sleep(every)
+
+    @app.cli.command("check-query-plans")
+    @click.option("--verbose", is_flag=True, help="Print every statement's plan, not just the failing ones.")
+    def check_query_plans(verbose):
+        """Fail if a db.py query scans, sorts or builds an automatic index where it should use an index."""
+        path = query_plans.scratch_path()
+        click.echo(f"Populating {path}...", err=True)
+        query_plans.populate(path)
+        failed = 0
+        for check, statements in query_plans.run_checks():
+            bad = [statement for statement in statements if statement[2]]
+            failed += bool(bad)
+            click.echo(f"{'FAIL' if bad else 'ok  '}  {check.label} ({len(statements)} statements)")
+            for sql, plan, problems in statements if verbose else bad:
+                click.echo(f"      {sql}")
+                for detail in plan:
+                    click.echo(f"        {'!' if detail in problems else ' '} {detail}")
+        if failed:
+            raise click.ClickException(f"{failed} of {len(query_plans.CHECKS)} query plan checks failed.")
+        click.echo(f"All {len(query_plans.CHECKS)} query plan checks passed.")
@@ -1,11 +1,445 @@
+import contextvars
+import functools
+import json
 import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 from pathlib import Path
+from types import MappingProxyType
+
+from . import metrics
+from .rows import (
+    Book, BookCitation, BookDetail, BookEpigraph, Citation, CitationRecord, ClippingProposal, Contribution, Contributor,
+    Epigraph, EpigraphRecord, Person, PersonDetail, PersonEpigraph, SimilarBook,
+)
+from .rows import factory as row_factory
 
 DB_PATH = Path("instance/referent.sqlite3")
+BUSY_TIMEOUT = 30.0
+# Longest a write waits to start, for this process's queue and another worker
+# process's transaction together, before it gives up with WriteBusy
+WRITE_BUSY_TIMEOUT = 10.0
+# Most writes one group commit takes in before it commits
+GROUP_COMMIT_SIZE = 32
+STREAM_BATCH_SIZE = 500
+SNAPSHOT_MMAP_SIZE = 1 << 30
+
+# Set by snapshots.py for requests served from a read-only snapshot of the
+# database. Writes always go to the primary.
+_snapshot_path = contextvars.ContextVar("snapshot_path", default=None)
+
+# Mutations from every thread in this process queue up on one lock and run as
+# BEGIN IMMEDIATE transactions; other worker processes wait on SQLite's busy
+# timeout. Both waits share WRITE_BUSY_TIMEOUT, so a stuck writer elsewhere
+# fails each queued write on time instead of stacking their timeouts. In WAL
+# mode readers never block on the writer.
+#
+# Writes queued behind each other share one transaction (group commit): a
+# writer that finishes while others wait for the lock leaves the transaction
+# open, and the writer that finds the queue empty, or the GROUP_COMMIT_SIZE-th,
+# commits for all of them, paying for one fsync per batch. Each write runs in
+# its own savepoint, so one that raises rolls back alone, and none returns
+# before the commit that makes it durable.
+_write_lock = threading.Lock()
+_write_group = None
+_queued_writes = 0
+_queued_lock = threading.Lock()
+_write_stats_lock = threading.Lock()
+_write_stats = {
+    "transactions": 0,
+    "commits": 0,
+    "failures": 0,
+    "busy_timeouts": 0,
+    "lock_wait_seconds": 0.0,
+    "max_lock_wait_seconds": 0.0,
+    "hold_seconds": 0.0,
+    "max_hold_seconds": 0.0,
+}
+
+
+STATEMENT_KINDS = {"select", "insert", "update", "delete", "begin", "commit", "rollback", "pragma", "with", "script"}
+
+
+def _observe_statement(sql, started):
+    kind = sql.lstrip()[:8].split(None, 1)[0].lower() if sql.strip() else "other"
+    labels = (("kind", kind if kind in STATEMENT_KINDS else "other"),)
+    metrics.inc("referent_db_statements_total", labels)
+    metrics.observe("referent_db_statement_duration_seconds", labels, time.perf_counter() - started, metrics.DB_BUCKETS)
+
+
+# Set by query_plans.py while `flask check-query-plans` records every statement's plan
+_plan_observer = None
+
+
+class _Cursor(sqlite3.Cursor):
+    # Times each execute for /metrics; rows fetched later are not included
+    def execute(self, sql, parameters=()):
+        if _plan_observer:
+            _plan_observer(self.connection, sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _observe_statement(sql, started)
+
+    def executemany(self, sql, parameters):
+        if _plan_observer and isinstance(parameters, list) and parameters:
+            _plan_observer(self.connection, sql, parameters[0])
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            _observe_statement(sql, started)
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            _observe_statement("script", started)
+
+
+class _Connection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._counted_open = True
+        metrics.inc("referent_db_connections_opened_total")
+        metrics.add_gauge("referent_db_connections_open")
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def close(self):
+        super().close()
+        if getattr(self, "_counted_open", False):
+            self._counted_open = False
+            metrics.add_gauge("referent_db_connections_open", amount=-1)
+
+    def __del__(self):
+        # Connections left to the garbage collector are counted when collected.
+        # The collector may run while this thread holds the metrics lock, so nothing here locks.
+        if getattr(self, "_counted_open", False):
+            self._counted_open = False
+            metrics.add_gauge_deferred("referent_db_connections_open", amount=-1)
+
+
+def _primary_connection(check_same_thread=True):
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, factory=_Connection, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def _snapshot_connection(path):
+    # immutable=1: SQLite takes no locks and never checks the file for changes,
+    # which holds because a published snapshot is never written again. mode=ro
+    # fails on a pruned snapshot rather than creating an empty file in its place.
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro&immutable=1", uri=True, factory=_Connection)
+    conn.execute(f"PRAGMA mmap_size = {SNAPSHOT_MMAP_SIZE}")
+    return conn
 
 
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    path = _snapshot_path.get()
+    if path:
+        return _snapshot_connection(path)
+    return _primary_connection()
+
+
+def read_from_snapshot(path):
+    """Serve reads in the current context from the snapshot at path; None reads the primary."""
+    _snapshot_path.set(path)
+
+
+def snapshot_in_use():
+    return _snapshot_path.get()
+
+
+def _query_batches(query, params=(), row_type=None):
+    # Server-side cursor for the streamed list pages: rows come off SQLite in
+    # batches inside one read transaction, so every batch sees the same snapshot
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        if row_type:
+            cursor.row_factory = row_factory(row_type)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            yield conn, rows
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+class WriteBusy(sqlite3.OperationalError):
+    pass
+
+
+class _WriteGroup:
+    def __init__(self, conn):
+        self.conn = conn
+        self.writes = 0
+        self.committed = threading.Event()
+        self.error = None
+
+
+def _record_write(waited, held, busy, failed):
+    with _write_stats_lock:
+        _write_stats["transactions"] += 1
+        _write_stats["failures"] += int(failed)
+        _write_stats["busy_timeouts"] += int(busy)
+        _write_stats["lock_wait_seconds"] += waited
+        _write_stats["max_lock_wait_seconds"] = max(_write_stats["max_lock_wait_seconds"], waited)
+        _write_stats["hold_seconds"] += held
+        _write_stats["max_hold_seconds"] = max(_write_stats["max_hold_seconds"], held)
+
+
+def get_write_stats():
+    with _write_stats_lock:
+        stats = dict(_write_stats)
+    stats["in_flight"] = int(_write_lock.locked())
+    return stats
+
+
+def _queue_write(delta):
+    global _queued_writes
+    with _queued_lock:
+        _queued_writes += delta
+        return _queued_writes
+
+
+def _join_group(remaining):
+    # Called holding _write_lock
+    global _write_group
+    if _write_group is None:
+        # Later writes of the group run on other threads, always one at a time under _write_lock
+        conn = _primary_connection(check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {int(remaining * 1000)}")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as exc:
+            conn.close()
+            if "locked" not in str(exc) and "busy" not in str(exc):
+                raise
+            raise WriteBusy(f"Another process kept the database locked for more than {WRITE_BUSY_TIMEOUT:g}s.") from exc
+        _write_group = _WriteGroup(conn)
+    return _write_group
+
+
+def _commit_group():
+    # Called holding _write_lock
+    global _write_group
+    group, _write_group = _write_group, None
+    if group is None:
+        return
+    try:
+        group.conn.commit()
+    except Exception as exc:
+        group.error = exc
+        group.conn.rollback()
+    finally:
+        group.conn.close()
+        with _write_stats_lock:
+            _write_stats["commits"] += 1
+        group.committed.set()
+
+
+def _commit_if_idle():
+    # A writer that gave up waiting may be the one an open group was left for
+    if _write_lock.acquire(blocking=False):
+        try:
+            if _queue_write(0) == 0:
+                _commit_group()
+        finally:
+            _write_lock.release()
+
+
+@contextmanager
+def write_transaction():
+    requested = time.perf_counter()
+    _queue_write(1)
+    locked = _write_lock.acquire(timeout=WRITE_BUSY_TIMEOUT)
+    _queue_write(-1)
+    if not locked:
+        _record_write(time.perf_counter() - requested, 0.0, True, True)
+        _commit_if_idle()
+        raise WriteBusy(f"The database write queue did not clear within {WRITE_BUSY_TIMEOUT:g}s.")
+    acquired = time.perf_counter()
+    busy = False
+    failed = True
+    group = None
+    try:
+        try:
+            group = _join_group(max(WRITE_BUSY_TIMEOUT - (acquired - requested), 0.0))
+        except WriteBusy:
+            busy = True
+            raise
+        conn = group.conn
+        # Undo what an earlier write of the group may have set on the shared connection
+        conn.row_factory = None
+        conn.execute("SAVEPOINT write_transaction")
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK TO write_transaction")
+                conn.execute("RELEASE write_transaction")
+            else:
+                # Some errors make SQLite roll back the whole transaction, earlier writes included
+                group.error = sqlite3.OperationalError("An earlier write's error rolled back this write's transaction.")
+            raise
+        conn.execute("RELEASE write_transaction")
+        group.writes += 1
+        failed = False
+    finally:
+        held = time.perf_counter() - acquired
+        if group is not None and (group.error or _queue_write(0) == 0 or group.writes >= GROUP_COMMIT_SIZE):
+            _commit_group()
+        _write_lock.release()
+        if not failed:
+            group.committed.wait()
+            failed = group.error is not None
+        _record_write(acquired - requested, held, busy, failed)
+    if group.error is not None:
+        raise type(group.error)(*group.error.args) from group.error
+
+
+@contextmanager
+def exclusive_write():
+    """Hold this process's write lock without opening a transaction, for VACUUM and other pragmas that need one."""
+    requested = time.perf_counter()
+    with _write_lock:
+        _commit_group()
+        acquired = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            _record_write(acquired - requested, time.perf_counter() - acquired, False, failed)
+
+
+# ---------- READ CACHE ----------
+# Readers decorated with @cached("books", ...) keep their recent results in a
+# per-function LRU. Each result is stored with the latest change_log seq of the
+# tables it reads, taken before the query runs; triggers log every write, so a
+# write from any process moves the seq and the next call misses.
+CACHE_SIZE = 64
+
+_generation_readers = threading.local()
+_cache_registry = {}
+
+
+def _table_generations(tables):
+    snapshot = _snapshot_path.get()
+    if snapshot:
+        # A snapshot never changes, so results read from it stay valid while it is served
+        return (str(snapshot),)
+    reader = getattr(_generation_readers, "conn", None)
+    if reader is None or _generation_readers.path != DB_PATH:
+        reader = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, factory=_Connection)
+        _generation_readers.conn, _generation_readers.path = reader, DB_PATH
+    selects = ", ".join("(SELECT MAX(seq) FROM change_log WHERE table_name = ?)" for _ in tables)
+    return (str(DB_PATH),) + reader.execute(f"SELECT {selects}", tables).fetchone()
+
+
+def _freeze(value):
+    if isinstance(value, (list, set)):
+        return tuple(value)
+    return value
+
+
+def _frozen(value):
+    # Lists, dicts and rows nested in a cached result (a Book's authors, the
+    # statistics lists) become tuples and read-only mappings, so one caller
+    # cannot change what the next is handed
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        return value._make(_frozen(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(item) for item in value)
+    if isinstance(value, dict):
+        return MappingProxyType({key: _frozen(item) for key, item in value.items()})
+    return value
+
+
+def _store(value):
+    # The top level stays a list or dict; _copy hands each caller its own
+    if isinstance(value, list):
+        return [_frozen(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _frozen(item) for key, item in value.items()}
+    return _frozen(value)
+
+
+def _copy(value):
+    # Callers get their own top-level list or dict, so they cannot alter the cached one
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+def cached(*tables, maxsize=CACHE_SIZE):
+    def decorator(reader):
+        entries = OrderedDict()
+        lock = threading.Lock()
+        stats = _cache_registry[reader.__name__] = {"hits": 0, "misses": 0, "entries": entries, "maxsize": maxsize}
+
+        @functools.wraps(reader)
+        def wrapper(*args, **kwargs):
+            key = tuple(_freeze(arg) for arg in args) + tuple(sorted((k, _freeze(v)) for k, v in kwargs.items()))
+            generations = _table_generations(tables)
+            with lock:
+                entry = entries.get(key)
+                if entry is not None and entry[0] == generations:
+                    entries.move_to_end(key)
+                    stats["hits"] += 1
+                    metrics.cache_result(f"db.{reader.__name__}", True)
+                    return _copy(entry[1])
+                stats["misses"] += 1
+            metrics.cache_result(f"db.{reader.__name__}", False)
+
+            value = _store(reader(*args, **kwargs))
+            with lock:
+                entries[key] = (generations, value)
+                entries.move_to_end(key)
+                while len(entries) > maxsize:
+                    entries.popitem(last=False)
+            return _copy(value)
+
+        wrapper.cache_clear = entries.clear
+        return wrapper
+
+    return decorator
+
+
+def get_cache_stats():
+    stats = {}
+    for name, entry in sorted(_cache_registry.items()):
+        calls = entry["hits"] + entry["misses"]
+        stats[name] = {
+            "hits": entry["hits"],
+            "misses": entry["misses"],
+            "hit_rate": round(entry["hits"] / calls, 3) if calls else None,
+            "size": len(entry["entries"]),
+            "maxsize": entry["maxsize"],
+        }
+    return stats
 
 
 def _ensure_book_schema():
@@ -13,7 +447,7 @@ def _ensure_book_schema():
         cursor = conn.cursor()
         cursor.execute("PRAGMA table_info(books)")
         columns = {row[1] for row in cursor.fetchall()}
-        if "is_complete" not in columns:
+        if columns and "is_complete" not in columns:
             cursor.execute("ALTER TABLE books ADD COLUMN is_complete INTEGER NOT NULL DEFAULT 0")
             conn.commit()
 
@@ -23,6 +457,8 @@ def _ensure_person_schema():
         cursor = conn.cursor()
         cursor.execute("PRAGMA table_info(people)")
         columns = {row[1] for row in cursor.fetchall()}
+        if not columns:
+            return
         updates = []
         if "birth_year_era" not in columns:
             updates.append("ALTER TABLE people ADD COLUMN birth_year_era TEXT NOT NULL DEFAULT 'AD'")
@@ -34,16 +470,119 @@ def _ensure_person_schema():
             conn.commit()
 
 
+def _ensure_change_log_schema():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(change_log)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if columns and "old_values" not in columns:
+            cursor.execute("ALTER TABLE change_log ADD COLUMN old_values TEXT")
+            cursor.execute("ALTER TABLE change_log ADD COLUMN new_values TEXT")
+            conn.commit()
+
+
+# Same expression as the page_key column in schema.sql
+PAGE_KEY = "CASE WHEN TRIM(page_number) GLOB '[0-9]*' THEN CAST(TRIM(page_number) AS INTEGER) END"
+
+
+def _ensure_citation_schema():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        # table_xinfo, unlike table_info, also lists the generated page_key column
+        cursor.execute("PRAGMA table_xinfo(citations)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if not columns:
+            return
+        updates = []
+        if "notes" not in columns:
+            updates.append("ALTER TABLE citations ADD COLUMN notes TEXT")
+        if "indirect_citation" not in columns:
+            updates.append("ALTER TABLE citations ADD COLUMN indirect_citation INTEGER NOT NULL DEFAULT 0")
+        if "created_at" not in columns:
+            updates.append("ALTER TABLE citations ADD COLUMN created_at TEXT")
+        if "updated_at" not in columns:
+            updates.append("ALTER TABLE citations ADD COLUMN updated_at TEXT")
+        if "page_key" not in columns:
+            updates.append(f"ALTER TABLE citations ADD COLUMN page_key INTEGER GENERATED ALWAYS AS ({PAGE_KEY}) VIRTUAL")
+        if "book_title" not in columns:
+            # The old update triggers would log every backfilled row; schema.sql replaces them
+            updates += [
+                "ALTER TABLE citations ADD COLUMN book_title TEXT",
+                "DROP TRIGGER IF EXISTS citations_log_update",
+                "DROP TRIGGER IF EXISTS citations_version_update",
+                "UPDATE citations SET book_title = (SELECT title FROM books WHERE id = citations.book_id)",
+            ]
+        for statement in updates:
+            cursor.execute(statement)
+        if updates:
+            conn.commit()
+
+
+# Same expression as the role_rank column in schema.sql
+ROLE_RANK = "CASE role WHEN 'author' THEN 0 WHEN 'translator' THEN 1 ELSE 2 END"
+
+
+def _ensure_contributor_schema():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_xinfo(book_contributors)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if not columns:
+            return
+        updates = []
+        if "role_rank" not in columns:
+            updates.append(f"ALTER TABLE book_contributors ADD COLUMN role_rank INTEGER GENERATED ALWAYS AS ({ROLE_RANK}) VIRTUAL")
+        if "person_name" not in columns:
+            updates += [
+                "ALTER TABLE book_contributors ADD COLUMN person_name TEXT",
+                "ALTER TABLE book_contributors ADD COLUMN book_title TEXT",
+                "DROP TRIGGER IF EXISTS book_contributors_log_update",
+                """
+                UPDATE book_contributors
+                SET person_name = (SELECT name FROM people WHERE id = book_contributors.person_id),
+                    book_title = (SELECT title FROM books WHERE id = book_contributors.book_id)
+                """,
+            ]
+        for statement in updates:
+            cursor.execute(statement)
+        if updates:
+            conn.commit()
+
+
 def init_db():
     with get_connection() as conn:
+        # Only takes effect on a new, empty database; maintenance converts older ones
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
         with open("schema.sql") as f:
             conn.executescript(f.read())
         conn.commit()
+        cursor = conn.cursor()
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM citation_stats), EXISTS (SELECT 1 FROM citations)")
+        has_stats, has_citations = cursor.fetchone()
+    if has_citations and not has_stats:
+        rebuild_citation_stats()
+
+
+def rebuild_citation_stats():
+    with write_transaction() as conn:
+        conn.execute("DELETE FROM citation_stats")
+        conn.execute("""
+            INSERT INTO citation_stats (book_id, person_id, month, indirect_citation, citation_count)
+            SELECT
+                book_id,
+                person_id,
+                COALESCE(strftime('%Y-%m', created_at), 'unknown'),
+                CASE WHEN indirect_citation THEN 1 ELSE 0 END,
+                COUNT(*)
+            FROM citations
+            GROUP BY 1, 2, 3, 4
+        """)
 
 
 # ---------- BOOKS ----------
 def add_book(title, publication_year=None, isbn=None, is_complete=False):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO books (title, publication_year, isbn, is_complete, created_at, updated_at)
@@ -53,7 +592,7 @@ def add_book(title, publication_year=None, isbn=None, is_complete=False):
 
 
 def update_book(book_id, title, publication_year=None, isbn=None, is_complete=False):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute("""
             UPDATE books
             SET title = ?,
@@ -65,120 +604,138 @@ def update_book(book_id, title, publication_year=None, isbn=None, is_complete=Fa
         """, (title, publication_year, isbn, int(bool(is_complete)), book_id))
 
 
-def get_books(include_completed=True, ensure_ids=None):
+def _contributors_by_book(cursor, book_filter="", params=()):
+    # One ordered pass over the (role, book_id) index; rows stay in entry order per book
+    cursor.row_factory = None
+    cursor.execute(f"""
+        SELECT bc.book_id, bc.role, p.id, p.name
+        FROM book_contributors bc
+        JOIN people p ON p.id = bc.person_id
+        WHERE bc.role IN ('author', 'translator'){book_filter}
+        ORDER BY bc.role, bc.book_id
+    """, params)
+    contributors = defaultdict(list)
+    for book_id, role, person_id, name in cursor.fetchall():
+        contributors[(book_id, role)].append(Contributor(person_id, name))
+    return contributors
+
+
+def _books_query(include_completed=True, ensure_ids=None):
     ensure_ids = [int(i) for i in ensure_ids or []]
+    params = []
+    conditions = []
+    if not include_completed:
+        if ensure_ids:
+            placeholders = ", ".join("?" for _ in ensure_ids)
+            conditions.append(f"(b.is_complete = 0 OR b.id IN ({placeholders}))")
+            params.extend(ensure_ids)
+        else:
+            conditions.append("b.is_complete = 0")
+
+    where = "\nWHERE " + " AND ".join(conditions) if conditions else ""
+
+    query = f"""
+        SELECT
+            b.id,
+            b.title,
+            b.publication_year,
+            b.isbn,
+            (SELECT COUNT(*) FROM citations c WHERE c.book_id = b.id) AS citation_count,
+            (SELECT COUNT(*) FROM epigraphs e WHERE e.book_id = b.id) AS epigraph_count,
+            b.is_complete
+        FROM books b{where}
+        ORDER BY b.title
+    """
+    return query, params, where
+
+
+def _book_rows(rows, contributors):
+    return [
+        Book(
+            book_id,
+            title,
+            publication_year,
+            isbn,
+            contributors.get((book_id, "author"), []),
+            contributors.get((book_id, "translator"), []),
+            citation_count,
+            epigraph_count,
+            is_complete,
+        )
+        for book_id, title, publication_year, isbn, citation_count, epigraph_count, is_complete in rows
+    ]
+
+
+@cached("books", "book_contributors", "people", "citations", "epigraphs")
+def get_books(include_completed=True, ensure_ids=None):
+    query, params, where = _books_query(include_completed, ensure_ids)
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
 
-        query = """
-            SELECT
-                b.id,
-                b.title,
-                b.publication_year,
-                b.isbn,
-                authors.names AS authors,
-                authors.ids AS author_ids,
-                translators.names AS translators,
-                translators.ids AS translator_ids,
-                COALESCE(c_counts.citation_count, 0) AS citation_count,
-                COALESCE(e_counts.epigraph_count, 0) AS epigraph_count,
-                b.is_complete
-            FROM books b
-            LEFT JOIN (
-                SELECT
-                    bc.book_id,
-                    REPLACE(GROUP_CONCAT(DISTINCT p.name), ',', ', ') AS names,
-                    REPLACE(GROUP_CONCAT(DISTINCT p.id || '::' || p.name), ',', '|') AS ids
-                FROM book_contributors bc
-                JOIN people p ON p.id = bc.person_id
-                WHERE bc.role = 'author'
-                GROUP BY bc.book_id
-            ) AS authors ON authors.book_id = b.id
-            LEFT JOIN (
-                SELECT
-                    bc.book_id,
-                    REPLACE(GROUP_CONCAT(DISTINCT p.name), ',', ', ') AS names,
-                    REPLACE(GROUP_CONCAT(DISTINCT p.id || '::' || p.name), ',', '|') AS ids
-                FROM book_contributors bc
-                JOIN people p ON p.id = bc.person_id
-                WHERE bc.role = 'translator'
-                GROUP BY bc.book_id
-            ) AS translators ON translators.book_id = b.id
-            LEFT JOIN (
-                SELECT book_id, COUNT(*) AS citation_count
-                FROM citations
-                GROUP BY book_id
-            ) AS c_counts ON c_counts.book_id = b.id
-            LEFT JOIN (
-                SELECT book_id, COUNT(*) AS epigraph_count
-                FROM epigraphs
-                GROUP BY book_id
-            ) AS e_counts ON e_counts.book_id = b.id
-        """
+        book_filter = f"\n          AND bc.book_id IN (SELECT b.id FROM books b{where})" if where else ""
+        contributors = _contributors_by_book(cursor, book_filter, params)
 
-        params = []
-        conditions = []
-        if not include_completed:
-            if ensure_ids:
-                placeholders = ", ".join("?" for _ in ensure_ids)
-                conditions.append(f"(b.is_complete = 0 OR b.id IN ({placeholders}))")
-                params.extend(ensure_ids)
-            else:
-                conditions.append("b.is_complete = 0")
+    return _book_rows(rows, contributors)
 
-        if conditions:
-            query += "\nWHERE " + " AND ".join(conditions)
 
-        query += "\nORDER BY b.title"
+def iter_books(include_completed=True):
+    query, params, _ = _books_query(include_completed)
+    for conn, rows in _query_batches(query, params):
+        # Contributors for just this batch, read in the same snapshot
+        placeholders = ", ".join("?" for _ in rows)
+        contributors = _contributors_by_book(
+            conn.cursor(), f"\n          AND bc.book_id IN ({placeholders})", [row[0] for row in rows]
+        )
+        yield from _book_rows(rows, contributors)
 
-        cursor.execute(query, params)
-        return cursor.fetchall()
+
+def _book_by_id(cursor, book_id):
+    cursor.row_factory = None
+    cursor.execute(
+        "SELECT id, title, publication_year, isbn, is_complete FROM books WHERE id = ?",
+        (book_id,)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None, None
+
+    contributors = defaultdict(list)
+    for role, person_id, name in _book_contributors(cursor, book_id):
+        contributors[role].append(Contributor(person_id, name))
+
+    book_id, title, publication_year, isbn, is_complete = row
+    authors = ", ".join(name for _, name in contributors.get("author", [])) or None
+    translators = ", ".join(name for _, name in contributors.get("translator", [])) or None
+    return BookDetail(book_id, title, publication_year, isbn, authors, translators, is_complete), contributors
 
 
+@cached("books", "book_contributors", "people")
 def get_book_by_id(book_id):
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                b.id,
-                b.title,
-                b.publication_year,
-                b.isbn,
-                authors.names AS authors,
-                translators.names AS translators,
-                b.is_complete
-            FROM books b
-            LEFT JOIN (
-                SELECT bc.book_id, REPLACE(GROUP_CONCAT(DISTINCT p.name), ',', ', ') AS names
-                FROM book_contributors bc
-                JOIN people p ON p.id = bc.person_id
-                WHERE bc.role = 'author'
-                GROUP BY bc.book_id
-            ) AS authors ON authors.book_id = b.id
-            LEFT JOIN (
-                SELECT bc.book_id, REPLACE(GROUP_CONCAT(DISTINCT p.name), ',', ', ') AS names
-                FROM book_contributors bc
-                JOIN people p ON p.id = bc.person_id
-                WHERE bc.role = 'translator'
-                GROUP BY bc.book_id
-            ) AS translators ON translators.book_id = b.id
-            WHERE b.id = ?
-        """, (book_id,))
-        return cursor.fetchone()
+        cursor.execute("BEGIN")
+        book, _ = _book_by_id(cursor, book_id)
+        return book
 
 
 # ---------- PERSON TYPES ----------
+def _add_person_type(cursor, name):
+    cursor.execute("""
+        INSERT OR IGNORE INTO person_types (name, created_at, updated_at) VALUES (?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    """, (name,))
+    cursor.execute("SELECT id FROM person_types WHERE name = ?", (name,))
+    return cursor.fetchone()[0]
+
+
 def add_person_type(name):
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR IGNORE INTO person_types (name, created_at, updated_at) VALUES (?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-        """, (name,))
-        conn.commit()
-        cursor.execute("SELECT id FROM person_types WHERE name = ?", (name,))
-        return cursor.fetchone()[0]
+    with write_transaction() as conn:
+        return _add_person_type(conn.cursor(), name)
 
 
+@cached("person_types")
 def get_person_types():
     with get_connection() as conn:
         cursor = conn.cursor()
@@ -188,18 +745,18 @@ def get_person_types():
 
 # ---------- NATIONALITIES ----------
 def add_nationality(name):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT OR IGNORE INTO nationalities (name)
             VALUES (?)
         """, (name,))
-        conn.commit()
         cursor.execute("SELECT id FROM nationalities WHERE name = ?", (name,))
         row = cursor.fetchone()
         return row[0] if row else None
 
 
+@cached("nationalities")
 def get_nationalities():
     with get_connection() as conn:
         cursor = conn.cursor()
@@ -208,7 +765,7 @@ def get_nationalities():
 
 
 def update_nationality(nationality_id, name):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute(
             "UPDATE nationalities SET name = ? WHERE id = ?",
             (name, nationality_id)
@@ -216,26 +773,24 @@ def update_nationality(nationality_id, name):
 
 
 def delete_nationality(nationality_id):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute("DELETE FROM nationalities WHERE id = ?", (nationality_id,))
 
 
-def _get_person_type_id(type_name):
+def _get_person_type_id(cursor, type_name):
     if not type_name:
         return None
     type_name = type_name.strip()
     if not type_name:
         return None
 
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM person_types WHERE name = ?", (type_name,))
-        row = cursor.fetchone()
+    cursor.execute("SELECT id FROM person_types WHERE name = ?", (type_name,))
+    row = cursor.fetchone()
 
     if row:
         return row[0]
 
-    return add_person_type(type_name)
+    return _add_person_type(cursor, type_name)
 
 
 def get_or_create_person(name, default_type=None):
@@ -243,7 +798,9 @@ def get_or_create_person(name, default_type=None):
     if not normalized:
         return None
 
-    with get_connection() as conn:
+    # The lookup and insert share one BEGIN IMMEDIATE transaction, so two
+    # concurrent saves of the same new name cannot both insert it.
+    with write_transaction() as conn:
         cursor = conn.cursor()
         cursor.execute(
             "SELECT id, type_id FROM people WHERE LOWER(name) = LOWER(?)",
@@ -254,15 +811,15 @@ def get_or_create_person(name, default_type=None):
         if row:
             person_id, current_type_id = row
             if default_type and current_type_id is None:
-                type_id = _get_person_type_id(default_type)
+                type_id = _get_person_type_id(cursor, default_type)
                 if type_id is not None:
-                    conn.execute(
+                    cursor.execute(
                         "UPDATE people SET type_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
                         (type_id, person_id)
                     )
             return person_id
 
-        type_id = _get_person_type_id(default_type) if default_type else None
+        type_id = _get_person_type_id(cursor, default_type) if default_type else None
         cursor.execute(
             """
             INSERT INTO people (name, wiki_url, bio_summary, type_id, nationality_id, birth_year, death_year, notes, created_at, updated_at)
@@ -277,7 +834,7 @@ def add_book_contributor(book_id, person_id, role):
     if not person_id or not role:
         return
     role = role.lower()
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute(
             """
             INSERT OR IGNORE INTO book_contributors (book_id, person_id, role)
@@ -295,11 +852,11 @@ def remove_book_contributor(book_id, person_id, role=None):
     if role:
         query += " AND role = ?"
         params.append(role.lower())
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute(query, params)
 
 
-def get_book_contributors(book_id, role=None):
+def _book_contributors(cursor, book_id, role=None):
     query = [
         "SELECT bc.role, p.id, p.name",
         "FROM book_contributors bc",
@@ -312,14 +869,18 @@ def get_book_contributors(book_id, role=None):
         query.append("AND bc.role = ?")
         params.append(role.lower())
 
-    query.append(
-        "ORDER BY CASE bc.role WHEN 'author' THEN 0 WHEN 'translator' THEN 1 ELSE 2 END, p.name COLLATE NOCASE"
-    )
+    # idx_book_contributors_book_order yields the rows in this order
+    query.append("ORDER BY bc.role_rank, bc.person_name COLLATE NOCASE, bc.person_id")
+
+    cursor.row_factory = None
+    cursor.execute("\n".join(query), params)
+    return cursor.fetchall()
 
+
+@cached("book_contributors", "people")
+def get_book_contributors(book_id, role=None):
     with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("\n".join(query), params)
-        return cursor.fetchall()
+        return _book_contributors(conn.cursor(), book_id, role)
 
 
 # ---------- PEOPLE ----------
@@ -335,7 +896,7 @@ def add_person(
     birth_year_era="AD",
     death_year_era="AD",
 ):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO people (name, wiki_url, bio_summary, type_id, nationality_id, birth_year, death_year, birth_year_era, death_year_era, notes, created_at, updated_at)
@@ -344,63 +905,77 @@ def add_person(
         return cursor.lastrowid
 
 
+def _people_query(search_term=None):
+    query = """
+        SELECT
+            people.id,
+            people.name,
+            person_types.name AS type,
+            people.wiki_url,
+            (SELECT COUNT(*) FROM citations WHERE citations.person_id = people.id) AS citation_count,
+            (SELECT COUNT(*) FROM epigraphs WHERE epigraphs.author_id = people.id) AS epigraph_count,
+            people.birth_year,
+            people.death_year,
+            people.birth_year_era,
+            people.death_year_era,
+            nationalities.name AS nationality
+        FROM people
+        LEFT JOIN person_types ON people.type_id = person_types.id
+        LEFT JOIN nationalities ON people.nationality_id = nationalities.id
+    """
+    params = []
+    if search_term:
+        query += " WHERE LOWER(people.name) LIKE ?"
+        params.append(f"%{search_term.lower()}%")
+    query += " ORDER BY people.name"
+    return query, params
+
+
+@cached("people", "person_types", "nationalities", "citations", "epigraphs")
 def get_people(search_term=None):
     with get_connection() as conn:
         cursor = conn.cursor()
-        query = """
-            SELECT
-                people.id,
-                people.name,
-                person_types.name AS type,
-                people.wiki_url,
-                COUNT(DISTINCT citations.id) AS citation_count,
-                COUNT(DISTINCT epigraphs.id) AS epigraph_count,
-                people.birth_year,
-                people.death_year,
-                people.birth_year_era,
-                people.death_year_era,
-                nationalities.name AS nationality
-            FROM people
-            LEFT JOIN person_types ON people.type_id = person_types.id
-            LEFT JOIN citations ON people.id = citations.person_id
-            LEFT JOIN epigraphs ON people.id = epigraphs.author_id
-            LEFT JOIN nationalities ON people.nationality_id = nationalities.id
-        """
-        params = []
-        if search_term:
-            query += " WHERE LOWER(people.name) LIKE ?"
-            params.append(f"%{search_term.lower()}%")
-        query += " GROUP BY people.id ORDER BY people.name"
-        cursor.execute(query, params)
+        cursor.row_factory = row_factory(Person)
+        cursor.execute(*_people_query(search_term))
         return cursor.fetchall()
 
+
+def iter_people(search_term=None):
+    for _, rows in _query_batches(*_people_query(search_term), row_type=Person):
+        yield from rows
+
+def _person_by_id(cursor, person_id):
+    cursor.row_factory = row_factory(PersonDetail)
+    cursor.execute(
+        """
+        SELECT
+            people.id,
+            people.name,
+            people.type_id,
+            people.wiki_url,
+            people.bio_summary,
+            people.birth_year,
+            people.death_year,
+            people.notes,
+            person_types.name AS type_name,
+            people.nationality_id,
+            nationalities.name AS nationality_name,
+            people.birth_year_era,
+            people.death_year_era
+        FROM people
+        LEFT JOIN person_types ON people.type_id = person_types.id
+        LEFT JOIN nationalities ON people.nationality_id = nationalities.id
+        WHERE people.id = ?
+        """,
+        (person_id,)
+    )
+    return cursor.fetchone()
+
+
+@cached("people", "person_types", "nationalities")
 def get_person_by_id(person_id):
     with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT
-                people.id,
-                people.name,
-                people.type_id,
-                people.wiki_url,
-                people.bio_summary,
-                people.birth_year,
-                people.death_year,
-                people.notes,
-                person_types.name AS type_name,
-                people.nationality_id,
-                nationalities.name AS nationality_name,
-                people.birth_year_era,
-                people.death_year_era
-            FROM people
-            LEFT JOIN person_types ON people.type_id = person_types.id
-            LEFT JOIN nationalities ON people.nationality_id = nationalities.id
-            WHERE people.id = ?
-            """,
-            (person_id,)
-        )
-        return cursor.fetchone()
+        return _person_by_id(conn.cursor(), person_id)
 
 def update_person(
     person_id,
@@ -415,7 +990,7 @@ def update_person(
     birth_year_era="AD",
     death_year_era="AD",
 ):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute("""
             UPDATE people
             SET name = ?,
@@ -433,9 +1008,115 @@ def update_person(
         """, (name, type_id, nationality_id, birth_year, death_year, birth_year_era or "AD", death_year_era or "AD", notes, wiki_url, bio_summary, person_id))
 
 def delete_person(person_id):
-    with get_connection() as conn:
+    # Remove the rows that point at the person too, so none are left orphaned
+    with write_transaction() as conn:
+        conn.execute("DELETE FROM citations WHERE person_id = ?", (person_id,))
+        conn.execute("DELETE FROM epigraphs WHERE author_id = ?", (person_id,))
+        conn.execute("DELETE FROM book_contributors WHERE person_id = ?", (person_id,))
         conn.execute("DELETE FROM people WHERE id = ?", (person_id,))
         
+NO_BIO = "No Wikipedia page found."
+
+
+class MergeError(ValueError):
+    pass
+
+
+def _merged_fields(target, sources):
+    # Keep the target's values, filling gaps from the sources; the longest real
+    # bio wins, and life dates move together with their era
+    rows = [target] + sources
+    fields = {}
+    for column in ("wiki_url", "type_id", "nationality_id"):
+        fields[column] = next((row[column] for row in rows if row[column] is not None), None)
+    bios = [row["bio_summary"] for row in rows if row["bio_summary"] and row["bio_summary"] != NO_BIO]
+    fields["bio_summary"] = max(bios, key=len) if bios else target["bio_summary"]
+    for year, era in (("birth_year", "birth_year_era"), ("death_year", "death_year_era")):
+        best = next((row for row in rows if row[year] is not None), target)
+        fields[year], fields[era] = best[year], best[era]
+    notes = []
+    for row in rows:
+        if row["notes"] and row["notes"] not in notes:
+            notes.append(row["notes"])
+    fields["notes"] = "\n".join(notes) or None
+    return fields
+
+
+def merge_people(merges):
+    """Merge each (target_id, source_ids) pair in one transaction.
+
+    Citations, epigraphs, contributor rows and clipping proposals are repointed with set-based
+    updates; the sources are then deleted. Returns the number of rows moved
+    per table."""
+    mapping = {}
+    for target_id, source_ids in merges:
+        for source_id in source_ids:
+            if source_id == target_id or mapping.get(source_id, target_id) != target_id:
+                raise MergeError(f"Person {source_id} cannot be merged into {target_id}.")
+            mapping[source_id] = target_id
+    if set(mapping) & set(mapping.values()):
+        raise MergeError("A person cannot be both merged away and kept in the same batch.")
+    if not mapping:
+        return {"people": 0, "citations": 0, "epigraphs": 0, "book_contributors": 0, "clipping_proposals": 0}
+
+    with write_transaction() as conn:
+        conn.row_factory = sqlite3.Row
+        ids = list(mapping) + list(set(mapping.values()))
+        people = {
+            row["id"]: row for row in conn.execute(
+                "SELECT * FROM people WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(ids),)
+            )
+        }
+        missing = sorted(set(ids) - set(people))
+        if missing:
+            raise MergeError(f"No such people: {', '.join(map(str, missing))}.")
+
+        conn.execute("CREATE TEMP TABLE merge_map (source_id INTEGER PRIMARY KEY, target_id INTEGER NOT NULL)")
+        conn.executemany("INSERT INTO merge_map VALUES (?, ?)", mapping.items())
+        moved = {}
+        for table, column in (("citations", "person_id"), ("epigraphs", "author_id")):
+            moved[table] = conn.execute(f"""
+                UPDATE {table}
+                SET {column} = (SELECT target_id FROM merge_map WHERE source_id = {table}.{column}),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE {column} IN (SELECT source_id FROM merge_map)
+            """).rowcount
+        # OR IGNORE leaves rows that would duplicate a (book, person, role) the
+        # target already has; those are redundant and deleted afterwards
+        moved["book_contributors"] = conn.execute("""
+            UPDATE OR IGNORE book_contributors
+            SET person_id = (SELECT target_id FROM merge_map WHERE source_id = book_contributors.person_id),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE person_id IN (SELECT source_id FROM merge_map)
+        """).rowcount
+        conn.execute("DELETE FROM book_contributors WHERE person_id IN (SELECT source_id FROM merge_map)")
+        # Likewise for highlight proposals the target already has on the same page
+        moved["clipping_proposals"] = conn.execute("""
+            UPDATE OR IGNORE clipping_proposals
+            SET person_id = (SELECT target_id FROM merge_map WHERE source_id = clipping_proposals.person_id)
+            WHERE person_id IN (SELECT source_id FROM merge_map)
+        """).rowcount
+        conn.execute("DELETE FROM clipping_proposals WHERE person_id IN (SELECT source_id FROM merge_map)")
+
+        targets = {}
+        for source_id, target_id in mapping.items():
+            targets.setdefault(target_id, []).append(people[source_id])
+        conn.executemany("""
+            UPDATE people
+            SET wiki_url = :wiki_url, bio_summary = :bio_summary, type_id = :type_id,
+                nationality_id = :nationality_id, birth_year = :birth_year, birth_year_era = :birth_year_era,
+                death_year = :death_year, death_year_era = :death_year_era, notes = :notes,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+        """, [
+            dict(_merged_fields(people[target_id], sources), id=target_id)
+            for target_id, sources in targets.items()
+        ])
+        moved["people"] = conn.execute("DELETE FROM people WHERE id IN (SELECT source_id FROM merge_map)").rowcount
+        conn.execute("DROP TABLE merge_map")
+    return moved
+
+
 def person_exists(name):
     with get_connection() as conn:
         cur = conn.cursor()
@@ -444,29 +1125,39 @@ def person_exists(name):
 
 # ---------- CITATIONS ----------
 def add_citation(person_id, book_id, page_number, indirect_citation, notes=None):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute("""
             INSERT INTO citations (person_id, book_id, page_number, indirect_citation, notes, created_at, updated_at)
             VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
         """, (person_id, book_id, page_number, indirect_citation, notes))
 
 
+_CITATIONS_QUERY = """
+    SELECT c.id, p.name, b.title, c.page_number, b.id, c.notes, c.indirect_citation
+    FROM citations c
+    JOIN people p ON c.person_id = p.id
+    JOIN books b ON c.book_id = b.id
+    ORDER BY c.updated_at DESC
+"""
+
+
 def get_citations():
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT c.id, p.name, b.title, c.page_number, b.id, c.notes, c.indirect_citation
-            FROM citations c
-            JOIN people p ON c.person_id = p.id
-            JOIN books b ON c.book_id = b.id
-            ORDER BY c.updated_at DESC
-        """)
+        cursor.row_factory = row_factory(Citation)
+        cursor.execute(_CITATIONS_QUERY)
         return cursor.fetchall()
 
 
+def iter_citations():
+    for _, rows in _query_batches(_CITATIONS_QUERY, row_type=Citation):
+        yield from rows
+
+
 def get_citation_by_id(citation_id):
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.row_factory = row_factory(CitationRecord)
         cursor.execute("""
             SELECT id, person_id, book_id, page_number, notes, indirect_citation
             FROM citations
@@ -474,45 +1165,47 @@ def get_citation_by_id(citation_id):
         """, (citation_id,))
         return cursor.fetchone()
 
+def _citations_by_book(cursor, book_id):
+    cursor.row_factory = row_factory(BookCitation)
+    cursor.execute("""
+        SELECT
+            c.id,
+            p.name,
+            c.page_number,
+            p.id,
+            c.notes,
+            c.indirect_citation
+        FROM citations c
+        JOIN people p ON c.person_id = p.id
+        WHERE c.book_id = ?
+        ORDER BY c.page_key, c.page_number
+    """, (book_id,))
+    return cursor.fetchall()
+
+
 def get_citations_by_book(book_id):
     with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                c.id,
-                p.name,
-                c.page_number,
-                p.id,
-                c.notes,
-                c.indirect_citation
-            FROM citations c
-            JOIN people p ON c.person_id = p.id
-            WHERE c.book_id = ?
-            ORDER BY
-                CASE
-                    WHEN TRIM(c.page_number) GLOB '[0-9]*' AND TRIM(c.page_number) <> ''
-                        THEN CAST(TRIM(c.page_number) AS INTEGER)
-                    ELSE NULL
-                END,
-                TRIM(c.page_number)
-        """, (book_id,))
-        return cursor.fetchall()
+        return _citations_by_book(conn.cursor(), book_id)
+
+def _citations_by_person(cursor, person_id):
+    cursor.row_factory = row_factory(Citation)
+    cursor.execute("""
+        SELECT c.id, p.name, b.title, c.page_number, b.id, c.notes, c.indirect_citation
+        FROM citations c
+        JOIN people p ON c.person_id = p.id
+        JOIN books b ON c.book_id = b.id
+        WHERE c.person_id = ?
+        ORDER BY c.book_title, c.book_id, c.page_number
+    """, (person_id,))
+    return cursor.fetchall()
+
 
 def get_citations_by_person(person_id):
     with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT c.id, p.name, b.title, c.page_number, b.id, c.notes, c.indirect_citation
-            FROM citations c
-            JOIN people p ON c.person_id = p.id
-            JOIN books b ON c.book_id = b.id
-            WHERE c.person_id = ?
-            ORDER BY b.title, c.page_number
-        """, (person_id,))
-        return cursor.fetchall()
+        return _citations_by_person(conn.cursor(), person_id)
 
 def update_citation(citation_id, person_id, book_id, page_number, indirect_citation, notes):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute("""
             UPDATE citations
             SET person_id = ?, book_id = ?, page_number = ?, notes = ?, indirect_citation = ?, updated_at = CURRENT_TIMESTAMP
@@ -520,9 +1213,41 @@ def update_citation(citation_id, person_id, book_id, page_number, indirect_citat
         """, (person_id, book_id, page_number, notes, indirect_citation, citation_id))
 
 
+def get_citation_version(book_id):
+    with get_connection() as conn:
+        row = conn.execute("SELECT version FROM citation_versions WHERE book_id = ?", (book_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def load_name_index(book_id):
+    """Return (version, citation rows, names) for a book's index of names.
+
+    The rows come straight off idx_citations_book_person_page, grouped by
+    person with direct citations first and each group in page_key order, so
+    nothing is sorted row by row."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT version FROM citation_versions WHERE book_id = ?", (book_id,))
+        row = cursor.fetchone()
+        cursor.execute("""
+            SELECT person_id, indirect_citation, page_number
+            FROM citations
+            WHERE book_id = ?
+            ORDER BY person_id, indirect_citation, page_key
+        """, (book_id,))
+        rows = cursor.fetchall()
+        cursor.execute("""
+            SELECT id, name FROM people
+            WHERE id IN (SELECT DISTINCT person_id FROM citations WHERE book_id = ?)
+        """, (book_id,))
+        names = dict(cursor.fetchall())
+    return (row[0] if row else 0), rows, names
+
+
 # ---------- EPIGRAPHS ----------
 def add_epigraph(book_id, author_id, quote, notes=None):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO epigraphs (book_id, author_id, quote, notes, created_at, updated_at)
@@ -531,30 +1256,40 @@ def add_epigraph(book_id, author_id, quote, notes=None):
         return cursor.lastrowid
 
 
+_EPIGRAPHS_QUERY = """
+    SELECT
+        e.id,
+        b.id,
+        b.title,
+        p.id,
+        p.name,
+        e.quote,
+        e.notes,
+        e.created_at
+    FROM epigraphs e
+    JOIN books b ON e.book_id = b.id
+    JOIN people p ON e.author_id = p.id
+    ORDER BY b.title, e.created_at DESC
+"""
+
+
 def get_epigraphs():
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                e.id,
-                b.id,
-                b.title,
-                p.id,
-                p.name,
-                e.quote,
-                e.notes,
-                e.created_at
-            FROM epigraphs e
-            JOIN books b ON e.book_id = b.id
-            JOIN people p ON e.author_id = p.id
-            ORDER BY b.title, e.created_at DESC
-        """)
+        cursor.row_factory = row_factory(Epigraph)
+        cursor.execute(_EPIGRAPHS_QUERY)
         return cursor.fetchall()
 
 
+def iter_epigraphs():
+    for _, rows in _query_batches(_EPIGRAPHS_QUERY, row_type=Epigraph):
+        yield from rows
+
+
 def get_epigraph_by_id(epigraph_id):
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.row_factory = row_factory(EpigraphRecord)
         cursor.execute("""
             SELECT id, book_id, author_id, quote, notes
             FROM epigraphs
@@ -563,46 +1298,54 @@ def get_epigraph_by_id(epigraph_id):
         return cursor.fetchone()
 
 
+def _epigraphs_by_book(cursor, book_id):
+    cursor.row_factory = row_factory(BookEpigraph)
+    cursor.execute("""
+        SELECT
+            e.id,
+            e.quote,
+            e.notes,
+            p.name,
+            p.id,
+            e.created_at
+        FROM epigraphs e
+        JOIN people p ON e.author_id = p.id
+        WHERE e.book_id = ?
+        ORDER BY e.created_at
+    """, (book_id,))
+    return cursor.fetchall()
+
+
 def get_epigraphs_by_book(book_id):
     with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                e.id,
-                e.quote,
-                e.notes,
-                p.name,
-                p.id,
-                e.created_at
-            FROM epigraphs e
-            JOIN people p ON e.author_id = p.id
-            WHERE e.book_id = ?
-            ORDER BY e.created_at
-        """, (book_id,))
-        return cursor.fetchall()
+        return _epigraphs_by_book(conn.cursor(), book_id)
+
+
+def _epigraphs_by_person(cursor, person_id):
+    cursor.row_factory = row_factory(PersonEpigraph)
+    cursor.execute("""
+        SELECT
+            e.id,
+            e.quote,
+            e.notes,
+            b.title,
+            b.id,
+            e.created_at
+        FROM epigraphs e
+        JOIN books b ON e.book_id = b.id
+        WHERE e.author_id = ?
+        ORDER BY e.created_at
+    """, (person_id,))
+    return cursor.fetchall()
 
 
 def get_epigraphs_by_person(person_id):
     with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                e.id,
-                e.quote,
-                e.notes,
-                b.title,
-                b.id,
-                e.created_at
-            FROM epigraphs e
-            JOIN books b ON e.book_id = b.id
-            WHERE e.author_id = ?
-            ORDER BY e.created_at
-        """, (person_id,))
-        return cursor.fetchall()
+        return _epigraphs_by_person(conn.cursor(), person_id)
 
 
 def update_epigraph(epigraph_id, book_id, author_id, quote, notes):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute("""
             UPDATE epigraphs
             SET book_id = ?, author_id = ?, quote = ?, notes = ?, updated_at = CURRENT_TIMESTAMP
@@ -611,22 +1354,306 @@ def update_epigraph(epigraph_id, book_id, author_id, quote, notes):
 
 
 def delete_epigraph(epigraph_id):
-    with get_connection() as conn:
+    with write_transaction() as conn:
         conn.execute("DELETE FROM epigraphs WHERE id = ?", (epigraph_id,))
 
 
+def _book_contributions_by_person(cursor, person_id):
+    cursor.row_factory = None
+    cursor.execute("""
+        SELECT bc.role, b.id, b.title
+        FROM book_contributors bc
+        JOIN books b ON b.id = bc.book_id
+        WHERE bc.person_id = ?
+        ORDER BY bc.role_rank, bc.book_title COLLATE NOCASE, bc.book_id
+        """, (person_id,))
+    return cursor.fetchall()
+
+
 def get_book_contributions_by_person(person_id):
+    with get_connection() as conn:
+        return _book_contributions_by_person(conn.cursor(), person_id)
+
+
+
+
+# ---------- SIMILAR BOOKS ----------
+def _similar_books(cursor, book_id):
+    cursor.row_factory = row_factory(SimilarBook)
+    cursor.execute("""
+        SELECT b.id, b.title, s.score, s.shared_people
+        FROM book_similarities s
+        JOIN books b ON b.id = s.similar_book_id
+        WHERE s.book_id = ?
+        ORDER BY s.score DESC, s.shared_people DESC, s.similar_book_id
+    """, (book_id,))
+    return cursor.fetchall()
+
+
+def get_similar_books(book_id):
+    with get_connection() as conn:
+        return _similar_books(conn.cursor(), book_id)
+
+
+# ---------- CLIPPING IMPORTS ----------
+@cached("people")
+def get_person_names():
+    with get_connection() as conn:
+        return conn.execute("SELECT id, name FROM people").fetchall()
+
+
+def add_clipping_proposals(proposals):
+    """Stage (book_id, person_id, page_number, excerpt) proposals for review.
+
+    Proposals already staged (in any status) or already recorded as a
+    citation are skipped. Returns the number added."""
+    with write_transaction() as conn:
+        return conn.executemany("""
+            INSERT INTO clipping_proposals (book_id, person_id, page_number, excerpt)
+            SELECT :book_id, :person_id, :page_number, :excerpt
+            WHERE NOT EXISTS (
+                SELECT 1 FROM citations
+                WHERE book_id = :book_id AND person_id = :person_id AND page_number = :page_number
+            )
+            ON CONFLICT (book_id, person_id, page_number) DO NOTHING
+        """, [
+            {"book_id": book_id, "person_id": person_id, "page_number": page_number, "excerpt": excerpt}
+            for book_id, person_id, page_number, excerpt in proposals
+        ]).rowcount
+
+
+def get_clipping_review(book_id=None, limit=500):
+    """Books with pending proposals, and the pending proposals of one of them."""
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        books = cursor.execute("""
+            SELECT b.id, b.title, COUNT(*)
+            FROM clipping_proposals cp
+            JOIN books b ON b.id = cp.book_id
+            JOIN people p ON p.id = cp.person_id
+            WHERE cp.status = 'pending'
+            GROUP BY b.id
+            ORDER BY b.title
+        """).fetchall()
+        if book_id is None and books:
+            book_id = books[0][0]
+        cursor.row_factory = row_factory(ClippingProposal)
         cursor.execute("""
-            SELECT bc.role, b.id, b.title
-            FROM book_contributors bc
-            JOIN books b ON b.id = bc.book_id
-            WHERE bc.person_id = ?
-            ORDER BY CASE bc.role WHEN 'author' THEN 0 WHEN 'translator' THEN 1 ELSE 2 END, b.title COLLATE NOCASE
-        """, (person_id,))
-        return cursor.fetchall()
+            SELECT cp.id, p.id, p.name, cp.page_number, cp.excerpt
+            FROM clipping_proposals cp
+            JOIN people p ON p.id = cp.person_id
+            WHERE cp.status = 'pending' AND cp.book_id = ?
+            ORDER BY cp.id
+            LIMIT ?
+        """, (book_id, limit))
+        return books, book_id, cursor.fetchall()
+
+
+def resolve_clipping_proposals(accept, proposal_ids=None, book_id=None):
+    """Accept or reject pending proposals, by id or for a whole book.
+
+    Accepted proposals become citations, with the highlighted passage as
+    their notes. Returns the number of proposals resolved."""
+    if proposal_ids is not None:
+        selection, params = "id IN (SELECT value FROM json_each(?))", (json.dumps(list(proposal_ids)),)
+    else:
+        selection, params = "book_id = ?", (book_id,)
+    with write_transaction() as conn:
+        if accept:
+            conn.execute(f"""
+                INSERT INTO citations (person_id, book_id, page_number, indirect_citation, notes, created_at, updated_at)
+                SELECT cp.person_id, cp.book_id, cp.page_number, 0, cp.excerpt, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+                FROM clipping_proposals cp
+                WHERE cp.status = 'pending' AND cp.{selection}
+                  AND EXISTS (SELECT 1 FROM people p WHERE p.id = cp.person_id)
+                  AND EXISTS (SELECT 1 FROM books b WHERE b.id = cp.book_id)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM citations c
+                      WHERE c.book_id = cp.book_id AND c.person_id = cp.person_id AND c.page_number = cp.page_number
+                  )
+            """, params)
+        return conn.execute(
+            f"UPDATE clipping_proposals SET status = ? WHERE status = 'pending' AND {selection}",
+            ("accepted" if accept else "rejected",) + params
+        ).rowcount
+
+
+# ---------- CHANGE FEED ----------
+def get_changes(since=0, limit=500):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT seq, table_name, row_id, related_id, operation, changed_at
+            FROM change_log
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        """, (since, limit + 1))
+        rows = cursor.fetchall()
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+        latest_seq = cursor.fetchone()[0]
+
+    has_more = len(rows) > limit
+    return rows[:limit], has_more, latest_seq
+
+# ---------- PAGE LOADERS ----------
+# Detail pages read everything inside one read transaction so the book/person,
+# their citations and contributors all come from the same snapshot.
+def load_book_page(book_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        book, contributors = _book_by_id(cursor, book_id)
+        if not book:
+            return None
+
+        citations = _citations_by_book(cursor, book_id)
+        epigraphs = _epigraphs_by_book(cursor, book_id)
+        similar_books = _similar_books(cursor, book_id)
+
+    return {
+        "book": book,
+        "citations": citations,
+        "epigraphs": epigraphs,
+        "contributors": contributors,
+        "similar_books": similar_books,
+    }
+
+
+def load_person_page(person_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        person = _person_by_id(cursor, person_id)
+        if not person:
+            return None
+
+        citations = _citations_by_person(cursor, person_id)
+        epigraphs = _epigraphs_by_person(cursor, person_id)
+        contributions = defaultdict(list)
+        for role, book_id, title in _book_contributions_by_person(cursor, person_id):
+            contributions[role].append(Contribution(book_id, title))
+
+    return {
+        "person": person,
+        "citations": citations,
+        "epigraphs": epigraphs,
+        "contributions": contributions,
+    }
+
+
+
+# ---------- STATISTICS ----------
+# All figures come from the citation_stats rollup, never from citations itself.
+@cached("citations", "books", "people", "person_types", "nationalities")
+def get_citation_statistics(top_n=25, months=12, people_per_month=3):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+
+        cursor.execute("""
+            SELECT
+                COALESCE(SUM(citation_count), 0),
+                COALESCE(SUM(CASE WHEN indirect_citation THEN citation_count ELSE 0 END), 0)
+            FROM citation_stats
+        """)
+        total, indirect = cursor.fetchone()
+
+        cursor.execute("""
+            SELECT
+                b.id,
+                b.title,
+                SUM(s.citation_count) AS total,
+                SUM(CASE WHEN s.indirect_citation THEN s.citation_count ELSE 0 END) AS indirect
+            FROM citation_stats s
+            JOIN books b ON b.id = s.book_id
+            GROUP BY s.book_id
+            ORDER BY total DESC, b.title
+            LIMIT ?
+        """, (top_n,))
+        by_book = cursor.fetchall()
+
+        cursor.execute("""
+            SELECT
+                person_types.name,
+                SUM(s.citation_count) AS total,
+                SUM(CASE WHEN s.indirect_citation THEN s.citation_count ELSE 0 END) AS indirect
+            FROM citation_stats s
+            JOIN people p ON p.id = s.person_id
+            LEFT JOIN person_types ON person_types.id = p.type_id
+            GROUP BY p.type_id
+            ORDER BY total DESC
+        """)
+        by_type = cursor.fetchall()
+
+        cursor.execute("""
+            SELECT
+                nationalities.name,
+                SUM(s.citation_count) AS total,
+                SUM(CASE WHEN s.indirect_citation THEN s.citation_count ELSE 0 END) AS indirect
+            FROM citation_stats s
+            JOIN people p ON p.id = s.person_id
+            LEFT JOIN nationalities ON nationalities.id = p.nationality_id
+            GROUP BY p.nationality_id
+            ORDER BY total DESC
+        """)
+        by_nationality = cursor.fetchall()
+
+        # Century of birth, falling back to death when the birth year is unknown
+        cursor.execute("""
+            SELECT
+                (COALESCE(p.birth_year, p.death_year) - 1) / 100 + 1 AS century,
+                CASE WHEN p.birth_year IS NOT NULL THEN p.birth_year_era ELSE p.death_year_era END AS era,
+                SUM(s.citation_count) AS total,
+                SUM(CASE WHEN s.indirect_citation THEN s.citation_count ELSE 0 END) AS indirect
+            FROM citation_stats s
+            JOIN people p ON p.id = s.person_id
+            GROUP BY century, era
+        """)
+        by_century = cursor.fetchall()
+
+        cursor.execute("""
+            WITH recent_months AS (
+                SELECT DISTINCT month
+                FROM citation_stats
+                WHERE month <> 'unknown'
+                ORDER BY month DESC
+                LIMIT ?
+            ),
+            monthly AS (
+                SELECT
+                    s.month,
+                    s.person_id,
+                    SUM(s.citation_count) AS total,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY s.month ORDER BY SUM(s.citation_count) DESC
+                    ) AS rank
+                FROM citation_stats s
+                WHERE s.month IN (SELECT month FROM recent_months)
+                GROUP BY s.month, s.person_id
+            )
+            SELECT monthly.month, p.id, p.name, monthly.total
+            FROM monthly
+            JOIN people p ON p.id = monthly.person_id
+            WHERE monthly.rank <= ?
+            ORDER BY monthly.month DESC, monthly.rank
+        """, (months, people_per_month))
+        top_people_by_month = cursor.fetchall()
+
+    return {
+        "total": total,
+        "indirect": indirect,
+        "by_book": by_book,
+        "by_type": by_type,
+        "by_nationality": by_nationality,
+        "by_century": by_century,
+        "top_people_by_month": top_people_by_month,
+    }
 
 
 _ensure_book_schema()
 _ensure_person_schema()
+_ensure_citation_schema()
+_ensure_contributor_schema()
+_ensure_change_log_schema()
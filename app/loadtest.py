@@ -0,0 +1,401 @@
+import asyncio
+import json
+import random
+import string
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+import httpx
+
+# Load-test harness: replays a weighted mix of browsing, typeahead, preview,
+# citation entry and book lookup traffic against the app, while Wikipedia and
+# Open Library are replaced by local stub servers with tunable latency and
+# error rates. Nothing here talks to the real services.
+DEFAULT_MIX = {"browse": 50, "typeahead": 25, "preview": 10, "cite": 10, "lookup": 5}
+
+BROWSE_PAGES = ["/books", "/people", "/citations", "/epigraphs", "/statistics"]
+
+
+class StubService:
+    """One fake upstream: recorded responses plus injected latency and errors."""
+
+    def __init__(self, name, latency=0.0, error_rate=0.0, responses=None):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.responses = responses or {}
+        self.server = None
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, port=0, host="127.0.0.1"):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                service.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def handle(self, request):
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.calls += 1
+            self.failures += failed
+
+        if failed:
+            status, body = 503, b"Service Unavailable"
+        else:
+            url = urlparse(request.path)
+            status, body = 200, json.dumps(self.respond(url.path, parse_qs(url.query))).encode()
+
+        try:
+            request.send_response(status)
+            request.send_header("Content-Type", "application/json" if status == 200 else "text/plain")
+            request.send_header("Content-Length", str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the app cancelled the lookup, e.g. a superseded preview
+
+    def respond(self, path, params):
+        if "/page/summary/" in path:
+            path, _, title = path.partition("/page/summary/")
+            path += "/page/summary"
+            key = unquote(title).replace("_", " ")
+        else:
+            key = (params.get("bibkeys") or params.get("title") or [""])[0]
+        recorded = self.responses.get(path, {})
+        if key in recorded:
+            return recorded[key]
+        if "*" in recorded:
+            return recorded["*"]
+        return _synthetic_response(path, key, params)
+
+
+def _synthetic_response(path, key, params):
+    if path.endswith("/page/summary"):
+        return {
+            "type": "standard",
+            "title": key,
+            "extract": f"{key} (1850 – 1920) was a writer often cited in the catalogue.",
+            "content_urls": {"desktop": {"page": f"https://en.wikipedia.org/wiki/{key.replace(' ', '_')}"}},
+        }
+    if path.endswith("/api/books"):
+        return {key: {
+            "title": "A Recorded Book",
+            "authors": [{"name": "Anonymous"}],
+            "publish_date": "1999",
+        }}
+    if path.endswith("/search.json"):
+        return {"docs": [{
+            "title": key or "A Recorded Book",
+            "author_name": (params.get("author") or ["Anonymous"]),
+            "first_publish_year": 1999,
+            "isbn": ["9780000000000"],
+        }]}
+    return {}
+
+
+def load_recordings(path):
+    # {"wikipedia": {"/api/rest_v1/page/summary": {"Plato": {...}, "*": {...}}}, "openlibrary": {...}}
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def start_stubs(wikipedia_latency=0.0, wikipedia_error_rate=0.0,
+                openlibrary_latency=0.0, openlibrary_error_rate=0.0,
+                recordings=None, port=0):
+    recordings = recordings or {}
+    wikipedia = StubService("wikipedia", wikipedia_latency, wikipedia_error_rate, recordings.get("wikipedia"))
+    openlibrary = StubService("openlibrary", openlibrary_latency, openlibrary_error_rate, recordings.get("openlibrary"))
+    wikipedia.start(port)
+    openlibrary.start(port + 1 if port else 0)
+    return wikipedia, openlibrary
+
+
+def point_app_at_stubs(wikipedia, openlibrary):
+    from . import open_library_utils, openlibrary_mirror, wikipedia_index, wikipedia_utils
+
+    wikipedia_utils.REST_URL = f"{wikipedia.url}/api/rest_v1"
+    open_library_utils.BOOKS_API_URL = f"{openlibrary.url}/api/books"
+    open_library_utils.SEARCH_API_URL = f"{openlibrary.url}/search.json"
+
+    # Offline index and mirror would answer before the stubs; hide them
+    scratch = Path(tempfile.mkdtemp(prefix="referent-loadtest-"))
+    wikipedia_index.INDEX_PATH = scratch / "wikipedia_abstracts.sqlite3"
+    openlibrary_mirror.MIRROR_PATH = scratch / "openlibrary.sqlite3"
+
+
+def use_scratch_database(books=200, people=500):
+    from . import db
+
+    scratch = Path(tempfile.mkdtemp(prefix="referent-loadtest-"))
+    db.DB_PATH = scratch / "referent.sqlite3"
+    db.init_db()
+
+    rng = random.Random(0)
+    people_ids = [db.get_or_create_person(_fake_name(rng)) for _ in range(people)]
+    for n in range(books):
+        book_id = db.add_book(f"Loadtest Book {n}", str(rng.randint(1800, 2020)))
+        db.add_book_contributor(book_id, rng.choice(people_ids), "author")
+    return db.DB_PATH
+
+
+def _fake_name(rng):
+    first = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 7))).title()
+    last = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))).title()
+    return f"{first} {last}"
+
+
+def serve_in_background(app, host="127.0.0.1", port=0):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server(host, port, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, route, latency, status=None, error=None):
+        self.latencies[route].append(latency)
+        if error is not None:
+            self.errors[route] += 1
+        else:
+            self.statuses[route][status] += 1
+
+    def summary(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        rows = []
+        for route in sorted(self.latencies):
+            samples = sorted(self.latencies[route])
+            statuses = self.statuses[route]
+            rows.append({
+                "route": route,
+                "requests": len(samples),
+                "rps": len(samples) / elapsed if elapsed else 0.0,
+                "p50": _percentile(samples, 50),
+                "p90": _percentile(samples, 90),
+                "p99": _percentile(samples, 99),
+                "max": samples[-1],
+                "ok": sum(n for status, n in statuses.items() if status < 400),
+                "4xx": sum(n for status, n in statuses.items() if 400 <= status < 500),
+                "5xx": sum(n for status, n in statuses.items() if status >= 500),
+                "errors": self.errors[route],
+                "statuses": dict(sorted(statuses.items())),
+            })
+        return {"elapsed": elapsed, "routes": rows}
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, round(pct / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+class Scenarios:
+    """Each scenario is one user action, possibly several requests in a row."""
+
+    def __init__(self, client, results, people, book_ids, rng):
+        self.client = client
+        self.results = results
+        self.people = people
+        self.book_ids = book_ids
+        self.rng = rng
+
+    async def request(self, route, method, url, scheduled=None, **kwargs):
+        # Latency counts from when the action was due, so time spent waiting
+        # for a free slot shows up once the app is saturated
+        start = scheduled if scheduled is not None else time.monotonic()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as exc:
+            self.results.record(route, time.monotonic() - start, error=exc)
+            return None
+        self.results.record(route, time.monotonic() - start, status=response.status_code)
+        return response
+
+    async def browse(self, scheduled):
+        choice = self.rng.random()
+        if choice < 0.2 and self.book_ids:
+            url, route = f"/books/{self.rng.choice(self.book_ids)}", "GET /books/<id>"
+        elif choice < 0.4 and self.people:
+            url, route = f"/people/{self.rng.choice(self.people)[0]}", "GET /people/<id>"
+        else:
+            url = self.rng.choice(BROWSE_PAGES)
+            route = f"GET {url}"
+        await self.request(route, "GET", url, scheduled)
+
+    async def typeahead(self, scheduled):
+        # One keystroke per request, as the person picker fires them
+        name = self._name()
+        for length in range(1, min(len(name), 8) + 1):
+            await self.request("GET /people/search", "GET", "/people/search",
+                               scheduled if length == 1 else None, params={"q": name[:length]})
+            await asyncio.sleep(self.rng.uniform(0.03, 0.12))
+
+    async def preview(self, scheduled):
+        # A fresh name most of the time so the lookup cache does not hide the stub
+        name = self._name() if self.rng.random() < 0.3 else _fake_name(self.rng)
+        headers = {"X-Preview-Client": f"loadtest-{self.rng.randrange(1 << 30)}"}
+        await self.request("GET /wikipedia/preview", "GET", "/wikipedia/preview", scheduled,
+                           params={"name": name}, headers=headers)
+
+    async def cite(self, scheduled):
+        if not self.people or not self.book_ids:
+            return
+        form = {
+            "person_id": str(self.rng.choice(self.people)[0]),
+            "book_id": str(self.rng.choice(self.book_ids)),
+            "page_number": str(self.rng.randint(1, 400)),
+            "notes": "load test",
+        }
+        await self.request("POST /citations/add", "POST", "/citations/add", scheduled, data=form)
+
+    async def lookup(self, scheduled):
+        if self.rng.random() < 0.5:
+            form = {"isbn": f"978{self.rng.randrange(10 ** 10):010d}"}
+        else:
+            form = {"title": f"Loadtest Book {self.rng.randrange(1000)}", "author": self._name()}
+        await self.request("POST /books/lookup", "POST", "/books/lookup", scheduled, data=form)
+
+    def _name(self):
+        return self.rng.choice(self.people)[1] if self.people else _fake_name(self.rng)
+
+
+async def _fetch_catalogue(client):
+    people = [(p["id"], p["name"]) for p in (await client.get("/api/people-list")).json()]
+
+    books = set()
+    since = 0
+    while True:
+        page = (await client.get("/api/changes", params={"since": since, "limit": 1000})).json()
+        for change in page["changes"]:
+            if change["table"] != "books":
+                continue
+            if change["operation"] == "delete":
+                books.discard(change["row_id"])
+            else:
+                books.add(change["row_id"])
+        since = page["next_since"]
+        if not page["has_more"]:
+            break
+    return people, sorted(books)
+
+
+async def _run(base_url, duration, concurrency, rate, mix, seed):
+    rng = random.Random(seed)
+    results = Results()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(60.0)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        people, book_ids = await _fetch_catalogue(client)
+        scenarios = Scenarios(client, results, people, book_ids, rng)
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        slots = asyncio.Semaphore(concurrency)
+        results.started = time.monotonic()
+        deadline = results.started + duration
+
+        async def run_one(action, scheduled):
+            async with slots:
+                await getattr(scenarios, action)(scheduled)
+
+        async def worker():
+            while time.monotonic() < deadline:
+                await getattr(scenarios, rng.choices(names, weights)[0])(None)
+
+        if rate:
+            # Open loop: actions start on a Poisson schedule whether or not
+            # earlier ones have finished, which is what exposes saturation
+            tasks = []
+            next_at = results.started
+            while next_at < deadline:
+                await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+                tasks.append(asyncio.create_task(run_one(rng.choices(names, weights)[0], next_at)))
+                next_at += rng.expovariate(rate)
+            await asyncio.gather(*tasks)
+        else:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    results.finished = time.monotonic()
+    return results
+
+
+def parse_mix(value):
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(DEFAULT_MIX)}.")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run(base_url, duration=30.0, concurrency=16, rate=0.0, mix=None, seed=None):
+    return asyncio.run(_run(base_url, duration, concurrency, rate, mix or dict(DEFAULT_MIX), seed))
+
+
+def format_report(summary, stubs=()):
+    lines = [
+        f"{'route':<26} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+        f"{'ok':>6} {'4xx':>5} {'5xx':>5} {'err':>5}"
+    ]
+    total = 0
+    for row in summary["routes"]:
+        total += row["requests"]
+        lines.append(
+            f"{row['route']:<26} {row['requests']:>7} {row['rps']:>8.1f} "
+            f"{row['p50'] * 1000:>8.1f} {row['p90'] * 1000:>8.1f} {row['p99'] * 1000:>8.1f} {row['max'] * 1000:>8.1f} "
+            f"{row['ok']:>6} {row['4xx']:>5} {row['5xx']:>5} {row['errors']:>5}"
+        )
+        rejected = {status: n for status, n in row["statuses"].items() if status >= 400}
+        if rejected:
+            lines.append(f"{'':<26} statuses: " + ", ".join(f"{status}×{n}" for status, n in rejected.items()))
+    lines.append(f"{total} requests in {summary['elapsed']:.1f}s ({total / summary['elapsed']:.1f} req/s)")
+    for stub in stubs:
+        lines.append(f"{stub.name} stub: {stub.calls} calls, {stub.failures} injected failures")
+    return "\n".join(lines)
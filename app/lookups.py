@@ -0,0 +1,164 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+
+from . import metrics
+
+# External lookups (Wikipedia, Open Library) run inside async views. Each view
+# still holds its worker thread while it awaits, so only a few lookups may be
+# in flight at once; the rest of the pool stays free for DB-only pages.
+# Previews have their own slots so typing in a form cannot starve saves, and a
+# save waits up to SLOT_WAIT for a slot where a preview gives up at once.
+LOOKUP_TIMEOUT = 10.0
+MAX_CONCURRENT_LOOKUPS = 4
+MAX_CONCURRENT_PREVIEWS = 4
+SLOT_WAIT = 3.0
+SLOT_POLL = 0.05
+
+# Identical lookups share one in-flight fetch, and finished results are kept
+# briefly so the save after a preview does not fetch the same page again.
+RECENT_LOOKUP_TTL = 600.0
+RECENT_LOOKUP_SIZE = 1024
+
+# Per-client token bucket for /wikipedia/preview.
+PREVIEW_RATE = 1.0
+PREVIEW_BURST = 10
+
+_lookup_slots = threading.BoundedSemaphore(MAX_CONCURRENT_LOOKUPS)
+_preview_slots = threading.BoundedSemaphore(MAX_CONCURRENT_PREVIEWS)
+_active_previews = {}
+_active_previews_lock = threading.Lock()
+_inflight = {}
+_recent = OrderedDict()
+_coalesce_lock = threading.Lock()
+_preview_buckets = {}
+_preview_buckets_lock = threading.Lock()
+
+
+class LookupUnavailable(Exception):
+    pass
+
+
+class LookupSuperseded(Exception):
+    pass
+
+
+async def _acquire(slots, wait):
+    # Polled rather than blocking, so the view's event loop can still be cancelled
+    deadline = time.monotonic() + wait
+    while not slots.acquire(blocking=False):
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(SLOT_POLL)
+    return True
+
+
+async def run_lookup(coro, timeout=LOOKUP_TIMEOUT, preview=False):
+    slots = _preview_slots if preview else _lookup_slots
+    try:
+        acquired = await _acquire(slots, 0 if preview else SLOT_WAIT)
+    except BaseException:
+        coro.close()
+        raise
+    if not acquired:
+        coro.close()
+        raise LookupUnavailable("Too many external lookups in flight.")
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except (asyncio.TimeoutError, httpx.HTTPError, ValueError) as exc:
+        raise LookupUnavailable(str(exc) or exc.__class__.__name__) from exc
+    finally:
+        slots.release()
+
+
+async def run_preview(client_key, coro):
+    # Every request runs on its own event loop, so a newer preview from the
+    # same client cancels the older one through that loop's thread-safe hook.
+    loop = asyncio.get_running_loop()
+    task = loop.create_task(coro)
+
+    with _active_previews_lock:
+        previous = _active_previews.get(client_key)
+        _active_previews[client_key] = (loop, task)
+
+    if previous:
+        previous_loop, previous_task = previous
+        try:
+            previous_loop.call_soon_threadsafe(previous_task.cancel)
+        except RuntimeError:
+            pass  # the older preview already finished and its loop is closed
+
+    try:
+        return await task
+    except asyncio.CancelledError as exc:
+        raise LookupSuperseded(client_key) from exc
+    finally:
+        with _active_previews_lock:
+            if _active_previews.get(client_key, (None, None))[1] is task:
+                del _active_previews[client_key]
+
+
+def _remember(key, value):
+    _recent[key] = (time.monotonic() + RECENT_LOOKUP_TTL, value)
+    _recent.move_to_end(key)
+    while len(_recent) > RECENT_LOOKUP_SIZE:
+        _recent.popitem(last=False)
+
+
+async def coalesced(key, factory):
+    while True:
+        with _coalesce_lock:
+            hit = _recent.get(key)
+            if hit and hit[0] > time.monotonic():
+                _recent.move_to_end(key)
+                metrics.cache_result("lookups", True)
+                return hit[1]
+            future = _inflight.get(key)
+            if future is None:
+                future = _inflight[key] = concurrent.futures.Future()
+                metrics.cache_result("lookups", False)
+                break
+            metrics.cache_result("lookups", True)
+
+        try:
+            # shield: a follower being cancelled must not cancel the shared fetch
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+            # The leading request was cancelled; retry, possibly as the new leader
+
+    try:
+        value = await factory()
+    except BaseException as exc:
+        with _coalesce_lock:
+            _inflight.pop(key, None)
+        if isinstance(exc, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(exc)
+        raise
+
+    with _coalesce_lock:
+        _inflight.pop(key, None)
+        _remember(key, value)
+    future.set_result(value)
+    return value
+
+
+def allow_preview(client_key):
+    now = time.monotonic()
+    with _preview_buckets_lock:
+        tokens, updated = _preview_buckets.get(client_key, (PREVIEW_BURST, now))
+        tokens = min(PREVIEW_BURST, tokens + (now - updated) * PREVIEW_RATE)
+        allowed = tokens >= 1
+        _preview_buckets[client_key] = (tokens - 1 if allowed else tokens, now)
+        if len(_preview_buckets) > 10000:
+            idle = [key for key, (_, seen) in _preview_buckets.items() if now - seen > PREVIEW_BURST / PREVIEW_RATE]
+            for key in idle:
+                del _preview_buckets[key]
+    return allowed
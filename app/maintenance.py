@@ -0,0 +1,225 @@
+import json
+import random
+import threading
+import time
+
+from . import db
+
+BATCH_SIZE = 1000
+ANALYSIS_LIMIT = 1000
+
+# Rows whose parent is gone. Dependent rows are purged; optional references
+# on people are repaired by clearing them instead.
+ORPHAN_CHECKS = [
+    ("citations without a person", "citations", "id",
+     "NOT EXISTS (SELECT 1 FROM people p WHERE p.id = t.person_id)", None),
+    ("citations without a book", "citations", "id",
+     "NOT EXISTS (SELECT 1 FROM books b WHERE b.id = t.book_id)", None),
+    ("epigraphs without an author", "epigraphs", "id",
+     "NOT EXISTS (SELECT 1 FROM people p WHERE p.id = t.author_id)", None),
+    ("epigraphs without a book", "epigraphs", "id",
+     "NOT EXISTS (SELECT 1 FROM books b WHERE b.id = t.book_id)", None),
+    ("contributors without a person", "book_contributors", "rowid",
+     "NOT EXISTS (SELECT 1 FROM people p WHERE p.id = t.person_id)", None),
+    ("contributors without a book", "book_contributors", "rowid",
+     "NOT EXISTS (SELECT 1 FROM books b WHERE b.id = t.book_id)", None),
+    ("clipping proposals without a person", "clipping_proposals", "id",
+     "NOT EXISTS (SELECT 1 FROM people p WHERE p.id = t.person_id)", None),
+    ("clipping proposals without a book", "clipping_proposals", "id",
+     "NOT EXISTS (SELECT 1 FROM books b WHERE b.id = t.book_id)", None),
+    ("people with a missing type", "people", "id",
+     "t.type_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM person_types pt WHERE pt.id = t.type_id)",
+     "type_id = NULL"),
+    ("people with a missing nationality", "people", "id",
+     "t.nationality_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM nationalities n WHERE n.id = t.nationality_id)",
+     "nationality_id = NULL"),
+]
+
+STEPS = ("orphans", "optimize", "vacuum", "check")
+
+
+def _database_bytes(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count
+
+
+def _free_bytes(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_size * conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def find_orphans():
+    conn = db.get_connection()
+    try:
+        return [
+            (label, conn.execute(f"SELECT COUNT(*) FROM {table} t WHERE {condition}").fetchone()[0])
+            for label, table, _, condition, _ in ORPHAN_CHECKS
+        ]
+    finally:
+        conn.close()
+
+
+def purge_orphans(batch_size=BATCH_SIZE):
+    # Short batches keep each write transaction brief so requests are not held up
+    fixed = []
+    for label, table, key, condition, repair in ORPHAN_CHECKS:
+        total = 0
+        while True:
+            with db.write_transaction() as conn:
+                selection = f"SELECT t.{key} FROM {table} t WHERE {condition} LIMIT ?"
+                if repair:
+                    cursor = conn.execute(f"UPDATE {table} SET {repair} WHERE {key} IN ({selection})", (batch_size,))
+                else:
+                    cursor = conn.execute(f"DELETE FROM {table} WHERE {key} IN ({selection})", (batch_size,))
+                changed = cursor.rowcount
+            total += changed
+            if changed < batch_size:
+                break
+        fixed.append((label, total))
+    return fixed
+
+
+def optimize():
+    with db.write_transaction() as conn:
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone() and conn.execute("SELECT 1 FROM sqlite_stat1 LIMIT 1").fetchone()
+        if has_stats:
+            conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+            conn.execute("PRAGMA optimize")
+            return "PRAGMA optimize"
+        # First run: gather full statistics so optimize has something to refresh
+        conn.execute("ANALYZE")
+        return "ANALYZE"
+
+
+def vacuum(convert=False):
+    conn = db.get_connection()
+    try:
+        before = _database_bytes(conn)
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            if not convert:
+                return "skipped: run `flask maintenance --convert` once to enable incremental auto_vacuum", 0
+            # Databases created before incremental auto_vacuum need one full
+            # VACUUM to switch modes; it rewrites the whole file, so it only runs when asked
+            with db.exclusive_write():
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            detail = "VACUUM (enabled incremental auto_vacuum)"
+        else:
+            with db.exclusive_write():
+                # execute() stops after the first page freed; executescript runs it to completion
+                conn.executescript("PRAGMA incremental_vacuum;")
+            detail = f"incremental_vacuum ({freelist} free pages)"
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return detail, max(before - _database_bytes(conn), 0)
+    finally:
+        conn.close()
+
+
+def quick_check():
+    conn = db.get_connection()
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA quick_check").fetchall()]
+    finally:
+        conn.close()
+    return problems == ["ok"], problems
+
+
+def run_maintenance(steps=STEPS, batch_size=BATCH_SIZE, convert=False):
+    report = []
+
+    def timed(step, action):
+        started = time.perf_counter()
+        detail, reclaimed = action()
+        report.append({
+            "step": step,
+            "seconds": time.perf_counter() - started,
+            "bytes_reclaimed": reclaimed,
+            "detail": detail,
+        })
+
+    def orphans():
+        # Purged rows free whole pages only once they empty out; count those
+        conn = db.get_connection()
+        try:
+            before = _free_bytes(conn)
+            fixed = purge_orphans(batch_size)
+            freed = _free_bytes(conn) - before
+        finally:
+            conn.close()
+        return {label: count for label, count in fixed if count}, max(freed, 0)
+
+    def check():
+        ok, problems = quick_check()
+        return "ok" if ok else problems[:20], 0
+
+    actions = {
+        "orphans": orphans,
+        "optimize": lambda: (optimize(), 0),
+        "vacuum": lambda: vacuum(convert),
+        "check": check,
+    }
+    for step in steps:
+        timed(step, actions[step])
+    return report
+
+
+def _claim_run(interval):
+    # Several worker processes may run the scheduler; the first to claim wins
+    with db.write_transaction() as conn:
+        recent = conn.execute(
+            "SELECT 1 FROM maintenance_runs WHERE started_at > datetime('now', ?)",
+            (f"-{int(interval)} seconds",)
+        ).fetchone()
+        if recent:
+            return None
+        return conn.execute("INSERT INTO maintenance_runs DEFAULT VALUES").lastrowid
+
+
+def record_run(run_id, report):
+    with db.write_transaction() as conn:
+        conn.execute(
+            "UPDATE maintenance_runs SET finished_at = CURRENT_TIMESTAMP, report = ? WHERE id = ?",
+            (json.dumps(report), run_id)
+        )
+
+
+def start_scheduler(interval, logger=None):
+    def loop():
+        while True:
+            # Jitter so several processes started together do not race every time
+            time.sleep(min(interval, 300) * random.uniform(0.5, 1.0))
+            try:
+                run_id = _claim_run(interval)
+                if run_id is None:
+                    continue
+                report = run_maintenance()
+                record_run(run_id, report)
+                if logger:
+                    logger.info("Database maintenance finished: %s", json.dumps(report))
+            except Exception:
+                if logger:
+                    logger.exception("Database maintenance failed")
+
+    thread = threading.Thread(target=loop, name="db-maintenance", daemon=True)
+    thread.start()
+    return thread
+
+
+def init_scheduler(app, interval):
+    # Started by the first request, so only processes that serve traffic run
+    # it: not `flask <command>` runs, and not a preloading parent before it forks
+    started = []
+    started_lock = threading.Lock()
+
+    def start():
+        if started:
+            return
+        with started_lock:
+            if not started:
+                started.append(start_scheduler(interval, app.logger))
+
+    app.before_request(start)
@@ -0,0 +1,303 @@
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask import Response, g, request
+
+# Counters and histograms live in memory per process. When METRICS_DIR is set,
+# every process also writes its totals to METRICS_DIR/metrics-<pid>-<start>.json
+# a few times a minute, and /metrics adds up the files of all workers. The
+# start time keeps a new worker that reuses an exited worker's pid from
+# overwriting its file. Files of exited workers still count towards counters
+# and histograms, so totals never go backwards; their gauges are dropped.
+# Empty the directory on deploy.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+FLUSH_INTERVAL = 5.0
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+EXTERNAL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "referent_http_requests_total": "HTTP requests by endpoint, method and status.",
+    "referent_http_request_duration_seconds": "Time to produce the response headers.",
+    "referent_db_statements_total": "SQLite statements executed, by statement kind.",
+    "referent_db_statement_duration_seconds": "Time spent in SQLite execute calls.",
+    "referent_db_connections_opened_total": "SQLite connections opened.",
+    "referent_db_connections_open": "SQLite connections currently open.",
+    "referent_db_write_transactions_total": "Write transactions, by outcome.",
+    "referent_db_write_lock_wait_seconds_total": "Time spent waiting for the write lock.",
+    "referent_db_write_commits_total": "Commits of write transactions; queued writes share one.",
+    "referent_db_write_busy_timeouts_total": "Writes that gave up waiting for another process's transaction.",
+    "referent_external_requests_total": "Calls to external services, by outcome.",
+    "referent_external_request_duration_seconds": "Latency of calls to external services.",
+    "referent_cache_requests_total": "Cache lookups by cache and result (hit or miss).",
+    "referent_wikipedia_circuit_open": "Worker processes whose Wikipedia circuit breaker is open.",
+}
+
+_lock = threading.Lock()
+_state = {"pid": None, "started": None, "counters": {}, "gauges": {}, "histograms": {}, "flusher": None}
+_collectors = []
+# Gauge changes from finalizers: the garbage collector can run them while this
+# thread already holds _lock, so they are queued without locking and applied
+# at the next snapshot
+_deferred_gauges = deque()
+
+
+def _reset_if_forked():
+    # A worker forked from a parent that already counted must start from zero
+    pid = os.getpid()
+    if _state["pid"] != pid:
+        _state.update(pid=pid, started=time.time_ns(), counters={}, gauges={}, histograms={}, flusher=None)
+        if METRICS_DIR:
+            _start_flusher()
+
+
+def inc(name, labels=(), amount=1.0):
+    with _lock:
+        _reset_if_forked()
+        key = (name, labels)
+        _state["counters"][key] = _state["counters"].get(key, 0.0) + amount
+
+
+def add_gauge(name, labels=(), amount=1.0):
+    with _lock:
+        _reset_if_forked()
+        key = (name, labels)
+        _state["gauges"][key] = _state["gauges"].get(key, 0.0) + amount
+
+
+def add_gauge_deferred(name, labels=(), amount=1.0):
+    """add_gauge for __del__ methods; takes no lock."""
+    _deferred_gauges.append((os.getpid(), (name, labels), amount))
+
+
+def _apply_deferred_gauges():
+    while _deferred_gauges:
+        pid, key, amount = _deferred_gauges.popleft()
+        if pid == _state["pid"]:
+            _state["gauges"][key] = _state["gauges"].get(key, 0.0) + amount
+
+
+def observe(name, labels, value, buckets):
+    with _lock:
+        _reset_if_forked()
+        key = (name, labels)
+        histogram = _state["histograms"].get(key)
+        if histogram is None:
+            histogram = _state["histograms"][key] = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        index = bisect_left(histogram["buckets"], value)
+        if index < len(buckets):
+            histogram["counts"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def cache_result(cache, hit):
+    inc("referent_cache_requests_total", (("cache", cache), ("result", "hit" if hit else "miss")))
+
+
+@contextmanager
+def external_call(service):
+    """Time one call to an external service; the caller may set call["outcome"]."""
+    call = {"outcome": "ok"}
+    started = time.perf_counter()
+    try:
+        yield call
+    except asyncio.CancelledError:
+        call["outcome"] = "cancelled"
+        raise
+    except BaseException:
+        call["outcome"] = "error"
+        raise
+    finally:
+        labels = (("service", service),)
+        observe("referent_external_request_duration_seconds", labels, time.perf_counter() - started, EXTERNAL_BUCKETS)
+        inc("referent_external_requests_total", labels + (("outcome", call["outcome"]),))
+
+
+def add_collector(collector):
+    """Register a function returning (type, name, labels, value) samples read at snapshot time."""
+    _collectors.append(collector)
+
+
+def snapshot():
+    with _lock:
+        _reset_if_forked()
+        _apply_deferred_gauges()
+        counters = dict(_state["counters"])
+        gauges = dict(_state["gauges"])
+        histograms = {key: dict(value, counts=list(value["counts"])) for key, value in _state["histograms"].items()}
+    for collector in _collectors:
+        for kind, name, labels, value in collector():
+            (counters if kind == "counter" else gauges)[(name, labels)] = value
+    return {
+        "pid": os.getpid(),
+        "started": _state["started"],
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "gauges": [[name, list(labels), value] for (name, labels), value in gauges.items()],
+        "histograms": [[name, list(labels), value] for (name, labels), value in histograms.items()],
+    }
+
+
+def flush():
+    directory = Path(METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    data = snapshot()
+    target = directory / f"metrics-{data['pid']}-{data['started']}.json"
+    temporary = target.with_suffix(".tmp")
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, target)
+
+
+def _start_flusher():
+    def loop():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                flush()
+            except OSError:
+                pass
+
+    _state["flusher"] = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+    _state["flusher"].start()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _snapshots():
+    if not METRICS_DIR:
+        return [snapshot()]
+    flush()
+    snapshots = []
+    for path in Path(METRICS_DIR).glob("metrics-*.json"):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # being replaced; the next scrape reads it
+        snapshots.append(data)
+    # Of several files with one pid, only the latest started can be a live process
+    latest = {}
+    for data in snapshots:
+        latest[data["pid"]] = max(latest.get(data["pid"], 0), data.get("started") or 0)
+    for data in snapshots:
+        if (data.get("started") or 0) != latest[data["pid"]] or not _pid_alive(data["pid"]):
+            data["gauges"] = []
+    return snapshots
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render():
+    counters, gauges, histograms = {}, {}, {}
+    for data in _snapshots():
+        for name, labels, value in data["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, value in data["gauges"]:
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0.0) + value
+        for name, labels, value in data["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.get(key)
+            if total is None or total["buckets"] != value["buckets"]:
+                histograms[key] = dict(value, counts=list(value["counts"]))
+                continue
+            total["counts"] = [a + b for a, b in zip(total["counts"], value["counts"])]
+            total["sum"] += value["sum"]
+            total["count"] += value["count"]
+
+    series = [(name, labels, "counter", value) for (name, labels), value in counters.items()]
+    series += [(name, labels, "gauge", value) for (name, labels), value in gauges.items()]
+    series += [(name, labels, "histogram", value) for (name, labels), value in histograms.items()]
+    series.sort(key=lambda item: item[:2])
+
+    lines = []
+    announced = set()
+    for name, labels, kind, value in series:
+        if name not in announced:
+            announced.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+        if kind != "histogram":
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            continue
+        cumulative = 0
+        for bound, count in zip(value["buckets"], value["counts"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {value['count']}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(value['sum'])}")
+        lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _start_timer():
+    g._metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop("_metrics_started", None)
+    if started is not None:
+        endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+        labels = (("endpoint", endpoint), ("method", request.method))
+        observe("referent_http_request_duration_seconds", labels, time.perf_counter() - started, HTTP_BUCKETS)
+        inc("referent_http_requests_total", labels + (("status", str(response.status_code)),))
+    return response
+
+
+def _metrics_view():
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app):
+    from . import db, wikipedia_utils
+
+    def write_stats():
+        stats = db.get_write_stats()
+        return [
+            ("counter", "referent_db_write_transactions_total", (("outcome", "committed"),),
+             stats["transactions"] - stats["failures"]),
+            ("counter", "referent_db_write_transactions_total", (("outcome", "failed"),), stats["failures"]),
+            ("counter", "referent_db_write_lock_wait_seconds_total", (), stats["lock_wait_seconds"]),
+            ("counter", "referent_db_write_commits_total", (), stats["commits"]),
+            ("counter", "referent_db_write_busy_timeouts_total", (), stats["busy_timeouts"]),
+        ]
+
+    def breaker_state():
+        return [("gauge", "referent_wikipedia_circuit_open", (), int(wikipedia_utils.breaker.state() == "open"))]
+
+    add_collector(write_stats)
+    add_collector(breaker_state)
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule("/metrics", endpoint="metrics", view_func=_metrics_view)
+    if METRICS_DIR:
+        atexit.register(flush)
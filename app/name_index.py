@@ -0,0 +1,125 @@
+import csv
+import io
+import re
+import threading
+from collections import OrderedDict
+from itertools import groupby
+from typing import NamedTuple
+
+from . import db, metrics
+
+# Back-of-book index of names: every person cited in a book, alphabetically,
+# with their pages compressed into ranges ("12, 45–47, 103ff"). Indexes are
+# cached per book and rebuilt when the book's citation_versions row moves.
+CACHE_SIZE = 256
+PAGE_PATTERN = re.compile(r"^(\d+)\s*(?:[-–—]\s*(\d+)|(ff?)\.?)?$")
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class NameIndexEntry(NamedTuple):
+    person_id: int
+    name: str
+    pages: str
+    indirect_pages: str
+
+
+def _page_span(page):
+    # (first, last, open-ended) for "12", "45-47", "12f" and "103ff"; None otherwise
+    match = PAGE_PATTERN.match(page)
+    if not match:
+        return None
+    first = int(match.group(1))
+    if match.group(2):
+        return first, max(first, int(match.group(2))), False
+    if match.group(3) == "f":
+        return first, first + 1, False
+    return first, first, match.group(3) == "ff"
+
+
+def compress_pages(pages):
+    """Compress page labels: 12, 45, 46, 47, 103ff -> "12, 45–47, 103ff".
+
+    Labels must arrive in page order (by citations.page_key, as
+    db.load_name_index returns them); ranges are merged in a single pass.
+    Labels that are not page numbers (e.g. roman numerals) follow in order."""
+    spans, others = [], []
+    for page in pages:
+        page = (page or "").strip()
+        span = _page_span(page)
+        if span:
+            spans.append(span)
+        elif page and page not in others:
+            others.append(page)
+
+    merged = []
+    for first, last, open_ended in spans:
+        if merged and first <= merged[-1][1] + 1:
+            previous = merged[-1]
+            merged[-1] = (previous[0], max(previous[1], last), previous[2] or open_ended)
+        else:
+            merged.append((first, last, open_ended))
+
+    parts = []
+    for first, last, open_ended in merged:
+        if open_ended:
+            parts.append(f"{first}ff")
+        elif first == last:
+            parts.append(str(first))
+        else:
+            parts.append(f"{first}–{last}")
+    return ", ".join(parts + others)
+
+
+def _build(rows, names):
+    entries = []
+    # Rows arrive grouped by person, direct citations before indirect ones
+    for person_id, person_rows in groupby(rows, key=lambda row: row[0]):
+        direct, indirect = [], []
+        for _, is_indirect, page in person_rows:
+            (indirect if is_indirect else direct).append(page)
+        entries.append(NameIndexEntry(person_id, names.get(person_id, ""), compress_pages(direct), compress_pages(indirect)))
+    entries.sort(key=lambda entry: (entry.name.casefold(), entry.person_id))
+    return entries
+
+
+def get_name_index(book_id):
+    version = db.get_citation_version(book_id)
+    with _cache_lock:
+        cached = _cache.get(book_id)
+        if cached and cached[0] == version:
+            _cache.move_to_end(book_id)
+            metrics.cache_result("name_index", True)
+            return cached[1]
+    metrics.cache_result("name_index", False)
+
+    version, rows, names = db.load_name_index(book_id)
+    entries = _build(rows, names)
+    with _cache_lock:
+        _cache[book_id] = (version, entries)
+        _cache.move_to_end(book_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return entries
+
+
+def to_text(title, entries):
+    lines = [f"Index of names: {title}", ""]
+    for entry in entries:
+        line = entry.name
+        if entry.pages:
+            line += f", {entry.pages}"
+        if entry.indirect_pages:
+            line += f" (indirectly {entry.indirect_pages})"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def to_csv(entries):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["name", "person_id", "pages", "indirect_pages"])
+    for entry in entries:
+        writer.writerow([entry.name, entry.person_id, entry.pages, entry.indirect_pages])
+    return output.getvalue()
@@ -1,15 +1,44 @@
-import requests
+import os
 
-def get_book_data_from_isbn(isbn):
-    url = f"https://openlibrary.org/api/books"
-    params = {
+import httpx
+
+from . import metrics, openlibrary_mirror
+
+# OPENLIBRARY_URL points lookups at another host, e.g. the load-test stub server
+OPENLIBRARY_URL = os.environ.get("OPENLIBRARY_URL", "https://openlibrary.org").rstrip("/")
+BOOKS_API_URL = f"{OPENLIBRARY_URL}/api/books"
+SEARCH_API_URL = f"{OPENLIBRARY_URL}/search.json"
+
+
+def _isbn_params(isbn):
+    return {
         "bibkeys": f"ISBN:{isbn}",
         "format": "json",
         "jscmd": "data"
     }
 
-    response = requests.get(url, params=params)
-    data = response.json()
+
+def _search_params(title, author):
+    return {
+        "title": title,
+        "author": author,
+        "limit": 5,
+    }
+
+
+async def get_book_data_from_isbn_async(isbn):
+    local = openlibrary_mirror.find_by_isbn(isbn)
+    if local:
+        return local
+
+    with metrics.external_call("openlibrary"):
+        async with httpx.AsyncClient() as client:
+            response = await client.get(BOOKS_API_URL, params=_isbn_params(isbn))
+        data = response.json()
+    return _parse_isbn_response(isbn, data)
+
+
+def _parse_isbn_response(isbn, data):
     key = f"ISBN:{isbn}"
 
     if key not in data:
@@ -29,15 +58,19 @@ def get_book_data_from_isbn(isbn):
         "cover_url": cover_url
     }
     
-def search_books_by_title_and_author(title, author):
-    params = {
-        "title": title,
-        "author": author,
-        "limit": 5,
-    }
-    resp = requests.get("https://openlibrary.org/search.json", params=params)
-    data = resp.json()
+async def search_books_by_title_and_author_async(title, author):
+    local = openlibrary_mirror.search(title, author)
+    if local:
+        return local
+
+    with metrics.external_call("openlibrary"):
+        async with httpx.AsyncClient() as client:
+            resp = await client.get(SEARCH_API_URL, params=_search_params(title, author))
+        data = resp.json()
+    return _parse_search_response(data)
+
 
+def _parse_search_response(data):
     results = []
     for doc in data.get("docs", []):
         isbn_list = doc.get("isbn", [])
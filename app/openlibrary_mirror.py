@@ -0,0 +1,410 @@
+import gzip
+import json
+import re
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+
+from . import metrics
+
+# Compact local copy of the Open Library editions/works/authors dumps
+# (ol_dump_*.txt.gz: type, key, revision, last_modified, JSON per line).
+# It lives in its own file next to the main database.
+MIRROR_PATH = Path("instance/openlibrary.sqlite3")
+BATCH_SIZE = 5000
+# Token frequencies are counted up to this many rows when picking the rarest one
+TOKEN_PROBE_LIMIT = 10000
+# import_state position once a dump has been read to the end
+COMPLETE = -1
+
+STOPWORDS = {"a", "an", "and", "de", "der", "die", "el", "la", "le", "of", "the", "to"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS authors (
+    key TEXT PRIMARY KEY,
+    name TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS work_authors (
+    work_key TEXT NOT NULL,
+    author_key TEXT NOT NULL,
+    PRIMARY KEY (work_key, author_key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS editions (
+    key TEXT PRIMARY KEY,
+    title TEXT,
+    work_key TEXT,
+    publish_date TEXT,
+    isbn TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS edition_authors (
+    edition_key TEXT NOT NULL,
+    author_key TEXT NOT NULL,
+    PRIMARY KEY (edition_key, author_key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS isbns (
+    isbn TEXT NOT NULL,
+    edition_key TEXT NOT NULL,
+    PRIMARY KEY (isbn, edition_key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS title_tokens (
+    token TEXT NOT NULL,
+    edition_key TEXT NOT NULL,
+    PRIMARY KEY (token, edition_key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS author_tokens (
+    token TEXT NOT NULL,
+    author_key TEXT NOT NULL,
+    PRIMARY KEY (token, author_key)
+) WITHOUT ROWID;
+
+-- From a matched author to their editions, directly or through their works
+CREATE INDEX IF NOT EXISTS idx_edition_authors_author ON edition_authors (author_key, edition_key);
+CREATE INDEX IF NOT EXISTS idx_work_authors_author ON work_authors (author_key, work_key);
+CREATE INDEX IF NOT EXISTS idx_editions_work ON editions (work_key);
+
+CREATE TABLE IF NOT EXISTS import_state (
+    dump TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+"""
+
+_readers = threading.local()
+
+
+def normalize_isbn(value):
+    return re.sub(r"[^0-9X]", "", (value or "").upper())
+
+
+def _isbn10_to_13(isbn):
+    if len(isbn) != 10:
+        return None
+    core = "978" + isbn[:9]
+    if not core.isdigit():
+        return None
+    check = (10 - sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(core)) % 10) % 10
+    return core + str(check)
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return [token for token in re.split(r"[^0-9a-z]+", text) if token and token not in STOPWORDS]
+
+
+def _short_key(key):
+    # "/books/OL1M" -> "OL1M"; keys are unique across types, the prefix is redundant
+    return (key or "").rsplit("/", 1)[-1]
+
+
+def _connect(path=None, readonly=False):
+    path = Path(path or MIRROR_PATH)
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return sqlite3.connect(path)
+
+
+def _edition_rows(key, record):
+    title = record.get("title")
+    if record.get("subtitle"):
+        title = f"{title}: {record['subtitle']}"
+    works = record.get("works") or []
+    work_key = _short_key(works[0].get("key")) if works else None
+
+    isbns = set()
+    for value in record.get("isbn_13", []) + record.get("isbn_10", []):
+        isbn = normalize_isbn(value)
+        if isbn:
+            isbns.add(isbn)
+            converted = _isbn10_to_13(isbn)
+            if converted:
+                isbns.add(converted)
+
+    primary_isbn = next(iter(sorted(isbns, key=len, reverse=True)), None)
+    authors = [_short_key(a.get("key")) for a in record.get("authors", []) if a.get("key")]
+    return (
+        (key, title, work_key, record.get("publish_date"), primary_isbn),
+        [(key, author_key) for author_key in authors],
+        [(isbn, key) for isbn in isbns],
+        [(token, key) for token in set(tokenize(title))],
+    )
+
+
+def _dump_key(dump_path):
+    # Dumps are republished under fixed names (ol_dump_editions_latest.txt.gz), so
+    # progress is kept per download: a new file at the same path starts over
+    stat = dump_path.stat()
+    return f"{dump_path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _forget_dump(conn, dump_name, keep=None):
+    conn.execute(
+        "DELETE FROM import_state WHERE (dump = ? OR substr(dump, 1, ?) = ?) AND dump IS NOT ?",
+        (dump_name, len(dump_name) + 1, f"{dump_name}:", keep)
+    )
+
+
+def _index_author_names(conn):
+    # Mirrors imported before author_tokens existed get it built from their authors once
+    if conn.execute("SELECT 1 FROM author_tokens LIMIT 1").fetchone():
+        return
+    rows = conn.execute("SELECT key, name FROM authors")
+    with conn:
+        while True:
+            authors = rows.fetchmany(BATCH_SIZE)
+            if not authors:
+                break
+            conn.executemany(
+                "INSERT OR IGNORE INTO author_tokens (token, author_key) VALUES (?, ?)",
+                [(token, key) for key, name in authors for token in set(tokenize(name))]
+            )
+
+
+def import_dump(dump_path, mirror_path=None, progress=None):
+    dump_path = Path(dump_path)
+    conn = _connect(mirror_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(SCHEMA)
+
+    _index_author_names(conn)
+    dump_key = _dump_key(dump_path)
+    with conn:
+        _forget_dump(conn, dump_path.name, keep=dump_key)
+    row = conn.execute("SELECT position FROM import_state WHERE dump = ?", (dump_key,)).fetchone()
+    position = row[0] if row else 0
+    if position == COMPLETE:
+        conn.close()
+        return 0
+
+    opener = gzip.open if dump_path.suffix == ".gz" else open
+    batch = _new_batch()
+    count = 0
+    try:
+        with opener(dump_path, "rb") as stream:
+            # Resume after the last committed batch; each batch commits its offset with its rows.
+            # A gzip stream cannot seek directly, so resuming decompresses up to the offset again.
+            stream.seek(position)
+            for line in stream:
+                _add_record(batch, line)
+                if batch["size"] >= BATCH_SIZE:
+                    count += _flush(conn, batch, dump_key, stream.tell())
+                    if progress:
+                        progress(count)
+            count += _flush(conn, batch, dump_key, COMPLETE)
+    finally:
+        conn.close()
+    return count
+
+
+def reset_progress(dump_path, mirror_path=None):
+    path = Path(mirror_path or MIRROR_PATH)
+    if not path.exists():
+        return
+    conn = _connect(path)
+    try:
+        with conn:
+            _forget_dump(conn, Path(dump_path).name)
+    except sqlite3.OperationalError:
+        pass
+    finally:
+        conn.close()
+
+
+def _new_batch():
+    return {
+        "size": 0, "authors": [], "author_tokens": [], "work_authors": [], "editions": [], "edition_authors": [],
+        "isbns": [], "tokens": [],
+    }
+
+
+def _add_record(batch, line):
+    parts = line.rstrip(b"\n").split(b"\t", 4)
+    if len(parts) != 5:
+        return
+    record_type = parts[0].decode()
+    key = _short_key(parts[1].decode())
+    record = json.loads(parts[4])
+
+    if record_type == "/type/author":
+        batch["authors"].append((key, record.get("name")))
+        batch["author_tokens"].extend((token, key) for token in set(tokenize(record.get("name"))))
+    elif record_type == "/type/work":
+        for entry in record.get("authors", []):
+            author_key = _short_key((entry.get("author") or {}).get("key"))
+            if author_key:
+                batch["work_authors"].append((key, author_key))
+    elif record_type == "/type/edition":
+        edition, authors, isbns, tokens = _edition_rows(key, record)
+        batch["editions"].append(edition)
+        batch["edition_authors"].extend(authors)
+        batch["isbns"].extend(isbns)
+        batch["tokens"].extend(tokens)
+    else:
+        return
+    batch["size"] += 1
+
+
+def _flush(conn, batch, dump_key, position):
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO authors (key, name) VALUES (?, ?)", batch["authors"])
+        conn.executemany("INSERT OR IGNORE INTO author_tokens (token, author_key) VALUES (?, ?)", batch["author_tokens"])
+        conn.executemany("INSERT OR IGNORE INTO work_authors (work_key, author_key) VALUES (?, ?)", batch["work_authors"])
+        conn.executemany(
+            "INSERT OR REPLACE INTO editions (key, title, work_key, publish_date, isbn) VALUES (?, ?, ?, ?, ?)",
+            batch["editions"]
+        )
+        conn.executemany("INSERT OR IGNORE INTO edition_authors (edition_key, author_key) VALUES (?, ?)", batch["edition_authors"])
+        conn.executemany("INSERT OR IGNORE INTO isbns (isbn, edition_key) VALUES (?, ?)", batch["isbns"])
+        conn.executemany("INSERT OR IGNORE INTO title_tokens (token, edition_key) VALUES (?, ?)", batch["tokens"])
+        conn.execute(
+            "INSERT INTO import_state (dump, position) VALUES (?, ?) ON CONFLICT (dump) DO UPDATE SET position = excluded.position",
+            (dump_key, position)
+        )
+    written = batch["size"]
+    batch.update(_new_batch())
+    return written
+
+
+def _reader(path):
+    connections = getattr(_readers, "connections", None)
+    if connections is None:
+        connections = _readers.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = _connect(path, readonly=True)
+    return conn
+
+
+def _author_names(cursor, edition_key, work_key):
+    cursor.execute("""
+        SELECT a.name
+        FROM edition_authors ea
+        JOIN authors a ON a.key = ea.author_key
+        WHERE ea.edition_key = ?
+    """, (edition_key,))
+    names = [row[0] for row in cursor.fetchall() if row[0]]
+    if names or not work_key:
+        return names
+    cursor.execute("""
+        SELECT a.name
+        FROM work_authors wa
+        JOIN authors a ON a.key = wa.author_key
+        WHERE wa.work_key = ?
+    """, (work_key,))
+    return [row[0] for row in cursor.fetchall() if row[0]]
+
+
+def _book(cursor, edition_key, title, work_key, publish_date, isbn):
+    return {
+        "title": title,
+        "authors": _author_names(cursor, edition_key, work_key),
+        "publication_year": publish_date,
+        "isbn": isbn,
+        "cover_url": f"https://covers.openlibrary.org/b/isbn/{isbn}-L.jpg" if isbn else None,
+    }
+
+
+def _open_mirror(mirror_path):
+    path = Path(mirror_path or MIRROR_PATH)
+    if not path.exists():
+        return None
+    return _reader(path).cursor()
+
+
+def find_by_isbn(isbn, mirror_path=None):
+    cursor = _open_mirror(mirror_path)
+    isbn = normalize_isbn(isbn)
+    if cursor is None or not isbn:
+        return None
+    try:
+        cursor.execute("""
+            SELECT e.key, e.title, e.work_key, e.publish_date
+            FROM isbns i
+            JOIN editions e ON e.key = i.edition_key
+            WHERE i.isbn = ?
+            LIMIT 1
+        """, (isbn,))
+        row = cursor.fetchone()
+        metrics.cache_result("openlibrary_mirror", row is not None)
+        if not row:
+            return None
+        edition_key, title, work_key, publish_date = row
+        return _book(cursor, edition_key, title, work_key, publish_date, isbn)
+    except sqlite3.OperationalError:
+        return None
+
+
+def _rarest(cursor, table, tokens):
+    counts = [
+        (cursor.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE token = ? LIMIT ?)",
+                        (token, TOKEN_PROBE_LIMIT)).fetchone()[0], token)
+        for token in tokens
+    ]
+    return min(counts)[1]
+
+
+def search(title, author, limit=5, mirror_path=None):
+    """Editions whose title has every title word and whose author (of the edition
+    or of its work) has every author word, all matched in SQL before the limit."""
+    cursor = _open_mirror(mirror_path)
+    title_tokens = sorted(set(tokenize(title)))
+    author_tokens = sorted(set(tokenize(author)))
+    if cursor is None or not title_tokens:
+        return []
+
+    title_check = ", ".join("?" for _ in title_tokens)
+    try:
+        if author_tokens:
+            # Matching authors come from the rarest author word's posting list; the
+            # other words and the title are primary-key lookups per candidate
+            driver = _rarest(cursor, "author_tokens", author_tokens)
+            others = [token for token in author_tokens if token != driver]
+            author_check = "".join(
+                " AND EXISTS (SELECT 1 FROM author_tokens o WHERE o.token = ? AND o.author_key = a.author_key)"
+                for _ in others
+            )
+            cursor.execute(f"""
+                WITH matched_authors AS (
+                    SELECT a.author_key FROM author_tokens a WHERE a.token = ?{author_check}
+                ),
+                candidates AS (
+                    SELECT ea.edition_key
+                    FROM matched_authors m
+                    JOIN edition_authors ea ON ea.author_key = m.author_key
+                    UNION
+                    SELECT e.key
+                    FROM matched_authors m
+                    JOIN work_authors wa ON wa.author_key = m.author_key
+                    JOIN editions e ON e.work_key = wa.work_key
+                )
+                SELECT e.key, e.title, e.work_key, e.publish_date, e.isbn
+                FROM candidates c
+                JOIN editions e ON e.key = c.edition_key
+                WHERE (SELECT COUNT(*) FROM title_tokens t
+                       WHERE t.edition_key = c.edition_key AND t.token IN ({title_check})) = ?
+                LIMIT ?
+            """, (driver, *others, *title_tokens, len(title_tokens), limit))
+        else:
+            driver = _rarest(cursor, "title_tokens", title_tokens)
+            cursor.execute(f"""
+                SELECT e.key, e.title, e.work_key, e.publish_date, e.isbn
+                FROM title_tokens d
+                JOIN editions e ON e.key = d.edition_key
+                WHERE d.token = ?
+                  AND (SELECT COUNT(*) FROM title_tokens t
+                       WHERE t.edition_key = d.edition_key AND t.token IN ({title_check})) = ?
+                LIMIT ?
+            """, (driver, *title_tokens, len(title_tokens), limit))
+        results = [_book(cursor, *row) for row in cursor.fetchall()]
+        metrics.cache_result("openlibrary_mirror", bool(results))
+        return results
+    except sqlite3.OperationalError:
+        return []
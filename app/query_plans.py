@@ -0,0 +1,164 @@
+import random
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+from . import db
+
+# EXPLAIN QUERY PLAN regression checks for the queries in db.py, run by
+# `flask check-query-plans`. A scratch database is filled with a realistic
+# spread of rows and analyzed, then every check calls db.py functions on it
+# while each statement they execute is explained on the same connection.
+# A statement fails when it reads a whole table the check does not expect it
+# to, sorts in a temp B-tree where index order is expected, or makes SQLite
+# build an automatic index because a real one is missing.
+BOOKS = 2000
+PEOPLE = 5000
+CITATIONS = 60000
+EPIGRAPHS = 3000
+SKIPPED_KINDS = {"begin", "commit", "rollback", "pragma", "create", "drop", "analyze", "savepoint", "release"}
+
+
+class Check(NamedTuple):
+    label: str
+    run: Callable
+    # Tables (by alias where the query uses one) that may be read in full
+    scans: frozenset = frozenset()
+    # Whether a temp B-tree sort is acceptable, e.g. ordering by a joined table's column
+    sorts: bool = False
+
+
+CHECKS = [
+    Check("book list", lambda: list(db.iter_books()), frozenset({"b"})),
+    Check("open books", lambda: db.get_books(include_completed=False), frozenset({"b"})),
+    Check("book page", lambda: db.load_book_page(1)),
+    Check("book", lambda: db.get_book_by_id(1)),
+    Check("book contributors", lambda: db.get_book_contributors(1)),
+    Check("index of names", lambda: db.load_name_index(1)),
+    Check("people list", lambda: list(db.iter_people()), frozenset({"people"})),
+    Check("people search", lambda: db.get_people("p 1"), frozenset({"people"})),
+    Check("person page", lambda: db.load_person_page(1)),
+    Check("person", lambda: db.get_person_by_id(1)),
+    Check("citations by person", lambda: db.get_citations_by_person(1)),
+    Check("epigraphs by person", lambda: db.get_epigraphs_by_person(1)),
+    Check("person by name", lambda: (db.person_exists("Person 2"), db.get_or_create_person("person 2"))),
+    Check("person types", db.get_person_types, frozenset({"person_types"})),
+    Check("nationalities", db.get_nationalities, frozenset({"nationalities"})),
+    Check("person names", db.get_person_names, frozenset({"people"})),
+    Check("citation list", lambda: list(db.iter_citations()), frozenset({"c"})),
+    Check("citation", lambda: db.get_citation_by_id(1)),
+    Check("epigraph list", lambda: list(db.iter_epigraphs()), frozenset({"b", "e"}), sorts=True),
+    Check("epigraph", lambda: db.get_epigraph_by_id(1)),
+    Check("similar books", lambda: db.get_similar_books(1), sorts=True),
+    Check("change feed", lambda: db.get_changes(100, 50)),
+    Check("statistics", db.get_citation_statistics, frozenset({"citation_stats", "s", "monthly", "recent_months"}), sorts=True),
+    Check("clipping review", lambda: db.get_clipping_review(), sorts=True),
+    Check("add citation", lambda: db.add_citation(1, 1, "12", False)),
+    Check("edit citation", lambda: db.update_citation(1, 2, 1, "13", False, None)),
+    Check("edit person", lambda: db.update_person(3, "Person 3 renamed", 1, 1, None, None, None)),
+    Check("edit contributors", lambda: (db.add_book_contributor(1, 4, "translator"),
+                                        db.remove_book_contributor(1, 4, "translator"))),
+    Check("propose and accept clippings", lambda: (db.add_clipping_proposals([(2, 5, "77", "excerpt")]),
+                                                   db.resolve_clipping_proposals(True, book_id=2))),
+    Check("merge people", lambda: db.merge_people([(6, [7, 8])]), frozenset({"merge_map"})),
+    Check("delete person", lambda: db.delete_person(9)),
+    Check("delete epigraph", lambda: db.delete_epigraph(2)),
+]
+
+
+def populate(path, seed=0):
+    """Create a scratch database at path with a catalogue-sized spread of rows."""
+    rng = random.Random(seed)
+    db.DB_PATH = Path(path)
+    db.init_db()
+    months = [f"{year}-{month:02d}-15 12:00:00" for year in (2024, 2025) for month in range(1, 13)]
+    with db.write_transaction() as conn:
+        conn.executemany("INSERT INTO person_types (name) VALUES (?)", [(f"Type {n}",) for n in range(20)])
+        conn.executemany("INSERT INTO nationalities (name) VALUES (?)", [(f"Nationality {n}",) for n in range(60)])
+        conn.executemany(
+            "INSERT INTO books (title, publication_year, is_complete) VALUES (?, ?, ?)",
+            [(f"Book {n}", str(rng.randint(1800, 2024)), int(rng.random() < 0.3)) for n in range(1, BOOKS + 1)]
+        )
+        conn.executemany(
+            "INSERT INTO people (name, type_id, nationality_id, birth_year, death_year) VALUES (?, ?, ?, ?, ?)",
+            [
+                (f"Person {n}", rng.randint(1, 20), rng.randint(1, 60), year, year + rng.randint(20, 90))
+                for n in range(1, PEOPLE + 1)
+                for year in [rng.randint(-500, 1950)]
+            ]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO book_contributors (book_id, person_id, role) VALUES (?, ?, ?)",
+            [(book_id, rng.randint(1, PEOPLE), role) for book_id in range(1, BOOKS + 1) for role in ("author", "translator")]
+        )
+        # Popular people are cited far more often than the rest, as in a real catalogue
+        conn.executemany(
+            "INSERT INTO citations (person_id, book_id, page_number, indirect_citation, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (min(int(rng.paretovariate(1.2)), PEOPLE), rng.randint(1, BOOKS), str(rng.randint(1, 400)),
+                 int(rng.random() < 0.2), created, created)
+                for _ in range(CITATIONS)
+                for created in [rng.choice(months)]
+            ]
+        )
+        conn.executemany(
+            "INSERT INTO epigraphs (book_id, author_id, quote, created_at) VALUES (?, ?, ?, ?)",
+            [(rng.randint(1, BOOKS), rng.randint(1, PEOPLE), "Quote", rng.choice(months)) for _ in range(EPIGRAPHS)]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO book_similarities (book_id, similar_book_id, score, shared_people, metric) "
+            "VALUES (?, ?, ?, ?, 'cosine')",
+            [(book_id, rng.randint(1, BOOKS), rng.random(), rng.randint(1, 20)) for book_id in range(1, BOOKS + 1) for _ in range(5)]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO clipping_proposals (book_id, person_id, page_number, excerpt) VALUES (?, ?, ?, 'Excerpt')",
+            [(rng.randint(1, 50), rng.randint(1, PEOPLE), str(rng.randint(1, 400))) for _ in range(2000)]
+        )
+    # Plans are judged with planner statistics, as `flask maintenance` keeps them
+    with db.write_transaction() as conn:
+        conn.execute("ANALYZE")
+
+
+def _problems(check, plan):
+    problems = []
+    for detail in plan:
+        if "AUTOMATIC" in detail:
+            problems.append(detail)
+        elif detail.startswith("SCAN ") and not detail.startswith("SCAN (") and "VIRTUAL TABLE" not in detail \
+                and detail != "SCAN CONSTANT ROW":
+            if detail.split()[1] not in check.scans:
+                problems.append(detail)
+        elif detail.startswith("USE TEMP B-TREE") and not check.sorts:
+            problems.append(detail)
+    return problems
+
+
+def run_checks(checks=CHECKS):
+    """Yield (check, statements) with each statement as (sql, plan lines, problems)."""
+    statements = []
+
+    def observe(conn, sql, parameters):
+        kind = sql.lstrip()[:10].split(None, 1)[0].lower() if sql.strip() else ""
+        if kind in SKIPPED_KINDS:
+            return
+        cursor = sqlite3.Cursor(conn)
+        cursor.row_factory = None
+        plan = [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+        statements.append((" ".join(sql.split()), plan))
+
+    for cache in db._cache_registry.values():
+        cache["entries"].clear()
+    db._plan_observer = observe
+    try:
+        for check in checks:
+            statements.clear()
+            check.run()
+            yield check, [(sql, plan, _problems(check, plan)) for sql, plan in statements]
+    finally:
+        db._plan_observer = None
+
+
+def scratch_path():
+    return Path(tempfile.mkdtemp(prefix="referent-query-plans-")) / "referent.sqlite3"
@@ -1,15 +1,22 @@
+import io
 import sqlite3
-from collections import defaultdict
 from urllib.parse import urlparse, unquote
 
 from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify, abort, flash
-from . import db
-from .wikipedia_utils import get_wikipedia_info 
-from .open_library_utils import get_book_data_from_isbn, search_books_by_title_and_author
+from flask import (
+    Blueprint, Response, render_template, stream_template, request, redirect, url_for, jsonify, abort, flash,
+    get_flashed_messages,
+)
+from . import clippings, db, name_index
+from .lookups import LookupSuperseded, LookupUnavailable, allow_preview, coalesced, run_lookup, run_preview
+from .wikipedia_index import normalize_title
+from .wikipedia_utils import get_wikipedia_info_async
+from .open_library_utils import get_book_data_from_isbn_async, search_books_by_title_and_author_async
 
 bp = Blueprint("main", __name__)
 
+STREAM_CHUNK_SIZE = 16 * 1024
+
 
 def _parse_names_field(raw_value):
     if not raw_value:
@@ -62,6 +69,17 @@ def _normalize_era(value):
     return "BC" if value == "BC" else "AD"
 
 
+def _century_label(century, era):
+    if century is None:
+        return "Unknown"
+    if 10 <= century % 100 <= 20:
+        suffix = "th"
+    else:
+        suffix = {1: "st", 2: "nd", 3: "rd"}.get(century % 10, "th")
+    label = f"{century}{suffix} century"
+    return f"{label} BC" if _normalize_era(era) == "BC" else label
+
+
 def _to_common_era_year(year, era):
     if year is None:
         return None
@@ -75,6 +93,43 @@ def _to_common_era_year(year, era):
     return year_int
 
 
+def _stream_page(template_name, **context):
+    # Flashes are popped from the session here, before the headers and the
+    # session cookie go out; base.html then reads the cached copy mid-stream
+    get_flashed_messages()
+    pieces = stream_template(template_name, **context)
+    snapshot = db.snapshot_in_use()
+
+    def chunks():
+        # The body streams after the request's teardown; keep reading the snapshot it was pinned to
+        db.read_from_snapshot(snapshot)
+        buffer, size = [], 0
+        for piece in pieces:
+            buffer.append(piece)
+            size += len(piece)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+
+    return Response(chunks(), mimetype="text/html")
+
+
+def _wikipedia_lookup(name, preview=False):
+    title = normalize_title(name)
+    return coalesced(("wikipedia", title), lambda: run_lookup(get_wikipedia_info_async(title), preview=preview))
+
+
+async def _fetch_wikipedia_info(name):
+    """Return (url, bio, birth, death) and a warning to show when Wikipedia could not be asked."""
+    try:
+        return await _wikipedia_lookup(name), None
+    except LookupUnavailable:
+        warning = f"Wikipedia could not be reached, so no bio or life dates were fetched for {name}. Try editing the person later."
+        return (None, None, None, None), warning
+
+
 def _update_contributors(book_id, names, role, default_type):
     desired_ids = set()
     for name in names:
@@ -98,8 +153,7 @@ def index():
 # -------- BOOKS --------
 @bp.route("/books")
 def books():
-    all_books = db.get_books()
-    return render_template("books.html", books=all_books)
+    return _stream_page("books.html", books=db.iter_books())
 
 
 @bp.route("/books/add", methods=["GET", "POST"])
@@ -131,13 +185,13 @@ def edit_book(book_id):
         abort(404)
 
     book = {
-        "id": book_row[0],
-        "title": book_row[1],
-        "publication_year": book_row[2] or "",
-        "isbn": book_row[3] or "",
-        "authors": book_row[4] or "",
-        "translators": book_row[5] or "",
-        "is_complete": bool(book_row[6]),
+        "id": book_row.id,
+        "title": book_row.title,
+        "publication_year": book_row.publication_year or "",
+        "isbn": book_row.isbn or "",
+        "authors": book_row.authors or "",
+        "translators": book_row.translators or "",
+        "is_complete": bool(book_row.is_complete),
     }
 
     if request.method == "POST":
@@ -161,7 +215,7 @@ def edit_book(book_id):
     return render_template("edit_book.html", book=book)
 
 @bp.route("/books/lookup", methods=["GET", "POST"])
-def book_lookup():
+async def book_lookup():
     results = []
 
     if request.method == "POST":
@@ -169,44 +223,83 @@ def book_lookup():
         author = request.form.get("author", "")
         isbn = request.form.get("isbn", "").replace("-", "").strip()
 
-        if isbn:
-            book = get_book_data_from_isbn(isbn)
-            if book:
-                results = [book]
-        elif title and author:
-            results = search_books_by_title_and_author(title, author)
+        try:
+            if isbn:
+                book = await run_lookup(get_book_data_from_isbn_async(isbn))
+                if book:
+                    results = [book]
+            elif title and author:
+                results = await run_lookup(search_books_by_title_and_author_async(title, author))
+        except LookupUnavailable:
+            flash("Open Library is not responding right now. Please try again shortly.", "warning")
 
     return render_template("book_lookup.html", results=results)
 
 @bp.route("/books/<int:book_id>")
 def view_book(book_id):
+    page = db.load_book_page(book_id)
+    if not page:
+        abort(404)
+
+    return render_template("view_book.html", **page)
+
+@bp.route("/books/<int:book_id>/index-of-names")
+def book_name_index(book_id):
     book = db.get_book_by_id(book_id)
-    citations = db.get_citations_by_book(book_id)
-    epigraphs = db.get_epigraphs_by_book(book_id)
-    contributor_rows = db.get_book_contributors(book_id)
-    contributors = defaultdict(list)
-    for role, person_id, name in contributor_rows:
-        contributors[role].append((person_id, name))
+    if not book:
+        abort(404)
+
+    entries = name_index.get_name_index(book_id)
+    export = request.args.get("format")
+    if export in ("csv", "txt"):
+        body = name_index.to_csv(entries) if export == "csv" else name_index.to_text(book.title, entries)
+        return Response(
+            body,
+            mimetype="text/csv" if export == "csv" else "text/plain",
+            headers={"Content-Disposition": f'attachment; filename="index-of-names-{book_id}.{export}"'},
+        )
+    return render_template("name_index.html", book=book, entries=entries)
+
+# -------- STATISTICS --------
+@bp.route("/statistics")
+def statistics():
+    stats = db.get_citation_statistics()
+
+    def century_sort_key(row):
+        century, era = row[0], _normalize_era(row[1])
+        if century is None:
+            return (2, 0)
+        return (0, -century) if era == "BC" else (1, century)
+
+    by_century = [
+        (_century_label(century, era), total, indirect)
+        for century, era, total, indirect in sorted(stats["by_century"], key=century_sort_key)
+    ]
+
+    top_people_by_month = []
+    for month, person_id, name, total in stats["top_people_by_month"]:
+        if not top_people_by_month or top_people_by_month[-1][0] != month:
+            top_people_by_month.append((month, []))
+        top_people_by_month[-1][1].append((person_id, name, total))
 
     return render_template(
-        "view_book.html",
-        book=book,
-        citations=citations,
-        epigraphs=epigraphs,
-        contributors=contributors
+        "statistics.html",
+        stats=stats,
+        by_century=by_century,
+        top_people_by_month=top_people_by_month
     )
 
+
 # -------- PEOPLE --------
 @bp.route("/people")
 def people():
     raw_query = request.args.get("q", "")
     search_term = raw_query.strip()
-    all_people = db.get_people(search_term or None)
-    return render_template("people.html", people=all_people, search_query=raw_query)
+    return _stream_page("people.html", people=db.iter_people(search_term or None), search_query=raw_query)
 
 
 @bp.route("/people/add", methods=["GET", "POST"])
-def add_person():
+async def add_person():
     person_types = db.get_person_types()
     nationalities = db.get_nationalities()
 
@@ -237,7 +330,9 @@ def add_person():
         if not redirect_to or redirect_to.lower() == "none":
             redirect_to = url_for("main.people")
 
-        wiki_url, bio, wiki_birth, wiki_death = get_wikipedia_info(name)
+        (wiki_url, bio, wiki_birth, wiki_death), warning = await _fetch_wikipedia_info(name)
+        if warning:
+            flash(warning, "warning")
         birth_year = birth_year if birth_year is not None else wiki_birth
         death_year = death_year if death_year is not None else wiki_death
         person_id = db.add_person(
@@ -269,7 +364,7 @@ def add_person():
     )
 
 @bp.route("/people/inline-add", methods=["POST"])
-def inline_add_person():
+async def inline_add_person():
     data = request.json
     name = data.get("name")
     type_id = data.get("type_id")
@@ -311,7 +406,7 @@ def inline_add_person():
     if not nationality_id and new_nationality_name:
         nationality_id = db.add_nationality(new_nationality_name)
 
-    wiki_url, bio, wiki_birth, wiki_death = get_wikipedia_info(name)
+    (wiki_url, bio, wiki_birth, wiki_death), warning = await _fetch_wikipedia_info(name)
     birth_year = birth_year if birth_year is not None else wiki_birth
     death_year = death_year if death_year is not None else wiki_death
     person_id = db.add_person(
@@ -327,35 +422,29 @@ def inline_add_person():
         death_year_era=death_year_era,
     )
 
-    return {"id": person_id, "name": name}
+    return {"id": person_id, "name": name, "warning": warning}
 
 @bp.route("/people/search")
 def search_people():
     query = request.args.get("q", "").lower()
     matches = []
     for p in db.get_people():
-        if query in p[1].lower():
-            matches.append({"id": p[0], "text": p[1]})
+        if query in p.name.lower():
+            matches.append({"id": p.id, "text": p.name})
     return jsonify(matches)
 
 
 @bp.route("/people/<int:person_id>")
 def view_person(person_id):
-    person = db.get_person_by_id(person_id)
-    if not person:
+    page = db.load_person_page(person_id)
+    if not page:
         abort(404)
 
-    citations = db.get_citations_by_person(person_id)
-    epigraphs = db.get_epigraphs_by_person(person_id)
-    contribution_rows = db.get_book_contributions_by_person(person_id)
-    contributions = defaultdict(list)
-    for role, book_id, title in contribution_rows:
-        contributions[role].append((book_id, title))
-
-    birth_year = person[5]
-    death_year = person[6]
-    birth_year_era = person[11]
-    death_year_era = person[12]
+    person = page["person"]
+    birth_year = person.birth_year
+    death_year = person.death_year
+    birth_year_era = person.birth_year_era
+    death_year_era = person.death_year_era
     age = None
     age_label = None
     current_year = datetime.now().year
@@ -375,10 +464,7 @@ def view_person(person_id):
 
     return render_template(
         "view_person.html",
-        person=person,
-        citations=citations,
-        epigraphs=epigraphs,
-        contributions=contributions,
+        **page,
         age=age,
         age_label=age_label,
         birth_year_era=birth_year_era,
@@ -387,7 +473,7 @@ def view_person(person_id):
 
 # -------- EDIT PERSON --------
 @bp.route("/people/edit/<int:person_id>", methods=["GET", "POST"])
-def edit_person(person_id):
+async def edit_person(person_id):
     person_types = db.get_person_types()
     nationalities = db.get_nationalities()
     person = db.get_person_by_id(person_id)
@@ -407,14 +493,16 @@ def edit_person(person_id):
         birth_year_era = _normalize_era(request.form.get("birth_year_era"))
         death_year_era = _normalize_era(request.form.get("death_year_era"))
 
-        existing_url = person[3] or None
+        existing_url = person.wiki_url or None
         wiki_url = wiki_url_input
-        bio_summary = person[4]
+        bio_summary = person.bio_summary
 
         if wiki_url != existing_url:
             search_term = _extract_wikipedia_title(wiki_url)
             if search_term:
-                fetched_url, fetched_summary, _, _ = get_wikipedia_info(search_term)
+                (fetched_url, fetched_summary, _, _), warning = await _fetch_wikipedia_info(search_term)
+                if warning:
+                    flash(warning, "warning")
                 wiki_url = fetched_url or wiki_url
                 bio_summary = fetched_summary
             else:
@@ -453,8 +541,7 @@ def delete_person(person_id):
 # -------- CITATIONS --------
 @bp.route("/citations")
 def citations():
-    all_citations = db.get_citations()
-    return render_template("citations.html", citations=all_citations)
+    return _stream_page("citations.html", citations=db.iter_citations())
 
 
 @bp.route("/citations/add", methods=["GET", "POST"])
@@ -478,7 +565,7 @@ def add_citation():
             return redirect(url_for("main.add_citation", book_id=book_id))
         return redirect(url_for("main.citations"))
 
-    if preselected_book_id and preselected_book_id not in {book[0] for book in books}:
+    if preselected_book_id and preselected_book_id not in {book.id for book in books}:
         preselected_book_id = None
 
     return render_template(
@@ -501,7 +588,7 @@ def citations_for_person(person_id):
 @bp.route("/citations/edit/<int:citation_id>", methods=["GET", "POST"])
 def edit_citation(citation_id):
     citation = db.get_citation_by_id(citation_id)
-    books = db.get_books(include_completed=False, ensure_ids=[citation[2]])
+    books = db.get_books(include_completed=False, ensure_ids=[citation.book_id])
     people = db.get_people()
 
     if request.method == "POST":
@@ -517,11 +604,49 @@ def edit_citation(citation_id):
     return render_template("edit_citation.html", citation=citation, books=books, people=people)
 
 
+# -------- CLIPPING IMPORTS --------
+@bp.route("/imports/clippings", methods=["GET", "POST"])
+def import_clippings():
+    if request.method == "POST":
+        upload = request.files.get("clippings")
+        if not upload or not upload.filename:
+            flash("Choose a clippings file to import.", "warning")
+            return redirect(url_for("main.import_clippings"))
+        # Werkzeug spools large uploads to disk; the importer reads them line by line
+        summary = clippings.import_clippings(io.TextIOWrapper(upload.stream, encoding="utf-8-sig", errors="replace"))
+        flash(
+            f"Read {summary['clippings']} clippings: {summary['matched']} of {summary['highlights']} highlights "
+            f"matched a book and {summary['added']} new citations were proposed.",
+            "success"
+        )
+        if summary["unmatched_titles"]:
+            titles = ", ".join(title for title, _ in summary["unmatched_titles"][:5])
+            more = len(summary["unmatched_titles"]) - 5
+            flash(f"No open book matched: {titles}" + (f" and {more} more." if more > 0 else "."), "warning")
+        return redirect(url_for("main.import_clippings"))
+
+    books, book_id, proposals = db.get_clipping_review(request.args.get("book_id", type=int))
+    return render_template("clippings.html", books=books, book_id=book_id, proposals=proposals)
+
+
+@bp.route("/imports/clippings/review", methods=["POST"])
+def review_clippings():
+    # action is accept/reject for the ticked proposals, or accept_book/reject_book for all of the book's
+    action = request.form.get("action", "")
+    book_id = request.form.get("book_id", type=int)
+    accept = action.startswith("accept")
+    if action.endswith("_book"):
+        resolved = db.resolve_clipping_proposals(accept, book_id=book_id)
+    else:
+        resolved = db.resolve_clipping_proposals(accept, proposal_ids=request.form.getlist("proposal_id", type=int))
+    flash(f"{'Accepted' if accept else 'Rejected'} {resolved} proposed citations.", "success")
+    return redirect(url_for("main.import_clippings", book_id=book_id))
+
+
 # -------- EPIGRAPHS --------
 @bp.route("/epigraphs")
 def epigraphs():
-    all_epigraphs = db.get_epigraphs()
-    return render_template("epigraphs.html", epigraphs=all_epigraphs)
+    return _stream_page("epigraphs.html", epigraphs=db.iter_epigraphs())
 
 
 @bp.route("/epigraphs/add", methods=["GET", "POST"])
@@ -550,7 +675,7 @@ def add_epigraph():
     if selected_book_id is None:
         selected_book_id = preselected_book_id
 
-    if selected_book_id and selected_book_id not in {book[0] for book in books}:
+    if selected_book_id and selected_book_id not in {book.id for book in books}:
         selected_book_id = None
 
     quote_value = request.form.get("quote") if request.method == "POST" else ""
@@ -573,11 +698,11 @@ def edit_epigraph(epigraph_id):
     if not epigraph:
         abort(404)
 
-    books = db.get_books(include_completed=False, ensure_ids=[epigraph[1]])
+    books = db.get_books(include_completed=False, ensure_ids=[epigraph.book_id])
     person_types = db.get_person_types()
     nationalities = db.get_nationalities()
-    author = db.get_person_by_id(epigraph[2])
-    author_name = author[1] if author else ""
+    author = db.get_person_by_id(epigraph.author_id)
+    author_name = author.name if author else ""
 
     if request.method == "POST":
         book_id = request.form.get("book_id")
@@ -596,10 +721,10 @@ def edit_epigraph(epigraph_id):
 
     selected_book_id = request.form.get("book_id", type=int)
     if selected_book_id is None:
-        selected_book_id = epigraph[1]
+        selected_book_id = epigraph.book_id
 
-    quote_value = request.form.get("quote") if request.method == "POST" else epigraph[3]
-    notes_value = request.form.get("notes") if request.method == "POST" else (epigraph[4] or "")
+    quote_value = request.form.get("quote") if request.method == "POST" else epigraph.quote
+    notes_value = request.form.get("notes") if request.method == "POST" else (epigraph.notes or "")
 
     return render_template(
         "edit_epigraph.html",
@@ -670,12 +795,22 @@ def manage_nationalities():
     return render_template("nationalities.html", nationalities=nationalities)
 
 @bp.route("/wikipedia/preview")
-def wikipedia_preview():
+async def wikipedia_preview():
     name = request.args.get("name")
+    empty = {"summary": None, "url": None, "birth_year": None, "death_year": None}
     if not name:
-        return {"summary": None, "url": None, "birth_year": None, "death_year": None}
+        return empty
+
+    if not allow_preview(request.remote_addr):
+        return empty, 429
 
-    url, summary, birth_year, death_year = get_wikipedia_info(name)
+    client_key = request.headers.get("X-Preview-Client") or request.remote_addr
+    try:
+        url, summary, birth_year, death_year = await run_preview(client_key, _wikipedia_lookup(name, preview=True))
+    except LookupSuperseded:
+        return {**empty, "superseded": True}, 409
+    except LookupUnavailable:
+        return empty, 503
     return {
         "summary": summary,
         "url": url,
@@ -686,4 +821,61 @@ def wikipedia_preview():
 @bp.route('/api/people-list')
 def people_list():
     results = db.get_people()
-    return jsonify([{"id": p[0], "name": p[1]} for p in results])
+    return jsonify([{"id": p.id, "name": p.name} for p in results])
+
+
+@bp.route('/api/people/merge', methods=["POST"])
+def merge_people():
+    # {"merges": [{"target": 12, "sources": [31, 47]}, ...]}, applied in one transaction
+    data = request.get_json(silent=True) or {}
+    try:
+        merges = [
+            (int(item["target"]), [int(source) for source in item["sources"]])
+            for item in data.get("merges", [])
+        ]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Each merge needs an integer target and a list of integer sources."}), 400
+
+    try:
+        moved = db.merge_people(merges)
+    except db.MergeError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"merged": moved["people"], "moved": moved})
+
+
+@bp.route('/api/changes')
+def changes():
+    since = max(request.args.get("since", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 500, type=int), 1), 1000)
+    rows, has_more, latest_seq = db.get_changes(since, limit)
+    return jsonify({
+        "changes": [
+            {
+                "seq": seq,
+                "table": table_name,
+                "row_id": row_id,
+                "related_id": related_id,
+                "operation": operation,
+                "changed_at": changed_at,
+            }
+            for seq, table_name, row_id, related_id, operation, changed_at in rows
+        ],
+        "next_since": rows[-1][0] if rows else since,
+        "has_more": has_more,
+        "latest_seq": latest_seq,
+    })
+
+
+@bp.route('/api/write-stats')
+def write_stats():
+    return jsonify(db.get_write_stats())
+
+
+@bp.app_errorhandler(db.WriteBusy)
+def write_busy(exc):
+    return "The database is busy with another write. Please try again in a moment.", 503, {"Retry-After": "5"}
+
+
+@bp.route('/api/cache-stats')
+def cache_stats():
+    return jsonify(db.get_cache_stats())
@@ -0,0 +1,158 @@
+from typing import NamedTuple, Optional
+
+# Row types returned by db.py. They are tuples underneath, so they take no
+# more memory than the plain rows and positional unpacking keeps working,
+# but views and templates read them by field name.
+
+
+class Contributor(NamedTuple):
+    person_id: int
+    name: str
+
+
+class Contribution(NamedTuple):
+    book_id: int
+    title: str
+
+
+class Book(NamedTuple):
+    id: int
+    title: str
+    publication_year: Optional[str]
+    isbn: Optional[str]
+    authors: list
+    translators: list
+    citation_count: int
+    epigraph_count: int
+    is_complete: int
+
+
+class BookDetail(NamedTuple):
+    id: int
+    title: str
+    publication_year: Optional[str]
+    isbn: Optional[str]
+    authors: Optional[str]
+    translators: Optional[str]
+    is_complete: int
+
+
+class Person(NamedTuple):
+    id: int
+    name: str
+    type: Optional[str]
+    wiki_url: Optional[str]
+    citation_count: int
+    epigraph_count: int
+    birth_year: Optional[int]
+    death_year: Optional[int]
+    birth_year_era: str
+    death_year_era: str
+    nationality: Optional[str]
+
+
+class PersonDetail(NamedTuple):
+    id: int
+    name: str
+    type_id: Optional[int]
+    wiki_url: Optional[str]
+    bio_summary: Optional[str]
+    birth_year: Optional[int]
+    death_year: Optional[int]
+    notes: Optional[str]
+    type_name: Optional[str]
+    nationality_id: Optional[int]
+    nationality_name: Optional[str]
+    birth_year_era: str
+    death_year_era: str
+
+
+class Citation(NamedTuple):
+    id: int
+    person_name: str
+    book_title: str
+    page_number: Optional[str]
+    book_id: int
+    notes: Optional[str]
+    indirect_citation: int
+
+
+class BookCitation(NamedTuple):
+    id: int
+    person_name: str
+    page_number: Optional[str]
+    person_id: int
+    notes: Optional[str]
+    indirect_citation: int
+
+
+class CitationRecord(NamedTuple):
+    id: int
+    person_id: int
+    book_id: int
+    page_number: Optional[str]
+    notes: Optional[str]
+    indirect_citation: int
+
+
+class Epigraph(NamedTuple):
+    id: int
+    book_id: int
+    book_title: str
+    person_id: int
+    person_name: str
+    quote: str
+    notes: Optional[str]
+    created_at: Optional[str]
+
+
+class BookEpigraph(NamedTuple):
+    id: int
+    quote: str
+    notes: Optional[str]
+    person_name: str
+    person_id: int
+    created_at: Optional[str]
+
+
+class PersonEpigraph(NamedTuple):
+    id: int
+    quote: str
+    notes: Optional[str]
+    book_title: str
+    book_id: int
+    created_at: Optional[str]
+
+
+class EpigraphRecord(NamedTuple):
+    id: int
+    book_id: int
+    author_id: int
+    quote: str
+    notes: Optional[str]
+
+
+class SimilarBook(NamedTuple):
+    id: int
+    title: str
+    score: float
+    shared_people: int
+
+
+class ClippingProposal(NamedTuple):
+    id: int
+    person_id: int
+    person_name: str
+    page_number: str
+    excerpt: Optional[str]
+
+
+def factory(row_type):
+    # Skips NamedTuple's keyword-checking __new__: sqlite3 already hands over
+    # a tuple of the right length, so build the row straight from it
+    new = tuple.__new__
+
+    def make(cursor, row):
+        return new(row_type, row)
+
+    return make
@@ -0,0 +1,141 @@
+import json
+
+from . import db
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional: `flask refresh-similarities` needs numpy and scipy
+    np = sparse = None
+
+# "Books with similar references": books are rows of a sparse book x person
+# incidence matrix built from citations, and one sparse product gives the
+# number of people every pair of books shares. The top-k neighbours of each
+# book are stored in book_similarities. Later refreshes recompute only the
+# books whose citations changed, the books sharing people with them, and the
+# books that listed them as neighbours.
+TOP_K = 10
+METRICS = ("cosine", "jaccard")
+BLOCK_SIZE = 2000
+FETCH_SIZE = 100_000
+
+
+def _incidence(cursor):
+    cursor.execute("SELECT DISTINCT book_id, person_id FROM citations")
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.int64))
+    pairs = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+
+    book_ids, book_rows = np.unique(pairs[:, 0], return_inverse=True)
+    person_ids, person_columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int32), (book_rows, person_columns)),
+        shape=(len(book_ids), len(person_ids)),
+    )
+    return book_ids, matrix
+
+
+def _scores(shared, own_degree, other_degrees, metric):
+    if metric == "jaccard":
+        return shared / (own_degree + other_degrees - shared)
+    return shared / np.sqrt(own_degree * other_degrees)
+
+
+def _neighbours(matrix, book_ids, rows, top_k, metric, progress=None):
+    degrees = np.diff(matrix.indptr).astype(np.float64)
+    transposed = matrix.T.tocsr()
+    results = []
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = rows[start:start + BLOCK_SIZE]
+        # shared[i, j] = people cited in both book block[i] and book j
+        shared = (matrix[block] @ transposed).tocsr()
+        for offset, row in enumerate(block):
+            begin, end = shared.indptr[offset], shared.indptr[offset + 1]
+            others = shared.indices[begin:end]
+            counts = shared.data[begin:end].astype(np.float64)
+            keep = others != row
+            others, counts = others[keep], counts[keep]
+            if not len(others):
+                continue
+            scores = _scores(counts, degrees[row], degrees[others], metric)
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                others, counts, scores = others[best], counts[best], scores[best]
+            order = np.lexsort((book_ids[others], -counts, -scores))
+            book_id = int(book_ids[row])
+            results.extend(
+                (book_id, int(book_ids[others[i]]), round(float(scores[i]), 6), int(counts[i]), metric)
+                for i in order
+            )
+        if progress:
+            progress(min(start + BLOCK_SIZE, len(rows)), len(rows))
+    return results
+
+
+def refresh(top_k=TOP_K, metric="cosine", full=False, progress=None):
+    if np is None:
+        raise RuntimeError("numpy and scipy are not installed; run `pip install numpy scipy` first.")
+
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        stored = cursor.execute("SELECT metric FROM book_similarities LIMIT 1").fetchone()
+        if stored and stored[0] != metric:
+            full = True
+        # Books whose citations predate citation_versions count as version 0
+        versions = dict(cursor.execute("""
+            SELECT book_id, version FROM citation_versions
+            UNION ALL
+            SELECT DISTINCT book_id, 0 FROM citations
+            WHERE book_id NOT IN (SELECT book_id FROM citation_versions)
+        """).fetchall())
+        seen = dict(cursor.execute("SELECT book_id, version FROM similarity_versions").fetchall())
+        changed = {book_id for book_id, version in versions.items() if seen.get(book_id) != version}
+        if not full and not changed:
+            return {"books": 0, "pairs": 0, "changed": 0}
+
+        book_ids, matrix = _incidence(cursor)
+        if full:
+            rows = np.arange(len(book_ids))
+        else:
+            listing = cursor.execute(
+                "SELECT DISTINCT book_id FROM book_similarities WHERE similar_book_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(sorted(changed)),)
+            ).fetchall()
+            changed_rows = np.flatnonzero(np.isin(book_ids, sorted(changed)))
+            sharing = (matrix @ matrix[changed_rows].T).tocsr()
+            rows = np.union1d(
+                np.union1d(changed_rows, np.flatnonzero(np.diff(sharing.indptr))),
+                np.flatnonzero(np.isin(book_ids, [row[0] for row in listing])),
+            )
+    finally:
+        conn.rollback()
+        conn.close()
+
+    results = _neighbours(matrix, book_ids, rows, top_k, metric, progress)
+    recomputed = sorted(set(int(book_id) for book_id in book_ids[rows]) | changed)
+    with db.write_transaction() as conn:
+        if full:
+            conn.execute("DELETE FROM book_similarities")
+            conn.execute("DELETE FROM similarity_versions")
+        else:
+            conn.execute(
+                "DELETE FROM book_similarities WHERE book_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(recomputed),)
+            )
+        conn.executemany(
+            "INSERT INTO book_similarities (book_id, similar_book_id, score, shared_people, metric) VALUES (?, ?, ?, ?, ?)",
+            results
+        )
+        # The versions read with the matrix: later writes still count as changes next time
+        conn.executemany(
+            "INSERT INTO similarity_versions (book_id, version) VALUES (?, ?) "
+            "ON CONFLICT (book_id) DO UPDATE SET version = excluded.version",
+            [(book_id, versions[book_id]) for book_id in (versions if full else changed)]
+        )
+    return {"books": len(recomputed), "pairs": len(results), "changed": len(changed)}
@@ -0,0 +1,193 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from flask import request
+
+from . import db
+
+# Read-only replica mode. A snapshot is a consistent copy of the primary
+# database taken with SQLite's online backup, written to a new file that is
+# never modified afterwards, so workers can open it with immutable=1 and read
+# it without taking any locks. CURRENT names the snapshot being served and is
+# swapped with an atomic rename: requests already reading an older snapshot
+# finish on it, new requests pick up the new one. A streamed page opens new
+# connections to its snapshot until the last chunk is sent, in whichever
+# worker process served it, so an older snapshot stays on disk until it has
+# been superseded for RETAIN_SECONDS, well past the longest request.
+SNAPSHOT_DIR = Path(os.environ.get("SNAPSHOT_DIR", "instance/snapshots"))
+SNAPSHOT_READS = os.environ.get("SNAPSHOT_READS", "").lower() in ("1", "true", "yes")
+POINTER_NAME = "CURRENT"
+KEEP = 3
+RETAIN_SECONDS = float(os.environ.get("SNAPSHOT_RETAIN_SECONDS", 600))
+# A client that has just written reads the primary for this long, so it sees its own changes
+STICKY_SECONDS = float(os.environ.get("SNAPSHOT_STICKY_SECONDS", 60))
+STICKY_COOKIE = "referent_primary"
+
+# GET endpoints that may be served from a snapshot. Forms that edit a row read the primary.
+READ_ENDPOINTS = {
+    "main.index",
+    "main.books",
+    "main.view_book",
+    "main.book_name_index",
+    "main.statistics",
+    "main.people",
+    "main.search_people",
+    "main.view_person",
+    "main.citations",
+    "main.citations_for_person",
+    "main.epigraphs",
+    "main.people_list",
+}
+
+_current = {"stamp": None, "pointer": None}
+_current_lock = threading.Lock()
+
+
+def _source_signature():
+    # Any commit touches the database or its WAL; a checkpoint only costs an extra snapshot
+    signature = []
+    for suffix in ("", "-wal"):
+        try:
+            stat = os.stat(f"{db.DB_PATH}{suffix}")
+            signature += [stat.st_mtime_ns, stat.st_size]
+        except FileNotFoundError:
+            signature += [0, 0]
+    return signature
+
+
+def _read_pointer():
+    try:
+        return json.loads((SNAPSHOT_DIR / POINTER_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def current_snapshot():
+    """Path of the snapshot being served, or None; re-reads CURRENT only when it changes."""
+    pointer_path = SNAPSHOT_DIR / POINTER_NAME
+    try:
+        stat = pointer_path.stat()
+    except FileNotFoundError:
+        return None
+    # Every publish renames a new file into place, so the inode changes even within one mtime tick
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+    with _current_lock:
+        if _current["stamp"] != stamp:
+            _current.update(stamp=stamp, pointer=_read_pointer())
+        pointer = _current["pointer"]
+    return SNAPSHOT_DIR / pointer["file"] if pointer else None
+
+
+def take_snapshot(force=False):
+    """Copy the primary into a new snapshot and publish it; None if nothing changed."""
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    signature = _source_signature()
+    pointer = _read_pointer()
+    if not force and pointer and pointer["source"] == signature:
+        return None
+
+    started = time.perf_counter()
+    name = f"referent-{time.time_ns()}.sqlite3"
+    temporary = SNAPSHOT_DIR / f".{name}.{os.getpid()}.tmp"
+    source = db.get_connection()
+    target = sqlite3.connect(temporary)
+    try:
+        # One backup step copies every page inside a single read transaction;
+        # in WAL mode writers carry on meanwhile
+        source.backup(target)
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+    os.replace(temporary, SNAPSHOT_DIR / name)
+
+    pointer = {"file": name, "source": signature, "created_at": time.time()}
+    pointer_temporary = SNAPSHOT_DIR / f".{POINTER_NAME}.{os.getpid()}.tmp"
+    pointer_temporary.write_text(json.dumps(pointer))
+    os.replace(pointer_temporary, SNAPSHOT_DIR / POINTER_NAME)
+    _prune()
+    return {"file": name, "bytes": (SNAPSHOT_DIR / name).stat().st_size, "seconds": time.perf_counter() - started}
+
+
+def _taken_at(path):
+    # Names are referent-<time_ns>.sqlite3, so they also sort by age
+    return int(path.name[len("referent-"):-len(".sqlite3")]) / 1e9
+
+
+def _prune(now=None):
+    now = time.time() if now is None else now
+    snapshots = sorted(SNAPSHOT_DIR.glob("referent-*.sqlite3"), key=_taken_at)
+    # A snapshot was superseded when the next one was taken; the newest KEEP always stay
+    for path, successor in zip(snapshots[:-KEEP], snapshots[1:]):
+        if now - _taken_at(successor) > RETAIN_SECONDS:
+            path.unlink(missing_ok=True)
+
+
+def init_refresher(app, interval):
+    # Started by the first request, like the maintenance scheduler, so only
+    # processes that serve traffic copy the database
+    started = []
+    started_lock = threading.Lock()
+
+    def start():
+        if started:
+            return
+        with started_lock:
+            if not started:
+                started.append(start_refresher(interval, app.logger))
+
+    app.before_request(start)
+
+
+def start_refresher(interval, logger=None):
+    def loop():
+        while True:
+            # Jitter so several processes started together do not all copy at once
+            time.sleep(interval * random.uniform(0.8, 1.2))
+            try:
+                taken = take_snapshot()
+                if taken and logger:
+                    logger.info("Published snapshot %s (%d bytes in %.2fs)", taken["file"], taken["bytes"], taken["seconds"])
+            except Exception:
+                if logger:
+                    logger.exception("Snapshot refresh failed")
+
+    thread = threading.Thread(target=loop, name="db-snapshots", daemon=True)
+    thread.start()
+    return thread
+
+
+def _choose_database():
+    if request.method != "GET" or request.endpoint not in READ_ENDPOINTS:
+        return
+    try:
+        if float(request.cookies.get(STICKY_COOKIE, 0)) > time.time():
+            return
+    except ValueError:
+        pass
+    # Pinned for the whole request, so every read in it sees the same snapshot
+    path = current_snapshot()
+    if path:
+        db.read_from_snapshot(path)
+
+
+def _mark_writer(response):
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        until = time.time() + STICKY_SECONDS
+        response.set_cookie(STICKY_COOKIE, str(int(until)), max_age=int(STICKY_SECONDS), httponly=True, samesite="Lax")
+    return response
+
+
+def _release_snapshot(exc=None):
+    db.read_from_snapshot(None)
+
+
+def init_snapshots(app):
+    app.before_request(_choose_database)
+    app.after_request(_mark_writer)
+    app.teardown_request(_release_snapshot)
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import db
+
+# `flask export-site` renders the public pages through the app itself, so the
+# static copy is byte-for-byte what the app would serve. Only pages whose rows
+# changed since the last export are rendered again: the change_log says which
+# rows changed, and per-page row counts catch deletions the log cannot place.
+MANIFEST = "manifest.json"
+LIST_PAGES = ["/", "/books", "/people", "/citations", "/epigraphs", "/statistics"]
+CHUNK_SIZE = 200
+
+_worker = {}
+
+
+def page_file(path):
+    # /books/12 is written as books/12/index.html so the same URL works on the CDN
+    return (path.strip("/") + "/index.html").lstrip("/")
+
+
+def _templates_hash(app):
+    digest = hashlib.sha256()
+    for template in sorted(Path(app.root_path, app.template_folder).rglob("*.html")):
+        digest.update(template.name.encode())
+        digest.update(template.read_bytes())
+    return digest.hexdigest()
+
+
+def _load_manifest(output_dir):
+    try:
+        return json.loads((output_dir / MANIFEST).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def _linked_people(cursor, book_ids):
+    cursor.execute("""
+        SELECT person_id FROM book_contributors WHERE book_id IN (SELECT value FROM json_each(?1))
+        UNION SELECT person_id FROM citations WHERE book_id IN (SELECT value FROM json_each(?1))
+        UNION SELECT author_id FROM epigraphs WHERE book_id IN (SELECT value FROM json_each(?1))
+    """, (json.dumps(sorted(book_ids)),))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _linked_books(cursor, person_ids):
+    cursor.execute("""
+        SELECT book_id FROM book_contributors WHERE person_id IN (SELECT value FROM json_each(?1))
+        UNION SELECT book_id FROM citations WHERE person_id IN (SELECT value FROM json_each(?1))
+        UNION SELECT book_id FROM epigraphs WHERE author_id IN (SELECT value FROM json_each(?1))
+    """, (json.dumps(sorted(person_ids)),))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _changed_pages(cursor, since):
+    # Titles and names appear on the pages of everything linked to them, so a
+    # changed book or person dirties its neighbours; a citation, epigraph or
+    # contributor row only touches the two pages it joins, and an edit that
+    # moves it touches the two it joined before as well
+    renamed_books, renamed_people, book_ids, person_ids = set(), set(), set(), set()
+    cursor.execute("SELECT table_name, row_id, related_id, old_values, new_values FROM change_log WHERE seq > ?", (since,))
+    citation_ids, epigraph_ids = [], []
+    for table, row_id, related_id, old_values, new_values in cursor.fetchall():
+        if old_values or new_values:
+            for values in (old_values, new_values):
+                values = json.loads(values or "{}")
+                book_ids.add(values.get("book_id"))
+                person_ids.add(values.get("person_id"))
+            continue
+        if table == "books":
+            renamed_books.add(row_id)
+        elif table == "people":
+            renamed_people.add(row_id)
+        elif table == "book_contributors":
+            book_ids.add(row_id)
+            person_ids.add(related_id)
+        elif table == "citations":
+            citation_ids.append(row_id)
+        elif table == "epigraphs":
+            epigraph_ids.append(row_id)
+
+    for table, person_column, ids in (
+        ("citations", "person_id", citation_ids),
+        ("epigraphs", "author_id", epigraph_ids),
+    ):
+        if ids:
+            cursor.execute(
+                f"SELECT book_id, {person_column} FROM {table} WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(ids),)
+            )
+            for book_id, person_id in cursor.fetchall():
+                book_ids.add(book_id)
+                person_ids.add(person_id)
+
+    if renamed_books:
+        person_ids |= _linked_people(cursor, renamed_books)
+    if renamed_people:
+        book_ids |= _linked_books(cursor, renamed_people)
+    book_ids.discard(None)
+    person_ids.discard(None)
+    return book_ids | renamed_books, person_ids | renamed_people
+
+
+def _row_counts(cursor):
+    cursor.execute("""
+        SELECT '/books/' || book_id, COUNT(*) FROM (
+            SELECT book_id FROM citations
+            UNION ALL SELECT book_id FROM epigraphs
+            UNION ALL SELECT book_id FROM book_contributors
+        ) GROUP BY book_id
+    """)
+    counts = dict(cursor.fetchall())
+    cursor.execute("""
+        SELECT '/people/' || person_id, COUNT(*) FROM (
+            SELECT person_id FROM citations
+            UNION ALL SELECT author_id FROM epigraphs
+            UNION ALL SELECT person_id FROM book_contributors
+        ) GROUP BY person_id
+    """)
+    counts.update(cursor.fetchall())
+    return counts
+
+
+def plan_export(app, output_dir, full=False):
+    """Return (pages to render, pages to remove, row counts, change seq, templates hash)."""
+    manifest = _load_manifest(output_dir)
+    templates = _templates_hash(app)
+    if manifest is None or manifest.get("templates") != templates:
+        full = True
+
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+        seq = cursor.fetchone()[0]
+        cursor.execute("SELECT id FROM books")
+        books = {f"/books/{row[0]}" for row in cursor.fetchall()}
+        cursor.execute("SELECT id FROM people")
+        people = {f"/people/{row[0]}" for row in cursor.fetchall()}
+        counts = _row_counts(cursor)
+        if full:
+            changed_books, changed_people = set(), set()
+        else:
+            changed_books, changed_people = _changed_pages(cursor, manifest["seq"])
+
+    current = books | people
+    if full:
+        render = set(current)
+    else:
+        pages = manifest["pages"]
+        render = {f"/books/{book_id}" for book_id in changed_books}
+        render |= {f"/people/{person_id}" for person_id in changed_people}
+        render |= {path for path in current if path not in pages or pages[path].get("rows") != counts.get(path, 0)}
+        render &= current
+    removed = set() if manifest is None else set(manifest["pages"]) - current - set(LIST_PAGES)
+
+    if full or render or removed or seq != manifest["seq"]:
+        render |= set(LIST_PAGES)
+    return sorted(render), sorted(removed), counts, seq, templates
+
+
+def _write_if_changed(target, body, previous_sha):
+    sha = hashlib.sha256(body).hexdigest()
+    # Unchanged output keeps its mtime, so a CDN sync uploads nothing for it
+    if sha != previous_sha or not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temporary = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        temporary.write_bytes(body)
+        os.replace(temporary, target)
+        return sha, True
+    return sha, False
+
+
+def _render_chunk(client, output_dir, chunk):
+    results = []
+    for path, previous_sha in chunk:
+        response = client.get(path)
+        if response.status_code != 200:
+            results.append((path, None, False, response.status_code))
+            continue
+        sha, written = _write_if_changed(output_dir / page_file(path), response.get_data(), previous_sha)
+        results.append((path, sha, written, 200))
+    return results
+
+
+def _with_progress(batches, progress, total):
+    done = 0
+    for batch in batches:
+        done += len(batch)
+        if progress:
+            progress(done, total)
+        yield batch
+
+
+def _render_client():
+    from . import create_app
+
+    # Rendering pages must not start the maintenance scheduler or snapshot refresher
+    return create_app(background=False).test_client()
+
+
+def _init_worker(output_dir):
+    _worker["client"] = _render_client()
+    _worker["output_dir"] = Path(output_dir)
+
+
+def _render_in_worker(chunk):
+    return _render_chunk(_worker["client"], _worker["output_dir"], chunk)
+
+
+def copy_static(app, output_dir):
+    shutil.copytree(app.static_folder, output_dir / "static", dirs_exist_ok=True)
+
+
+def export_site(app, output_dir, full=False, workers=None, progress=None):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    render, removed, counts, seq, templates = plan_export(app, output_dir, full)
+    manifest = _load_manifest(output_dir) or {}
+    pages = {} if manifest.get("templates") != templates else manifest.get("pages", {})
+
+    for path in removed:
+        target = output_dir / page_file(path)
+        target.unlink(missing_ok=True)
+        pages.pop(path, None)
+
+    chunks = [
+        [(path, pages.get(path, {}).get("sha256")) for path in render[start:start + CHUNK_SIZE]]
+        for start in range(0, len(render), CHUNK_SIZE)
+    ]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(chunks) > 1:
+        # Each process builds its own app and database connections
+        with ProcessPoolExecutor(min(workers, len(chunks)), initializer=_init_worker, initargs=(str(output_dir),)) as pool:
+            batches = list(_with_progress(pool.map(_render_in_worker, chunks), progress, len(render)))
+    else:
+        client = _render_client()
+        batches = list(_with_progress((_render_chunk(client, output_dir, chunk) for chunk in chunks), progress, len(render)))
+
+    rendered = written = 0
+    for path, sha, was_written, status in (result for batch in batches for result in batch):
+        rendered += 1
+        if status != 200:
+            (output_dir / page_file(path)).unlink(missing_ok=True)
+            pages.pop(path, None)
+            continue
+        pages[path] = {"file": page_file(path), "sha256": sha, "rows": counts.get(path, 0)}
+        written += was_written
+
+    copy_static(app, output_dir)
+    manifest = {
+        "seq": seq,
+        "templates": templates,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "pages": dict(sorted(pages.items())),
+    }
+    temporary = output_dir / f".{MANIFEST}.tmp"
+    temporary.write_text(json.dumps(manifest, indent=1))
+    os.replace(temporary, output_dir / MANIFEST)
+    return {"rendered": rendered, "written": written, "removed": len(removed), "pages": len(pages), "seq": seq}
@@ -0,0 +1,146 @@
+import bz2
+import gzip
+import json
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from . import metrics
+
+# Local title -> summary table built from a Wikipedia abstracts dump
+# (enwiki-*-abstract.xml[.gz]) or a JSON-lines page-summary dump. It lives in
+# its own file so it can be rebuilt or shipped to a replica independently.
+INDEX_PATH = Path("instance/wikipedia_abstracts.sqlite3")
+BATCH_SIZE = 5000
+
+_readers = threading.local()
+
+
+def normalize_title(name):
+    # MediaWiki treats underscores as spaces and ignores the case of the first letter
+    title = " ".join((name or "").replace("_", " ").split())
+    return title[:1].upper() + title[1:]
+
+
+def _open_dump(path):
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    if path.suffix == ".bz2":
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def _iter_abstract_xml(stream):
+    context = ET.iterparse(stream, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end" or elem.tag != "doc":
+            continue
+        title = elem.findtext("title") or ""
+        if title.startswith("Wikipedia: "):
+            title = title[len("Wikipedia: "):]
+        yield title, elem.findtext("url"), elem.findtext("abstract")
+        # Drop finished <doc> elements so memory stays flat across the dump
+        root.clear()
+
+
+def _iter_summary_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        url = record.get("url") or (
+            record.get("content_urls", {}).get("desktop", {}).get("page")
+        )
+        yield record.get("title"), url, record.get("extract") or record.get("abstract")
+
+
+def iter_dump(path):
+    with _open_dump(path) as stream:
+        first = stream.peek(1)[:1] if hasattr(stream, "peek") else b""
+        records = _iter_summary_jsonl(stream) if first == b"{" else _iter_abstract_xml(stream)
+        yield from records
+
+
+def _connect(path=None, readonly=False):
+    path = Path(path or INDEX_PATH)
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return sqlite3.connect(path)
+
+
+def build_index(dump_path, index_path=None, progress=None):
+    from .wikipedia_utils import extract_years_from_parenthesis
+
+    conn = _connect(index_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS abstracts (
+            title TEXT PRIMARY KEY,
+            url TEXT,
+            summary TEXT,
+            birth_year INTEGER,
+            death_year INTEGER
+        ) WITHOUT ROWID
+    """)
+
+    count = 0
+    batch = []
+    try:
+        for title, url, summary in iter_dump(dump_path):
+            title = normalize_title(title)
+            if not title or not summary:
+                continue
+            summary = summary.strip()
+            birth_year, death_year = extract_years_from_parenthesis(summary)
+            batch.append((title, url, summary, birth_year, death_year))
+            if len(batch) >= BATCH_SIZE:
+                count += _flush(conn, batch)
+                if progress:
+                    progress(count)
+        count += _flush(conn, batch)
+    finally:
+        conn.close()
+    return count
+
+
+def _flush(conn, batch):
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO abstracts (title, url, summary, birth_year, death_year) VALUES (?, ?, ?, ?, ?)",
+            batch
+        )
+    written = len(batch)
+    batch.clear()
+    return written
+
+
+def _reader(path):
+    # One read-only connection per thread and index file keeps lookups in the microseconds
+    connections = getattr(_readers, "connections", None)
+    if connections is None:
+        connections = _readers.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = _connect(path, readonly=True)
+    return conn
+
+
+def lookup(name, index_path=None):
+    path = Path(index_path or INDEX_PATH)
+    if not path.exists():
+        return None
+    try:
+        row = _reader(path).execute(
+            "SELECT url, summary, birth_year, death_year FROM abstracts WHERE title = ?",
+            (normalize_title(name),)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    metrics.cache_result("wikipedia_index", row is not None)
+    return row
@@ -1,10 +1,95 @@
+import os
 import re
-import wikipediaapi
+import threading
+import time
+from urllib.parse import quote
+
+import httpx
+
+from . import metrics, wikipedia_index
+from .lookups import LookupUnavailable
+
+USER_AGENT = "ReferentApp/1.0 (referent@app.local)"
+# WIKIPEDIA_REST_URL points lookups at another host, e.g. the load-test stub server
+REST_URL = os.environ.get("WIKIPEDIA_REST_URL", "https://en.wikipedia.org/api/rest_v1").rstrip("/")
+
+# A stuck upstream costs at most CONNECT_TIMEOUT + READ_TIMEOUT per lookup,
+# and after BREAKER_THRESHOLD failures in a row lookups fail immediately for
+# BREAKER_COOLDOWN seconds, so people are saved without a bio for now.
+CONNECT_TIMEOUT = 3.0
+READ_TIMEOUT = 5.0
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+NOT_FOUND = (None, "No Wikipedia page found.", None, None)
+
+
+class CircuitBreaker:
+    """Closed until `threshold` consecutive failures, then open for `cooldown`
+    seconds; after that a single trial call decides whether it closes again."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """False when open; otherwise TRIAL for the one half-open trial call, else True."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_running:
+                return False
+            self.trial_running = True
+            return TRIAL
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def end_trial(self):
+        # A trial that ended without an outcome (cancelled, or an unexpected
+        # error) leaves the breaker half-open for the next caller
+        with self._lock:
+            self.trial_running = False
+
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+
+TRIAL = "trial"
+breaker = CircuitBreaker()
+
+# Each async view runs on its own event loop and an AsyncClient is bound to
+# the loop it was opened on, so every lookup opens its own client; cancelling
+# the view closes it and the connection with it. The TLS context is the
+# expensive part and is shared.
+_ssl_context = httpx.create_ssl_context()
+
+
+def _client():
+    return httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT, "Accept": "application/json"},
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        verify=_ssl_context,
+        follow_redirects=True,
+    )
 
-wiki = wikipediaapi.Wikipedia(
-    language="en",
-    user_agent="ReferentApp/1.0 (referent@app.local)"
-)
 
 def extract_years_from_parenthesis(text):
     # Only examine the first parenthetical group
@@ -24,12 +109,47 @@ def extract_years_from_parenthesis(text):
 
     return None, None
 
-def get_wikipedia_info(name):
-    page = wiki.page(name)
-    if not page.exists():
-        return (None, "No Wikipedia page found.", None, None)
 
-    summary = page.summary
+async def _fetch_summary(name):
+    permit = breaker.allow()
+    if not permit:
+        metrics.inc("referent_external_requests_total", (("service", "wikipedia"), ("outcome", "circuit_open")))
+        raise LookupUnavailable("Wikipedia is unavailable; skipping lookups for now.")
+
+    title = quote(name.replace(" ", "_"), safe="")
+    try:
+        with metrics.external_call("wikipedia") as call:
+            async with _client() as client:
+                response = await client.get(f"{REST_URL}/page/summary/{title}", params={"redirect": "true"})
+            if response.status_code == 404:
+                call["outcome"] = "not_found"
+                breaker.record_success()
+                return None
+            response.raise_for_status()
+            data = response.json()
+    except (httpx.HTTPError, ValueError) as exc:
+        breaker.record_failure()
+        raise LookupUnavailable(str(exc) or exc.__class__.__name__) from exc
+    finally:
+        if permit is TRIAL:
+            breaker.end_trial()
+
+    breaker.record_success()
+    return data
+
+
+async def get_wikipedia_info_async(name):
+    # The offline abstracts index, when present, answers before the network
+    local = wikipedia_index.lookup(name)
+    if local:
+        return local
+
+    data = await _fetch_summary(name)
+    if not data or data.get("type") == "disambiguation":
+        return NOT_FOUND
+
+    summary = (data.get("extract") or "").strip()
+    url = data.get("content_urls", {}).get("desktop", {}).get("page")
     birth_year, death_year = extract_years_from_parenthesis(summary)
 
-    return (page.fullurl, summary, birth_year, death_year)
\ No newline at end of file
+    return (url, summary, birth_year, death_year)
@@ -46,6 +46,16 @@ CREATE TABLE IF NOT EXISTS citations (
     person_id INTEGER NOT NULL,
     book_id INTEGER NOT NULL,
     page_number TEXT,
+    notes TEXT,
+    indirect_citation INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    -- Leading page number ("45" for "45-47", "103" for "103ff"); NULL for labels such as "xii"
+    page_key INTEGER GENERATED ALWAYS AS (
+        CASE WHEN TRIM(page_number) GLOB '[0-9]*' THEN CAST(TRIM(page_number) AS INTEGER) END
+    ) VIRTUAL,
+    -- Copy of books.title, kept by triggers so a person's citations come off an index in title order
+    book_title TEXT,
     FOREIGN KEY (person_id) REFERENCES people (id),
     FOREIGN KEY (book_id) REFERENCES books (id)
 );
@@ -70,7 +80,372 @@ CREATE TABLE IF NOT EXISTS book_contributors (
     role TEXT NOT NULL,
     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
     updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    -- Display order: authors, then translators, then other roles
+    role_rank INTEGER GENERATED ALWAYS AS (
+        CASE role WHEN 'author' THEN 0 WHEN 'translator' THEN 1 ELSE 2 END
+    ) VIRTUAL,
+    -- Copies of people.name and books.title, kept by triggers as sort keys for the indexes below
+    person_name TEXT,
+    book_title TEXT,
     PRIMARY KEY (book_id, person_id, role),
     FOREIGN KEY (book_id) REFERENCES books (id),
     FOREIGN KEY (person_id) REFERENCES people (id)
 );
+
+CREATE INDEX IF NOT EXISTS idx_book_contributors_role_book ON book_contributors (role, book_id);
+
+-- Secondary indexes, one per access path in app/db.py; `flask check-query-plans`
+-- fails if a query stops using them.
+-- Person pages, people-list counts, merges and deletes by person.
+CREATE INDEX IF NOT EXISTS idx_citations_person_book ON citations (person_id, book_id);
+-- Covers a person's citations, by book title and then page.
+CREATE INDEX IF NOT EXISTS idx_citations_person_title
+    ON citations (person_id, book_title, book_id, page_number, indirect_citation, notes);
+-- A book's citations in page order.
+CREATE INDEX IF NOT EXISTS idx_citations_book_page ON citations (book_id, page_key, page_number);
+-- The citation list, newest first.
+CREATE INDEX IF NOT EXISTS idx_citations_updated_at ON citations (updated_at);
+-- Epigraphs of a book or of an author, already in display order.
+CREATE INDEX IF NOT EXISTS idx_epigraphs_book_created ON epigraphs (book_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_epigraphs_author_created ON epigraphs (author_id, created_at);
+-- A person's books as author or translator.
+CREATE INDEX IF NOT EXISTS idx_book_contributors_person_role ON book_contributors (person_id, role);
+-- Contributors of a book, and contributions of a person, already in display order.
+CREATE INDEX IF NOT EXISTS idx_book_contributors_book_order
+    ON book_contributors (book_id, role_rank, person_name COLLATE NOCASE, person_id);
+CREATE INDEX IF NOT EXISTS idx_book_contributors_person_order
+    ON book_contributors (person_id, role_rank, book_title COLLATE NOCASE, book_id);
+-- Lists ordered by name or title, and exact name lookups.
+CREATE INDEX IF NOT EXISTS idx_books_title ON books (title);
+CREATE INDEX IF NOT EXISTS idx_people_name ON people (name);
+-- Case-insensitive lookup in get_or_create_person.
+CREATE INDEX IF NOT EXISTS idx_people_name_lower ON people (LOWER(name));
+-- People of a type or nationality, e.g. when one is deleted.
+CREATE INDEX IF NOT EXISTS idx_people_type ON people (type_id);
+CREATE INDEX IF NOT EXISTS idx_people_nationality ON people (nationality_id);
+
+-- Change feed: one row per insert/update/delete on the catalogue tables.
+-- For book_contributors, row_id is the book and related_id the person.
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    related_id INTEGER,
+    operation TEXT NOT NULL,
+    changed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    -- For edited citations and epigraphs, the book and person the row linked before and after
+    -- ({"book_id": ..., "person_id": ...}), so a move marks the pages on both sides
+    old_values TEXT,
+    new_values TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS books_log_insert AFTER INSERT ON books
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('books', NEW.id, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_log_update AFTER UPDATE ON books
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('books', NEW.id, 'update');
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_log_delete AFTER DELETE ON books
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('books', OLD.id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS people_log_insert AFTER INSERT ON people
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('people', NEW.id, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS people_log_update AFTER UPDATE ON people
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('people', NEW.id, 'update');
+END;
+
+CREATE TRIGGER IF NOT EXISTS people_log_delete AFTER DELETE ON people
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('people', OLD.id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS citations_log_insert AFTER INSERT ON citations
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('citations', NEW.id, 'insert');
+END;
+
+-- Only edits log an update; the sort-key copies below are rewritten without one.
+DROP TRIGGER IF EXISTS citations_log_update;
+DROP TRIGGER IF EXISTS citations_log_edit;
+CREATE TRIGGER IF NOT EXISTS citations_log_edit_values
+AFTER UPDATE OF person_id, book_id, page_number, notes, indirect_citation, created_at, updated_at ON citations
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation, old_values, new_values)
+    VALUES (
+        'citations', NEW.id, 'update',
+        json_object('book_id', OLD.book_id, 'person_id', OLD.person_id),
+        json_object('book_id', NEW.book_id, 'person_id', NEW.person_id)
+    );
+END;
+
+CREATE TRIGGER IF NOT EXISTS citations_log_delete AFTER DELETE ON citations
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('citations', OLD.id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS epigraphs_log_insert AFTER INSERT ON epigraphs
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('epigraphs', NEW.id, 'insert');
+END;
+
+DROP TRIGGER IF EXISTS epigraphs_log_update;
+CREATE TRIGGER IF NOT EXISTS epigraphs_log_edit_values AFTER UPDATE ON epigraphs
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation, old_values, new_values)
+    VALUES (
+        'epigraphs', NEW.id, 'update',
+        json_object('book_id', OLD.book_id, 'person_id', OLD.author_id),
+        json_object('book_id', NEW.book_id, 'person_id', NEW.author_id)
+    );
+END;
+
+CREATE TRIGGER IF NOT EXISTS epigraphs_log_delete AFTER DELETE ON epigraphs
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('epigraphs', OLD.id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS book_contributors_log_insert AFTER INSERT ON book_contributors
+BEGIN
+    INSERT INTO change_log (table_name, row_id, related_id, operation)
+    VALUES ('book_contributors', NEW.book_id, NEW.person_id, 'insert');
+END;
+
+DROP TRIGGER IF EXISTS book_contributors_log_update;
+CREATE TRIGGER IF NOT EXISTS book_contributors_log_edit
+AFTER UPDATE OF book_id, person_id, role, created_at, updated_at ON book_contributors
+BEGIN
+    INSERT INTO change_log (table_name, row_id, related_id, operation)
+    VALUES ('book_contributors', NEW.book_id, NEW.person_id, 'update');
+END;
+
+CREATE TRIGGER IF NOT EXISTS book_contributors_log_delete AFTER DELETE ON book_contributors
+BEGIN
+    INSERT INTO change_log (table_name, row_id, related_id, operation)
+    VALUES ('book_contributors', OLD.book_id, OLD.person_id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS person_types_log_insert AFTER INSERT ON person_types
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('person_types', NEW.id, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS person_types_log_update AFTER UPDATE ON person_types
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('person_types', NEW.id, 'update');
+END;
+
+CREATE TRIGGER IF NOT EXISTS person_types_log_delete AFTER DELETE ON person_types
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('person_types', OLD.id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS nationalities_log_insert AFTER INSERT ON nationalities
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('nationalities', NEW.id, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS nationalities_log_update AFTER UPDATE ON nationalities
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('nationalities', NEW.id, 'update');
+END;
+
+CREATE TRIGGER IF NOT EXISTS nationalities_log_delete AFTER DELETE ON nationalities
+BEGIN
+    INSERT INTO change_log (table_name, row_id, operation) VALUES ('nationalities', OLD.id, 'delete');
+END;
+
+-- Latest change per table; the read cache in db.py keys results on these.
+CREATE INDEX IF NOT EXISTS idx_change_log_table_seq ON change_log (table_name, seq);
+
+-- Citation rollup for the statistics page, kept current by the triggers below.
+-- One row per (book, person, month cited, direct/indirect).
+CREATE TABLE IF NOT EXISTS citation_stats (
+    book_id INTEGER NOT NULL,
+    person_id INTEGER NOT NULL,
+    month TEXT NOT NULL,
+    indirect_citation INTEGER NOT NULL,
+    citation_count INTEGER NOT NULL,
+    PRIMARY KEY (book_id, person_id, month, indirect_citation)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS citations_stats_insert AFTER INSERT ON citations
+BEGIN
+    INSERT INTO citation_stats (book_id, person_id, month, indirect_citation, citation_count)
+    VALUES (NEW.book_id, NEW.person_id, COALESCE(strftime('%Y-%m', NEW.created_at), 'unknown'), CASE WHEN NEW.indirect_citation THEN 1 ELSE 0 END, 1)
+    ON CONFLICT (book_id, person_id, month, indirect_citation)
+    DO UPDATE SET citation_count = citation_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS citations_stats_delete AFTER DELETE ON citations
+BEGIN
+    UPDATE citation_stats SET citation_count = citation_count - 1
+    WHERE book_id = OLD.book_id
+      AND person_id = OLD.person_id
+      AND month = COALESCE(strftime('%Y-%m', OLD.created_at), 'unknown')
+      AND indirect_citation = CASE WHEN OLD.indirect_citation THEN 1 ELSE 0 END;
+    DELETE FROM citation_stats
+    WHERE book_id = OLD.book_id
+      AND person_id = OLD.person_id
+      AND citation_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS citations_stats_update
+AFTER UPDATE OF book_id, person_id, indirect_citation, created_at ON citations
+BEGIN
+    UPDATE citation_stats SET citation_count = citation_count - 1
+    WHERE book_id = OLD.book_id
+      AND person_id = OLD.person_id
+      AND month = COALESCE(strftime('%Y-%m', OLD.created_at), 'unknown')
+      AND indirect_citation = CASE WHEN OLD.indirect_citation THEN 1 ELSE 0 END;
+    DELETE FROM citation_stats
+    WHERE book_id = OLD.book_id
+      AND person_id = OLD.person_id
+      AND citation_count <= 0;
+    INSERT INTO citation_stats (book_id, person_id, month, indirect_citation, citation_count)
+    VALUES (NEW.book_id, NEW.person_id, COALESCE(strftime('%Y-%m', NEW.created_at), 'unknown'), CASE WHEN NEW.indirect_citation THEN 1 ELSE 0 END, 1)
+    ON CONFLICT (book_id, person_id, month, indirect_citation)
+    DO UPDATE SET citation_count = citation_count + 1;
+END;
+
+-- Covers the per-book index of names: one pass yields each person's pages, grouped by person
+-- and already in page order.
+DROP INDEX IF EXISTS idx_citations_book_person;
+CREATE INDEX IF NOT EXISTS idx_citations_book_person_page ON citations (book_id, person_id, indirect_citation, page_key, page_number);
+
+-- Bumped whenever a book's citations, or the names of people cited in it, change;
+-- cached indexes of names compare against it.
+CREATE TABLE IF NOT EXISTS citation_versions (
+    book_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS citations_version_insert AFTER INSERT ON citations
+BEGIN
+    INSERT INTO citation_versions (book_id, version) VALUES (NEW.book_id, 1)
+    ON CONFLICT (book_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS citations_version_delete AFTER DELETE ON citations
+BEGIN
+    INSERT INTO citation_versions (book_id, version) VALUES (OLD.book_id, 1)
+    ON CONFLICT (book_id) DO UPDATE SET version = version + 1;
+END;
+
+DROP TRIGGER IF EXISTS citations_version_update;
+CREATE TRIGGER IF NOT EXISTS citations_version_edit
+AFTER UPDATE OF person_id, book_id, page_number, indirect_citation ON citations
+BEGIN
+    INSERT INTO citation_versions (book_id, version) VALUES (OLD.book_id, 1)
+    ON CONFLICT (book_id) DO UPDATE SET version = version + 1;
+    INSERT INTO citation_versions (book_id, version) VALUES (NEW.book_id, 1)
+    ON CONFLICT (book_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS people_version_rename AFTER UPDATE OF name ON people
+WHEN NEW.name IS NOT OLD.name
+BEGIN
+    INSERT INTO citation_versions (book_id, version)
+    SELECT DISTINCT book_id, 1 FROM citations WHERE person_id = NEW.id
+    ON CONFLICT (book_id) DO UPDATE SET version = version + 1;
+END;
+
+-- Sort-key copies of book titles and people's names on citations and book_contributors,
+-- filled in after each insert or move and rewritten when a book or person is renamed.
+CREATE TRIGGER IF NOT EXISTS citations_title_insert AFTER INSERT ON citations
+BEGIN
+    UPDATE citations SET book_title = (SELECT title FROM books WHERE id = NEW.book_id) WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS citations_title_move AFTER UPDATE OF book_id ON citations
+WHEN NEW.book_id IS NOT OLD.book_id
+BEGIN
+    UPDATE citations SET book_title = (SELECT title FROM books WHERE id = NEW.book_id) WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS book_contributors_names_insert AFTER INSERT ON book_contributors
+BEGIN
+    UPDATE book_contributors
+    SET person_name = (SELECT name FROM people WHERE id = NEW.person_id),
+        book_title = (SELECT title FROM books WHERE id = NEW.book_id)
+    WHERE book_id = NEW.book_id AND person_id = NEW.person_id AND role = NEW.role;
+END;
+
+CREATE TRIGGER IF NOT EXISTS book_contributors_names_move AFTER UPDATE OF book_id, person_id ON book_contributors
+WHEN NEW.book_id IS NOT OLD.book_id OR NEW.person_id IS NOT OLD.person_id
+BEGIN
+    UPDATE book_contributors
+    SET person_name = (SELECT name FROM people WHERE id = NEW.person_id),
+        book_title = (SELECT title FROM books WHERE id = NEW.book_id)
+    WHERE book_id = NEW.book_id AND person_id = NEW.person_id AND role = NEW.role;
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_title_rename AFTER UPDATE OF title ON books
+WHEN NEW.title IS NOT OLD.title
+BEGIN
+    UPDATE citations SET book_title = NEW.title WHERE book_id = NEW.id;
+    UPDATE book_contributors SET book_title = NEW.title WHERE book_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS people_name_rename AFTER UPDATE OF name ON people
+WHEN NEW.name IS NOT OLD.name
+BEGIN
+    UPDATE book_contributors SET person_name = NEW.name WHERE person_id = NEW.id;
+END;
+
+-- Top-k books sharing cited people with each book, written by `flask refresh-similarities`.
+CREATE TABLE IF NOT EXISTS book_similarities (
+    book_id INTEGER NOT NULL,
+    similar_book_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    shared_people INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    PRIMARY KEY (book_id, similar_book_id)
+) WITHOUT ROWID;
+
+-- Each book's similar books, best first.
+CREATE INDEX IF NOT EXISTS idx_book_similarities_rank
+    ON book_similarities (book_id, score DESC, shared_people DESC, similar_book_id);
+
+-- citation_versions as of the last similarity refresh; books whose version moved since are recomputed.
+CREATE TABLE IF NOT EXISTS similarity_versions (
+    book_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+-- Citations proposed from e-reader highlight exports, awaiting review. Rejected
+-- proposals are kept so re-importing the same file does not propose them again.
+CREATE TABLE IF NOT EXISTS clipping_proposals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id INTEGER NOT NULL,
+    person_id INTEGER NOT NULL,
+    page_number TEXT NOT NULL,
+    excerpt TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (book_id, person_id, page_number),
+    FOREIGN KEY (book_id) REFERENCES books (id),
+    FOREIGN KEY (person_id) REFERENCES people (id)
+);
+
+-- Covers the pending counts per book, which join people to skip proposals for deleted people
+DROP INDEX IF EXISTS idx_clipping_proposals_status_book;
+CREATE INDEX IF NOT EXISTS idx_clipping_proposals_status_book_person ON clipping_proposals (status, book_id, person_id);
+CREATE INDEX IF NOT EXISTS idx_clipping_proposals_person ON clipping_proposals (person_id);
+
+-- One row per maintenance run; the scheduler uses it so only one process runs it per interval.
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TEXT,
+    report TEXT
+);
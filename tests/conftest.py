@@ -0,0 +1,33 @@
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# app.db opens instance/referent.sqlite3 when imported and init_db reads
+# schema.sql, both relative to the working directory, so the tests run from a
+# scratch directory holding a copy of the schema.
+_workdir = Path(tempfile.mkdtemp(prefix="referent-tests-"))
+(_workdir / "instance").mkdir()
+shutil.copy(ROOT / "schema.sql", _workdir / "schema.sql")
+os.chdir(_workdir)
+sys.path.insert(0, str(ROOT))
+
+from app import db, name_index  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Point db.py at a fresh database built from schema.sql."""
+    previous = db.DB_PATH
+    db.DB_PATH = tmp_path / "referent.sqlite3"
+    for cache in db._cache_registry.values():
+        cache["entries"].clear()
+    name_index._cache.clear()
+    db.init_db()
+    yield db.DB_PATH
+    db.DB_PATH = previous
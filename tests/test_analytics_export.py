@@ -0,0 +1,60 @@
+import pyarrow.parquet as pq
+
+from app import analytics_export, db
+
+
+def _set_month(pages, timestamp):
+    with db.write_transaction() as conn:
+        conn.executemany(
+            "UPDATE citations SET updated_at = ? WHERE page_number = ?",
+            [(timestamp, page) for page in pages],
+        )
+
+
+def _partition(output_dir, month):
+    return pq.read_table(analytics_export._partition_dir(output_dir, month) / "part-0.parquet")
+
+
+def test_only_changed_partitions_are_rewritten(database, tmp_path):
+    nationality_id = db.add_nationality("Roman")
+    roman = db.add_person("Seneca", None, None, nationality_id=nationality_id)
+    greek = db.add_person("Plato", None, None)
+    book_id = db.add_book("Letters")
+    db.add_citation(roman, book_id, "1", False)
+    db.add_citation(greek, book_id, "2", False)
+    db.add_citation(greek, book_id, "3", False)
+    january, february = ["1", "2"], ["3"]
+    _set_month(january, "2024-01-15 10:00:00")
+    _set_month(february, "2024-02-15 10:00:00")
+    output_dir = tmp_path / "export"
+
+    first = analytics_export.export_parquet(output_dir)
+    assert first["rewritten"] == {"2024-01": 2, "2024-02": 1}
+    assert analytics_export.export_parquet(output_dir)["rewritten"] == {}
+
+    # Renaming a nationality touches no citation or person timestamp, only the
+    # partitions holding people of that nationality
+    db.update_nationality(nationality_id, "Latin")
+    assert analytics_export.export_parquet(output_dir)["rewritten"] == {"2024-01": 2}
+    assert "Latin" in _partition(output_dir, "2024-01").column("nationality").to_pylist()
+
+    # A citation moving to another month rewrites the partition it joins and
+    # removes the one it leaves empty
+    _set_month(february, "2024-01-20 10:00:00")
+    second = analytics_export.export_parquet(output_dir)
+    assert second["rewritten"] == {"2024-01": 3}
+    assert second["removed"] == ["2024-02"]
+    assert not analytics_export._partition_dir(output_dir, "2024-02").exists()
+    assert _partition(output_dir, "2024-01").num_rows == 3
+
+
+def test_full_export_rewrites_everything(database, tmp_path):
+    person_id = db.add_person("Seneca", None, None)
+    book_id = db.add_book("Letters")
+    db.add_citation(person_id, book_id, "1", False)
+    output_dir = tmp_path / "export"
+
+    analytics_export.export_parquet(output_dir)
+    report = analytics_export.export_parquet(output_dir, full=True)
+    assert sum(report["rewritten"].values()) == 1
+    assert report["dimensions"]["people"] == 1
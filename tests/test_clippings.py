@@ -0,0 +1,99 @@
+import io
+
+from app import clippings, db
+
+EXPORT = """﻿The Republic: Books I-V (Plato; Jowett, Benjamin)
+- Your Highlight on page 12 | Location 180-182 | Added on Monday, 1 January 2024 10:00:00
+
+As Socrates told Glaucon, and Karl Marx later echoed.
+==========
+The Republic: Books I-V (Plato; Jowett, Benjamin)
+- Your Note on page 12 | Added on Monday, 1 January 2024 10:01:00
+
+Socrates again.
+==========
+Unknown Book (Nobody)
+- Your Highlight on Location 40 | Added on Monday, 1 January 2024 10:02:00
+
+Socrates in a book we do not have.
+==========
+The Republic (Plato)
+- Your Highlight on Location 300-301 | Added on Monday, 1 January 2024 10:03:00
+
+Plato has Søren Kierkegaard nowhere in it.
+==========
+"""
+
+
+def _people(*names):
+    return {name: db.add_person(name, None, None) for name in names}
+
+
+def _pending():
+    with db.get_connection() as conn:
+        return sorted(conn.execute(
+            "SELECT book_id, person_id, page_number FROM clipping_proposals WHERE status = 'pending'"
+        ).fetchall())
+
+
+def test_clippings_are_parsed_one_at_a_time():
+    parsed = list(clippings.iter_clippings(io.StringIO(EXPORT)))
+    assert [clipping.kind for clipping in parsed] == ["highlight", "note", "highlight", "highlight"]
+    assert parsed[0].title == "The Republic: Books I-V"
+    assert parsed[0].authors == ("plato", "benjamin jowett")
+    assert (parsed[0].page, parsed[0].location) == ("12", "180-182")
+    assert clippings._page_label(parsed[3]) == "loc. 300-301"
+
+
+def test_automaton_prefers_the_longest_name():
+    automaton = clippings.NameAutomaton([(1, "Karl Marx"), (2, "Marx"), (3, "Plato"), (4, "Søren Kierkegaard")])
+    assert automaton.find("As Karl Marx said") == {1}
+    assert automaton.find("Marx and soren KIERKEGAARD.") == {2, 4}
+    assert automaton.find("Platonic love") == set()
+
+
+def test_import_proposes_people_named_in_matched_books(database):
+    people = _people("Plato", "Socrates", "Karl Marx", "Marx", "Søren Kierkegaard")
+    book_id = db.add_book("The Republic")
+    db.add_book_contributor(book_id, people["Plato"], "author")
+
+    summary = clippings.import_clippings(io.StringIO(EXPORT))
+    assert summary["clippings"] == 4
+    assert summary["highlights"] == 3
+    assert summary["matched"] == 2
+    assert summary["unmatched_titles"] == [("Unknown Book", 1)]
+    # The book's own author is never proposed as cited in it
+    assert _pending() == sorted([
+        (book_id, people["Socrates"], "12"),
+        (book_id, people["Karl Marx"], "12"),
+        (book_id, people["Søren Kierkegaard"], "loc. 300-301"),
+    ])
+
+    # Importing the same export again adds nothing
+    assert clippings.import_clippings(io.StringIO(EXPORT))["added"] == 0
+
+    assert db.resolve_clipping_proposals(True, book_id=book_id) == 3
+    assert _pending() == []
+    assert len(db.get_citations_by_book(book_id)) == 3
+
+
+def test_merge_people_carries_proposals_over(database):
+    people = _people("Socrates", "Sokrates", "Plato")
+    book_id = db.add_book("The Republic")
+    db.add_clipping_proposals([
+        (book_id, people["Socrates"], "12", "first"),
+        (book_id, people["Sokrates"], "12", "duplicate"),
+        (book_id, people["Sokrates"], "40", "second"),
+        (book_id, people["Plato"], "40", "untouched"),
+    ])
+
+    moved = db.merge_people([(people["Socrates"], [people["Sokrates"]])])
+    assert moved["clipping_proposals"] == 1
+    # The duplicate on page 12 is dropped rather than left pointing at a deleted person
+    assert _pending() == sorted([
+        (book_id, people["Socrates"], "12"),
+        (book_id, people["Socrates"], "40"),
+        (book_id, people["Plato"], "40"),
+    ])
+    _, _, proposals = db.get_clipping_review(book_id)
+    assert sorted(proposal.excerpt for proposal in proposals) == ["first", "second", "untouched"]
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import lookups
+
+
+@pytest.fixture
+def slots(monkeypatch):
+    monkeypatch.setattr(lookups, "_lookup_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(lookups, "_preview_slots", threading.BoundedSemaphore(1))
+    return lookups
+
+
+def _free(semaphore):
+    if not semaphore.acquire(blocking=False):
+        return False
+    semaphore.release()
+    return True
+
+
+async def _value(value, delay=0.0):
+    await asyncio.sleep(delay)
+    return value
+
+
+def test_newer_preview_cancels_the_older_one(slots, monkeypatch):
+    # The newer preview starts before the cancelled one hands its slot back
+    monkeypatch.setattr(lookups, "_preview_slots", threading.BoundedSemaphore(2))
+    started = threading.Event()
+    results = {}
+
+    async def slow():
+        started.set()
+        return await _value("old", delay=5)
+
+    def first():
+        began = time.monotonic()
+        try:
+            results["first"] = asyncio.run(lookups.run_preview("client", lookups.run_lookup(slow(), preview=True)))
+        except lookups.LookupSuperseded:
+            results["first"] = "superseded"
+        results["first seconds"] = time.monotonic() - began
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    assert started.wait(2)
+    results["second"] = asyncio.run(lookups.run_preview("client", lookups.run_lookup(_value("new"), preview=True)))
+    thread.join(2)
+
+    assert (results["first"], results["second"]) == ("superseded", "new")
+    # Cancelled on its own event loop, not left running until the timeout
+    assert results["first seconds"] < 1
+    assert lookups._preview_slots.acquire(blocking=False) and lookups._preview_slots.acquire(blocking=False)
+    assert lookups._active_previews == {}
+
+
+def test_preview_gives_up_at_once_when_slots_are_full(slots):
+    lookups._preview_slots.acquire()
+    try:
+        began = time.monotonic()
+        with pytest.raises(lookups.LookupUnavailable):
+            asyncio.run(lookups.run_lookup(_value("x"), preview=True))
+        assert time.monotonic() - began < 0.5
+        # Saves have their own slots
+        assert asyncio.run(lookups.run_lookup(_value("saved"))) == "saved"
+    finally:
+        lookups._preview_slots.release()
+
+
+def test_save_waits_for_a_slot(slots, monkeypatch):
+    lookups._lookup_slots.acquire()
+    threading.Timer(0.2, lookups._lookup_slots.release).start()
+    assert asyncio.run(lookups.run_lookup(_value("saved"))) == "saved"
+
+    monkeypatch.setattr(lookups, "SLOT_WAIT", 0.1)
+    lookups._lookup_slots.acquire()
+    try:
+        with pytest.raises(lookups.LookupUnavailable):
+            asyncio.run(lookups.run_lookup(_value("late")))
+    finally:
+        lookups._lookup_slots.release()
+
+
+def test_timeout_releases_the_slot(slots):
+    with pytest.raises(lookups.LookupUnavailable):
+        asyncio.run(lookups.run_lookup(_value("slow", delay=5), timeout=0.05))
+    assert _free(lookups._lookup_slots)
@@ -0,0 +1,59 @@
+import sqlite3
+
+from app import create_app, db, maintenance
+
+
+def _pragma(name):
+    with db.get_connection() as conn:
+        return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def test_vacuum_converts_an_older_database_only_when_asked(tmp_path, monkeypatch):
+    # Created before incremental auto_vacuum: tables exist, so the pragma no longer applies
+    path = tmp_path / "referent.sqlite3"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE books (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL)")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.init_db()
+
+    report = maintenance.run_maintenance(["vacuum"])
+    assert report[0]["detail"].startswith("skipped")
+    assert _pragma("auto_vacuum") == 0
+
+    report = maintenance.run_maintenance(["vacuum"], convert=True)
+    assert report[0]["detail"].startswith("VACUUM")
+    assert _pragma("auto_vacuum") == 2
+
+    # From then on each run is an incremental vacuum
+    assert maintenance.run_maintenance(["vacuum"])[0]["detail"].startswith("incremental_vacuum")
+
+
+def test_orphans_are_purged_in_batches(database):
+    book_id = db.add_book("Book")
+    person_id = db.add_person("Person", None, None)
+    db.add_citation(person_id, book_id, "1", False)
+    with db.write_transaction() as conn:
+        conn.executemany(
+            "INSERT INTO citations (person_id, book_id, page_number) VALUES (?, ?, ?)",
+            [(person_id + 100, book_id, str(page)) for page in range(5)],
+        )
+
+    assert dict(maintenance.find_orphans())["citations without a person"] == 5
+    assert dict(maintenance.purge_orphans(batch_size=2))["citations without a person"] == 5
+    assert len(db.get_citations_by_book(book_id)) == 1
+
+
+def test_scheduler_starts_with_the_first_request_only(database, monkeypatch):
+    started = []
+    monkeypatch.setenv("MAINTENANCE_INTERVAL_HOURS", "24")
+    monkeypatch.setattr(maintenance, "start_scheduler", lambda interval, logger=None: started.append(interval))
+
+    app = create_app()
+    result = app.test_cli_runner().invoke(args=["maintenance", "--step", "check"])
+    assert result.exit_code == 0, result.output
+    assert started == []
+
+    client = app.test_client()
+    client.get("/")
+    client.get("/books")
+    assert started == [24 * 3600]
@@ -0,0 +1,35 @@
+import json
+import os
+
+from app import metrics
+
+
+def test_reused_pid_keeps_the_exited_workers_totals(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    name = "referent_test_events_total"
+    # An exited worker that had this process's pid
+    exited = {
+        "pid": os.getpid(),
+        "started": 1,
+        "counters": [[name, [], 5.0]],
+        "gauges": [["referent_db_connections_open", [], 3.0]],
+        "histograms": [],
+    }
+    (tmp_path / f"metrics-{os.getpid()}-1.json").write_text(json.dumps(exited))
+
+    before = _value(metrics.render(), name)
+    metrics.inc(name)
+    metrics.flush()
+
+    assert (tmp_path / f"metrics-{os.getpid()}-1.json").exists()
+    assert _value(metrics.render(), name) == before + 1
+    assert before >= 5
+    snapshots = {data["started"]: data for data in metrics._snapshots()}
+    assert snapshots[1]["gauges"] == []
+
+
+def _value(text, name):
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+    return 0.0
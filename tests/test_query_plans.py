@@ -0,0 +1,56 @@
+import pytest
+
+from app import db, query_plans
+
+
+@pytest.fixture(scope="module")
+def scratch(tmp_path_factory):
+    previous = db.DB_PATH
+    query_plans.populate(tmp_path_factory.mktemp("query-plans") / "referent.sqlite3")
+    yield
+    db.DB_PATH = previous
+
+
+# Checks run in CHECKS order on one database, as `flask check-query-plans` runs them
+@pytest.mark.parametrize("check", query_plans.CHECKS, ids=lambda check: check.label)
+def test_query_plan(scratch, check):
+    for _, statements in query_plans.run_checks([check]):
+        assert statements
+        problems = {sql: plan for sql, plan, problems in statements if problems}
+        assert problems == {}
+
+
+def test_page_checks_need_no_sort():
+    # The book and person pages read every list off an index in display order
+    checks = {check.label: check for check in query_plans.CHECKS}
+    for label in ("book page", "person page", "citations by person", "book", "book contributors"):
+        assert not checks[label].sorts
+
+
+def test_page_orders(database):
+    book_id = db.add_book("B")
+    other_id = db.add_book("A")
+    person_id = db.add_person("Person", None, None)
+    for page in ("100", "20", "xii", "3"):
+        db.add_citation(person_id, book_id, page, False)
+    db.add_citation(person_id, other_id, "7", False)
+
+    assert [row.page_number for row in db.get_citations_by_book(book_id)] == ["xii", "3", "20", "100"]
+    assert [row.book_title for row in db.get_citations_by_person(person_id)] == ["A", "B", "B", "B", "B"]
+
+    db.update_book(other_id, "C", None, None, False)
+    assert [row.book_title for row in db.get_citations_by_person(person_id)] == ["B", "B", "B", "B", "C"]
+
+
+def test_contributor_orders(database):
+    book_id = db.add_book("Book")
+    translator = db.add_person("Zed", None, None)
+    author = db.add_person("bob", None, None)
+    other_author = db.add_person("Al", None, None)
+    for person_id, role in ((translator, "translator"), (author, "author"), (other_author, "author")):
+        db.add_book_contributor(book_id, person_id, role)
+
+    assert [name for _, _, name in db.get_book_contributors(book_id)] == ["Al", "bob", "Zed"]
+
+    db.update_person(other_author, "Zz", None, None, None, None, None)
+    assert [name for _, _, name in db.get_book_contributors(book_id)] == ["bob", "Zz", "Zed"]
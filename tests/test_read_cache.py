@@ -0,0 +1,39 @@
+import pytest
+
+from app import db
+
+
+def test_cached_books_cannot_be_changed_by_a_caller(database):
+    book_id = db.add_book("Book")
+    author_id = db.add_person("Author", None, None)
+    db.add_book_contributor(book_id, author_id, "author")
+
+    first = db.get_books()
+    first.append("extra")
+    with pytest.raises(AttributeError):
+        first[0].authors.append("extra")
+
+    second = db.get_books()
+    assert len(second) == 1
+    assert [author.name for author in second[0].authors] == ["Author"]
+    assert db._cache_registry["get_books"]["hits"] >= 1
+
+
+def test_cached_statistics_are_frozen(database):
+    book_id = db.add_book("Book")
+    person_id = db.add_person("Person", None, None)
+    db.add_citation(person_id, book_id, "1", False)
+
+    stats = db.get_citation_statistics()
+    stats["total"] = -1
+    with pytest.raises(AttributeError):
+        stats["by_book"].append(None)
+
+    assert db.get_citation_statistics()["total"] == 1
+
+
+def test_cache_misses_after_a_write(database):
+    db.add_book("First")
+    assert len(db.get_books()) == 1
+    db.add_book("Second")
+    assert len(db.get_books()) == 2
@@ -0,0 +1,50 @@
+from app import db, similarity
+
+
+def _similarities():
+    with db.get_connection() as conn:
+        return conn.execute(
+            "SELECT book_id, similar_book_id, round(score, 6), shared_people FROM book_similarities ORDER BY 1, 2"
+        ).fetchall()
+
+
+def _cite(book_id, person_ids):
+    for page, person_id in enumerate(person_ids, 1):
+        db.add_citation(person_id, book_id, str(page), False)
+
+
+def test_incremental_refresh_matches_a_full_one(database):
+    people = [db.add_person(f"Person {n}", None, None) for n in range(6)]
+    books = [db.add_book(f"Book {n}") for n in range(4)]
+    _cite(books[0], people[0:3])
+    _cite(books[1], people[1:4])
+    _cite(books[2], people[4:5])
+    _cite(books[3], people[5:6])
+
+    assert similarity.refresh(full=True)["books"] == 4
+    assert [row[:2] for row in _similarities()] == [(books[0], books[1]), (books[1], books[0])]
+    assert similarity.refresh() == {"books": 0, "pairs": 0, "changed": 0}
+
+    # Book 3 now shares a person with book 2: only those two are recomputed
+    db.add_citation(people[4], books[3], "9", False)
+    report = similarity.refresh()
+    assert (report["changed"], report["books"]) == (1, 2)
+    incremental = _similarities()
+    similarity.refresh(full=True)
+    assert incremental == _similarities()
+    assert db.get_similar_books(books[3])[0].id == books[2]
+
+
+def test_books_listing_a_changed_book_are_recomputed(database):
+    people = [db.add_person(f"Person {n}", None, None) for n in range(3)]
+    books = [db.add_book(f"Book {n}") for n in range(2)]
+    _cite(books[0], people[:2])
+    _cite(books[1], people[:1])
+    similarity.refresh(full=True)
+    assert db.get_similar_books(books[0])[0].id == books[1]
+
+    # Book 1 no longer shares anyone with book 0, yet book 0 listed it
+    with db.write_transaction() as conn:
+        conn.execute("UPDATE citations SET person_id = ? WHERE book_id = ?", (people[2], books[1]))
+    similarity.refresh()
+    assert db.get_similar_books(books[0]) == []
@@ -0,0 +1,57 @@
+import sqlite3
+import time
+
+import pytest
+
+from app import create_app, db, snapshots
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOT_DIR", tmp_path / "snapshots")
+    snapshots.SNAPSHOT_DIR.mkdir()
+    return snapshots.SNAPSHOT_DIR
+
+
+def _snapshot(directory, taken_at):
+    path = directory / f"referent-{int(taken_at * 1e9)}.sqlite3"
+    path.touch()
+    return path
+
+
+def test_prune_keeps_recently_superseded_snapshots(snapshot_dir):
+    now = time.time()
+    old = [_snapshot(snapshot_dir, now - 3000 + n) for n in range(3)]
+    recent = [_snapshot(snapshot_dir, now - 60 + n) for n in range(4)]
+
+    snapshots._prune(now)
+
+    # Superseded long ago: gone. Superseded a minute ago, or among the newest three: kept
+    assert not any(path.exists() for path in old[:-1])
+    assert all(path.exists() for path in old[-1:] + recent)
+
+    snapshots._prune(now + snapshots.RETAIN_SECONDS + 120)
+    assert sorted(snapshot_dir.iterdir()) == recent[-3:]
+
+
+def test_pruned_snapshot_is_not_recreated(database, snapshot_dir):
+    taken = snapshots.take_snapshot(force=True)
+    path = snapshot_dir / taken["file"]
+    path.unlink()
+    with pytest.raises(sqlite3.OperationalError):
+        db._snapshot_connection(path).execute("SELECT 1 FROM books")
+    assert not path.exists()
+
+
+def test_refresher_starts_with_the_first_request(database, monkeypatch):
+    started = []
+    monkeypatch.setenv("SNAPSHOT_INTERVAL", "3600")
+    monkeypatch.setattr(snapshots, "start_refresher", lambda interval, logger=None: started.append(interval))
+
+    app = create_app()
+    assert started == []
+
+    client = app.test_client()
+    client.get("/books")
+    client.get("/books")
+    assert started == [3600.0]
@@ -0,0 +1,34 @@
+from app import create_app, db, maintenance, snapshots, static_site
+
+
+def test_moved_citation_marks_both_books(database):
+    first = db.add_book("First")
+    second = db.add_book("Second")
+    person_id = db.add_person("Person", None, None)
+    other_id = db.add_person("Other", None, None)
+    db.add_citation(person_id, first, "12", False)
+    citation_id = db.get_citations_by_book(first)[0].id
+    since = db.get_changes()[2]
+
+    db.update_citation(citation_id, other_id, second, "12", False, None)
+
+    with db.get_connection() as conn:
+        books, people = static_site._changed_pages(conn.cursor(), since)
+    assert books == {first, second}
+    assert people == {person_id, other_id}
+
+
+def test_export_app_runs_no_background_threads(database, tmp_path, monkeypatch):
+    started = []
+    monkeypatch.setenv("MAINTENANCE_INTERVAL_HOURS", "1")
+    monkeypatch.setenv("SNAPSHOT_INTERVAL", "60")
+    monkeypatch.setattr(maintenance, "start_scheduler", lambda *args: started.append("scheduler"))
+    monkeypatch.setattr(snapshots, "start_refresher", lambda *args: started.append("refresher"))
+    db.add_book("Book")
+
+    summary = static_site.export_site(create_app(background=False), tmp_path / "site", workers=1)
+
+    assert summary["rendered"] > 0
+    assert started == []
+    create_app().test_client().get("/books")
+    assert sorted(started) == ["refresher", "scheduler"]
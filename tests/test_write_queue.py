@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from app import create_app, db
+
+
+def _run_while_holding_writer(writes, hold=0.3):
+    # The first write sleeps inside its transaction, so the others queue behind it and share its commit
+    errors = {}
+    started = threading.Event()
+
+    def first():
+        with db.write_transaction() as conn:
+            conn.execute("INSERT INTO books (title) VALUES ('First')")
+            started.set()
+            time.sleep(hold)
+
+    def run(name, write):
+        try:
+            write()
+        except Exception as exc:
+            errors[name] = exc
+
+    threads = [threading.Thread(target=first)]
+    threads[0].start()
+    started.wait()
+    for name, write in writes.items():
+        threads.append(threading.Thread(target=run, args=(name, write)))
+        threads[-1].start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def _titles():
+    with db.get_connection() as conn:
+        return sorted(row[0] for row in conn.execute("SELECT title FROM books"))
+
+
+def test_queued_writes_share_a_commit(database):
+    before = db.get_write_stats()
+    errors = _run_while_holding_writer({n: (lambda n=n: db.add_book(f"Book {n}")) for n in range(10)})
+    after = db.get_write_stats()
+
+    assert errors == {}
+    assert len(_titles()) == 11
+    assert after["transactions"] - before["transactions"] == 11
+    assert after["commits"] - before["commits"] < 11
+
+
+def test_failed_write_rolls_back_alone(database):
+    def failing():
+        with db.write_transaction() as conn:
+            conn.execute("INSERT INTO books (title) VALUES ('Failed')")
+            raise ValueError("rejected")
+
+    errors = _run_while_holding_writer({
+        "before": lambda: db.add_book("Kept"),
+        "failing": failing,
+        "after": lambda: db.add_book("Also kept"),
+    })
+
+    assert set(errors) == {"failing"}
+    assert _titles() == ["Also kept", "First", "Kept"]
+
+
+def test_writes_are_committed_when_they_return(database):
+    book_ids = []
+    _run_while_holding_writer({n: (lambda: book_ids.append(db.add_book("Book"))) for n in range(3)})
+    # Another connection sees every book whose add_book returned
+    with db.get_connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM books WHERE id IN (%s)" % ",".join("?" * len(book_ids)), book_ids)
+        assert count.fetchone()[0] == 3
+
+
+def test_write_busy_is_a_503(database, monkeypatch):
+    monkeypatch.setattr(db, "WRITE_BUSY_TIMEOUT", 0.1)
+    client = create_app(background=False).test_client()
+    with db._write_lock:
+        response = client.post("/books/add", data={"title": "Busy"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert _titles() == []
+    with pytest.raises(db.WriteBusy):
+        with db._write_lock:
+            db.add_book("Busy")